@@ -0,0 +1,107 @@
+import time
+import random
+
+import pandas as pd
+
+import sheets
+import chat_store
+
+# 相談ページ1回の描画で行うコメント・評価の読み込みを、従来のタブごとの get_all_records と chat_store で比較する。
+# シートはローカルバックエンドを使い、API 1回あたりの遅延を latency 秒で模擬する。
+# 実行方法: cd app && python -m benchmarks.bench_chat_store
+
+
+def make_backend(n, properties, latency):
+    rng = random.Random(0)
+    messages = [chat_store.MESSAGE_HEADER]
+    ratings = [chat_store.RATING_HEADER]
+    for i in range(n):
+        timestamp = f"2024-01-{1 + i // 86400 % 28:02d} {i // 3600 % 24:02d}:{i // 60 % 60:02d}:{i % 60:02d}"
+        property_id = str(rng.randrange(1, properties + 1))
+        messages.append([timestamp, f"user{i % 20}", f"メッセージ{i}", property_id])
+        ratings.append([timestamp, f"user{rng.randrange(20)}", str(rng.randrange(2, 11) / 2), property_id])
+    return sheets.LocalSheetsBackend({chat_store.MESSAGE_SHEET: messages, chat_store.RATING_SHEET: ratings},
+                                     latency=latency)
+
+
+def legacy_render(property_ids):
+    # 従来: タブごとに両シートを全件読み込んで絞り込む
+    chat_sh = sheets.worksheet(chat_store.MESSAGE_SHEET)
+    rating_sh = sheets.worksheet(chat_store.RATING_SHEET)
+    result = {}
+    for property_id in property_ids:
+        ratings = pd.DataFrame(rating_sh.get_all_records())
+        ratings = ratings[ratings['property_id'] == property_id]
+        latest = ratings.sort_values(by='timestamp').drop_duplicates(subset='rater', keep='last')
+        messages = pd.DataFrame(chat_sh.get_all_records())
+        messages = messages[messages['property_id'] == property_id]
+        result[property_id] = (latest, messages)
+    return result
+
+
+def store_render(property_ids, messages, ratings):
+    return {property_id: (ratings.latest_for(property_id), messages.frame_for(property_id))
+            for property_id in property_ids}
+
+
+def same(legacy, store):
+    for property_id, (old_latest, old_messages) in legacy.items():
+        new_latest, new_messages = store[property_id]
+        assert list(old_messages['text']) == list(new_messages['text'])
+        old = old_latest.set_index('rater')['rating'].to_dict()
+        new = new_latest.set_index('rater')['rating'].to_dict()
+        assert old == new, (property_id, old, new)
+
+
+def main(n=20_000, properties=200, tabs=10, renders=5, latency=0.02):
+    property_ids = list(range(1, tabs + 1))
+    client = sheets.set_backend(make_backend(n, properties, latency))
+    chat_sh = client.worksheet(chat_store.MESSAGE_SHEET)
+
+    start = time.perf_counter()
+    for _ in range(renders):
+        legacy_render(property_ids)
+    old_sec = (time.perf_counter() - start) / renders
+    old_calls = client.stats.total_calls() / renders
+
+    messages = chat_store.SheetLog(chat_store.MESSAGE_SHEET, chat_store.MESSAGE_HEADER)
+    ratings = chat_store.RatingLog()
+    store_render(property_ids, messages, ratings)
+    client.stats.reset()
+    start = time.perf_counter()
+    for _ in range(renders):
+        # 描画のたびに新しいコメントが1件届く
+        chat_sh.append_row(["2024-02-01 00:00:00", "user0", "新着", 1])
+        messages.mark_stale()
+        ratings.mark_stale()
+        store = store_render(property_ids, messages, ratings)
+    new_sec = (time.perf_counter() - start) / renders
+    new_calls = client.stats.total_calls() / renders
+    same(legacy_render(property_ids), store)
+
+    # 相談ページと同じく、cursor で増えた分だけを受け取って足していく
+    records, cursor, reloaded = messages.since(1)
+    chat_sh.append_row(["2024-02-02 00:00:00", "user1", "追加", 1])
+    messages.mark_stale()
+    new_records, cursor, reloaded = messages.since(1, cursor)
+    assert not reloaded and [record['text'] for record in new_records] == ["追加"], new_records
+    records.extend(new_records)
+    assert records == messages.records_for(1)
+
+    # 他の物件の行が削除されて行がずれたら全体を読み直し、cursor は使わずに全件を返す
+    values = chat_sh.get_all_values()
+    chat_sh.delete_rows(next(i for i, row in enumerate(values[1:], start=2) if str(row[3]) != "1"))
+    chat_sh.append_row(["2024-02-02 00:00:01", "user1", "ずれた後", 1])
+    messages.mark_stale()
+    new_records, cursor, reloaded = messages.since(1, cursor)
+    assert reloaded and new_records == messages.records_for(1) and new_records[-1]['text'] == "ずれた後"
+    assert messages.since(1, cursor) == ([], cursor, False)
+
+    print(f"{n:,}件 / タブ{tabs}個 / 1描画あたり")
+    print(f"従来方式   : {old_sec:6.2f}秒  シート操作 {old_calls:5.1f}回")
+    print(f"chat_store : {new_sec:6.2f}秒  シート操作 {new_calls:5.1f}回")
+    print(messages.stats(), ratings.stats())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+import time
+import numpy as np
+
+from maps_stub import StubMapsClient
+from commute import CommuteService, CommuteCache, MODES, MODE_NAMES
+
+# 通勤時間の計算を、従来の1件ずつ distance_matrix を呼ぶ方法と CommuteService で比較するベンチマーク。
+# 実行方法: cd app && python -m benchmarks.bench_commute
+
+
+def sequential(client, origin, destinations):
+    # 従来の calculate_distance_and_time と同じ呼び出し方（地図と一覧で2回）
+    results = {}
+    for _ in range(2):
+        for property_id, coords in destinations.items():
+            results[property_id] = (None, None, None)
+            for mode in MODES:
+                element = client.distance_matrix(origin, coords, mode=mode)["rows"][0]["elements"][0]
+                if "distance" in element:
+                    results[property_id] = (element["distance"]["text"], element["duration"]["text"], MODE_NAMES[mode])
+                    break
+    return results
+
+
+def main(n=50, latency=0.05):
+    rng = np.random.default_rng(0)
+    origin = (35.681, 139.767)
+    destinations = {i: (float(lat), float(lng)) for i, (lat, lng)
+                    in enumerate(zip(rng.uniform(35.6, 35.8, n), rng.uniform(139.6, 139.9, n)))}
+
+    client = StubMapsClient(latency=latency, unavailable_modes=["transit"])
+    start = time.perf_counter()
+    expected = sequential(client, origin, destinations)
+    print(f"従来方式     : {time.perf_counter() - start:6.2f}秒  API呼び出し {client.calls['distance_matrix']}回")
+
+    client = StubMapsClient(latency=latency, unavailable_modes=["transit"])
+    service = CommuteService(client, CommuteCache())
+    start = time.perf_counter()
+    actual = service.lookup(origin, destinations)
+    print(f"初回         : {time.perf_counter() - start:6.2f}秒  API呼び出し {client.calls['distance_matrix']}回")
+    start = time.perf_counter()
+    service.lookup(origin, destinations)
+    print(f"キャッシュ後 : {time.perf_counter() - start:6.2f}秒  API呼び出し {client.calls['distance_matrix']}回")
+    assert actual == expected
+    print(service.stats())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+import time
+
+import numpy as np
+
+import sheets
+import frame_cache
+import property_details
+from benchmarks.bench_property_store import make_properties
+
+# 相談ページ1回の描画で行う物件詳細の取得を、従来の方法と property_details で比較する。
+# シート操作の回数は sheets のレイテンシ集計から数える。
+# 実行方法: cd app && python -m benchmarks.bench_consultation
+
+
+def legacy_render(favorite_ids):
+    # 従来: お気に入りごとに load_property_details、さらに save_message でもう1回
+    property_sh = sheets.worksheet('物件DB')
+
+    def load_property_details(property_id):
+        for record in property_sh.get_all_records():
+            if record['property_id'] == property_id:
+                return record
+        return None
+
+    properties = [load_property_details(property_id) for property_id in favorite_ids]
+    load_property_details(favorite_ids[0])
+    return properties
+
+
+def indexed_render(favorite_ids):
+    properties = list(property_details.get_many(favorite_ids).values())
+    property_details.get(favorite_ids[0])
+    return properties
+
+
+def measure(render, favorite_ids, renders):
+    stats = sheets.get_client().stats
+    stats.reset()
+    start = time.perf_counter()
+    for _ in range(renders):
+        result = render(favorite_ids)
+    return stats.total_calls() / renders, (time.perf_counter() - start) / renders, result
+
+
+def main(listings=5_000, favorites=20, renders=3, latency=0.05):
+    properties = make_properties(listings)
+    sheets.set_backend(sheets.LocalSheetsBackend(
+        {"物件DB": [list(properties.columns)] + properties.astype(str).values.tolist()}, latency=latency))
+    frame_cache._cache = frame_cache.FrameCache(version_reader=None)
+    favorite_ids = [int(i) for i in np.random.default_rng(0).choice(listings, favorites, replace=False) + 1]
+
+    calls, sec, expected = measure(legacy_render, favorite_ids, renders)
+    print(f"従来       : 1描画あたり シート操作 {calls:5.1f}回  {sec:6.2f}秒")
+    calls, sec, actual = measure(indexed_render, favorite_ids, 1)
+    print(f"索引(初回) : 1描画あたり シート操作 {calls:5.1f}回  {sec:6.2f}秒")
+    calls, sec, actual = measure(indexed_render, favorite_ids, renders)
+    print(f"索引(2回目): 1描画あたり シート操作 {calls:5.1f}回  {sec:6.2f}秒")
+    assert [record['property_id'] for record in actual] == [record['property_id'] for record in expected]
+
+
+if __name__ == "__main__":
+    main()
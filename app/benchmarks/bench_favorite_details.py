@@ -0,0 +1,62 @@
+import time
+
+import numpy as np
+import pandas as pd
+
+import sheets
+import frame_cache
+import favorites
+from benchmarks.bench_property_store import make_properties
+
+# ユーザーのお気に入り物件の詳細取得を、従来の全件走査と索引による結合で比較する。
+# 実行方法: cd app && python -m benchmarks.bench_favorite_details
+
+
+def legacy_favorite_details(username):
+    # 従来の get_favorite_properties + 物件ごとの df[df['property_id'] == property_id]
+    df = sheets.load_frame("物件DB")
+    records = sheets.worksheet("お気に入りDB").get_all_records()
+    fav_df = pd.DataFrame(records)
+    rows = []
+    for property_id in fav_df[fav_df['username'] == username]['property_id'].tolist():
+        property_data = df[df['property_id'] == property_id]
+        if not property_data.empty:
+            rows.append(property_data)
+    return pd.concat(rows) if rows else df.iloc[0:0]
+
+
+def run(users, listings, per_user=20, repeat=20):
+    rng = np.random.default_rng(0)
+    properties = make_properties(listings)
+    favorites_rows = [["username", "property_id"]] + [
+        [f"user{u}", str(int(pid))] for u in range(users) for pid in rng.choice(listings, per_user, replace=False) + 1
+    ]
+    sheets.set_backend(sheets.LocalSheetsBackend({
+        "物件DB": [list(properties.columns)] + properties.astype(str).values.tolist(),
+        "お気に入りDB": favorites_rows,
+    }))
+    frame_cache._cache = frame_cache.FrameCache(version_reader=None)
+    favorites._repository = None
+
+    targets = [f"user{u}" for u in rng.integers(0, users, repeat)]
+    start = time.perf_counter()
+    for username in targets[:3]:
+        legacy_favorite_details(username)
+    legacy_sec = (time.perf_counter() - start) / 3
+
+    favorites.favorite_properties(targets[0])
+    start = time.perf_counter()
+    for username in targets:
+        actual = favorites.favorite_properties(username)
+    indexed_sec = (time.perf_counter() - start) / repeat
+    assert sorted(actual['property_id']) == sorted(legacy_favorite_details(targets[-1])['property_id'])
+    print(f"ユーザー {users:>6,}  物件 {listings:>7,}  従来 {legacy_sec * 1000:9.1f}ms  索引 {indexed_sec * 1000:6.2f}ms")
+
+
+def main():
+    for users, listings in [(100, 10_000), (1_000, 10_000), (1_000, 100_000), (5_000, 100_000)]:
+        run(users, listings)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+import time
+
+import pandas as pd
+
+import sheets
+from favorites import FavoritesRepository, HEADER
+
+# お気に入り解除を、従来の「全件読み込み→clear→1行ずつ append_row」と FavoritesRepository で比較する。
+# シートはローカルバックエンドを使い、API 1回あたりの遅延を latency 秒で模擬する。
+# 実行方法: cd app && python -m benchmarks.bench_favorites
+
+
+def make_backend(n, latency):
+    rows = [HEADER] + [[f"user{i % 500}", str(i)] for i in range(n)]
+    return sheets.LocalSheetsBackend({"お気に入りDB": rows}, latency=latency)
+
+
+def remove_favorite_property(username, property_id):
+    # 従来の実装
+    sheet = sheets.worksheet("お気に入りDB")
+    records = sheet.get_all_records()
+    fav_df = pd.DataFrame(records)
+    fav_df = fav_df[(fav_df['username'] != username) | (fav_df['property_id'] != property_id)]
+    sheet.clear()
+    sheet.append_row(["username", "property_id"])
+    for index, row in fav_df.iterrows():
+        sheet.append_row([row['username'], row['property_id']])
+
+
+def main(n=10_000, latency=0.0005, removals=3):
+    targets = [(f"user{i % 500}", i) for i in range(1, removals + 1)]
+
+    client = sheets.set_backend(make_backend(n, latency))
+    start = time.perf_counter()
+    for username, property_id in targets:
+        remove_favorite_property(username, property_id)
+    old_sec = time.perf_counter() - start
+    old_calls = client.stats.total_calls()
+    old_rows = client.worksheet("お気に入りDB").get_all_values()
+
+    client = sheets.set_backend(make_backend(n, latency))
+    repository = FavoritesRepository()
+    repository.list("user0")
+    client.stats.reset()
+    start = time.perf_counter()
+    for username, property_id in targets:
+        assert repository.remove(username, property_id)
+        assert not repository.remove(username, property_id)
+    assert not repository.add("user2", 2 + 500)
+    new_sec = time.perf_counter() - start
+    new_calls = client.stats.total_calls()
+    new_rows = client.worksheet("お気に入りDB").get_all_values()
+
+    assert [[str(v) for v in row] for row in old_rows] == [[str(v) for v in row] for row in new_rows]
+    print(f"{n:,}件から{removals}件解除")
+    print(f"従来方式   : {old_sec:7.2f}秒  シート操作 {old_calls:,}回")
+    print(f"リポジトリ : {new_sec:7.2f}秒  シート操作 {new_calls:,}回")
+
+
+if __name__ == "__main__":
+    main()
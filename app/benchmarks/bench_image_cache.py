@@ -0,0 +1,91 @@
+import io
+import time
+import tempfile
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import requests
+from PIL import Image
+
+from image_cache import ImageCache
+
+# ローカルの HTTP サーバーを画像配信元の代わりに使い、毎回ダウンロードする場合と ImageCache を比較する。
+# 実行方法: cd app && python -m benchmarks.bench_image_cache
+
+
+def make_image(seed, size=(1600, 1200)):
+    image = Image.new("RGB", size, ((seed * 37) % 256, (seed * 91) % 256, (seed * 53) % 256))
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
+
+
+class ImageHandler(BaseHTTPRequestHandler):
+    images = {}
+    latency = 0.05
+
+    def do_GET(self):
+        time.sleep(self.latency)
+        data = self.images.get(self.path)
+        if data is None:
+            self.send_response(404)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "image/jpeg")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+def main(n=40, reruns=3):
+    ImageHandler.images = {f"/img/{i}.jpg": make_image(i) for i in range(n)}
+    server = ThreadingHTTPServer(("127.0.0.1", 0), ImageHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    urls = [base + path for path in ImageHandler.images]
+
+    session = requests.Session()
+    start = time.perf_counter()
+    downloaded = 0
+    for _ in range(reruns):
+        for url in urls:
+            downloaded += len(session.get(url).content)
+    print(f"毎回ダウンロード: {time.perf_counter() - start:6.2f}秒  {downloaded / 2**20:6.1f}MB")
+
+    with tempfile.TemporaryDirectory() as directory:
+        cache = ImageCache(directory)
+        start = time.perf_counter()
+        for future in cache.prefetch(urls):
+            future.result()
+        print(f"事前取得        : {time.perf_counter() - start:6.2f}秒")
+        start = time.perf_counter()
+        for _ in range(reruns):
+            for url in urls:
+                assert cache.thumbnail(url) != url
+        print(f"キャッシュ      : {time.perf_counter() - start:6.2f}秒  {cache.stats()}")
+        assert cache.thumbnail(base + "/missing.jpg").endswith("missing.jpg")
+        # 失敗した URL は事前取得でもしばらく取りに行かない
+        assert cache.prefetch([base + "/missing.jpg"]) == []
+        cache.flush()
+
+    with tempfile.TemporaryDirectory() as directory:
+        # 10枚ほどしか入らないキャッシュでは、事前取得はその枚数までに抑え、追い出しは上限の手前で止まる
+        cache = ImageCache(directory, max_bytes=10 * 5 * 1024)
+        for url in urls[:2]:
+            cache.thumbnail(url)
+        futures = cache.prefetch(urls[2:])
+        for future in futures:
+            future.result()
+        stats = cache.stats()
+        print(f"小さいキャッシュ: 事前取得 {len(futures)}件  {stats}")
+        assert len(futures) < len(urls) - 2
+        assert stats["bytes"] <= cache.max_bytes
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
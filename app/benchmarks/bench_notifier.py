@@ -0,0 +1,90 @@
+import os
+import re
+import time
+import tempfile
+import threading
+from urllib.parse import parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import requests
+
+from notifier import Notifier, format_message
+
+# ローカルの HTTP サーバーを LINE Notify の代わりに使い、同期送信と Notifier を比較する。
+# サーバーは最初の数回を 500 / 429 で失敗させ、再送とまとめ送信が正しく働くかも確かめる。
+# 実行方法: cd app && python -m benchmarks.bench_notifier
+
+
+class NotifyHandler(BaseHTTPRequestHandler):
+    latency = 0.3
+    failures = []
+    received = []
+    lock = threading.Lock()
+
+    def do_POST(self):
+        time.sleep(self.latency)
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0))).decode()
+        with self.lock:
+            status = self.failures.pop(0) if self.failures else 200
+            if status == 200:
+                self.received.append(parse_qs(body)["message"][0])
+        self.send_response(status)
+        if status == 429:
+            self.send_header("Retry-After", "1")
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+def main(messages=30, properties=3):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), NotifyHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/api/notify"
+    posts = [(f"user{i % 4}", f"メッセージ{i}", i % properties, f"物件{i % properties}") for i in range(messages)]
+
+    # 従来: 送信のたびに画面の処理が応答を待つ
+    start = time.perf_counter()
+    for sender, text, _, property_name in posts:
+        requests.post(url, headers={"Authorization": "Bearer t"},
+                      data={"message": format_message(property_name, [(sender, text)])})
+    old_sec = time.perf_counter() - start
+    NotifyHandler.received.clear()
+
+    NotifyHandler.failures = [500, 429]
+    notifier = Notifier("t", url=url, coalesce_sec=0.5, min_interval=0.2, backoff_sec=0.5)
+    start = time.perf_counter()
+    for sender, text, property_id, property_name in posts:
+        notifier.enqueue(sender, text, property_id, property_name)
+    new_sec = time.perf_counter() - start
+    assert notifier.flush(timeout=30)
+    delivered_sec = time.perf_counter() - start
+    notifier.stop()
+
+    # まとめた通知に全メッセージがちょうど1回ずつ含まれる
+    found = re.findall(r"メッセージ\d+", "\n".join(NotifyHandler.received))
+    assert sorted(found) == sorted(text for _, text, _, _ in posts), found
+    stats = notifier.stats()
+    assert stats["delivered"] == messages and stats["retries"] == 2, stats
+
+    print(f"{messages}件のメッセージ / 通知先の応答 {NotifyHandler.latency}秒")
+    print(f"同期送信 : 画面の待ち {old_sec:6.2f}秒  通知 {messages}回")
+    print(f"Notifier : 画面の待ち {new_sec:6.3f}秒  通知 {len(NotifyHandler.received)}回  全件配送まで {delivered_sec:5.2f}秒")
+    print(stats)
+
+    # 送信前に止めても、同じ送信箱を開いた次のプロセスが送る
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "outbox.sqlite3")
+        stopped = Notifier("t", url=url, outbox_path=path, coalesce_sec=60)
+        stopped.enqueue("user0", "再起動前", 0, "物件0")
+        stopped.stop()
+        restarted = Notifier("t", url=url, outbox_path=path, coalesce_sec=60)
+        restarted._db.execute("UPDATE outbox SET next_attempt = 0")
+        restarted.start()
+        assert restarted.flush(timeout=10) and "再起動前" in NotifyHandler.received[-1]
+        restarted.stop()
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
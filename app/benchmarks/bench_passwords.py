@@ -0,0 +1,56 @@
+import time
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+
+import sheets
+import passwords
+from users import UserDirectory, HEADER, SHEET_NAME
+
+# パスワードの検証コストと、従来の SHA-256 からの移行を確かめる。
+# ハッシュ計算は GIL を手放すので、あるセッションが検証している間も他のセッションの描画が止まらないことも測る。
+# 実行方法: cd app && python -m benchmarks.bench_passwords
+
+
+def main(users=50, logins=8, target_ms=100):
+    profile = passwords.calibrate("scrypt", target_ms)
+    hasher = passwords.PasswordHasher(passwords.hasher_from_profile(profile))
+    passwords._hasher = hasher
+    print(f"作業量: {profile}")
+
+    encoded = hasher.hash("secret")
+    start = time.perf_counter()
+    assert hasher.verify("secret", encoded) and not hasher.verify("wrong", encoded)
+    print(f"検証1回: {(time.perf_counter() - start) / 2 * 1000:6.1f}ms")
+
+    # 検証中も他の描画(ここでは 5ms ごとの処理)が止まらないか、処理の間隔の最大値を測る
+    # Streamlit はセッションごとのスレッドでスクリプトを実行するので、ログインもそれぞれのスレッドで検証する
+    with ThreadPoolExecutor(max_workers=logins) as pool:
+        futures = [pool.submit(hasher.verify, "secret", encoded) for _ in range(logins)]
+        gaps, last = [], time.perf_counter()
+        while not all(future.done() for future in futures):
+            time.sleep(0.005)
+            now = time.perf_counter()
+            gaps.append(now - last)
+            last = now
+    assert all(future.result() for future in futures)
+    print(f"{logins}人同時のログイン中の描画の間隔: 最大 {max(gaps) * 1000:5.1f}ms (ハッシュ{logins}回分 {profile['ms'] * logins:.0f}ms)")
+
+    # 従来の SHA-256 の行はログイン成功時に作り直され、2回目からは新しい形式で検証される
+    rows = [HEADER] + [[f"user{i}", hashlib.sha256(f"pass{i}".encode()).hexdigest()] for i in range(users)]
+    client = sheets.set_backend(sheets.LocalSheetsBackend({SHEET_NAME: rows}))
+    directory = UserDirectory()
+    with ThreadPoolExecutor(max_workers=logins) as pool:
+        results = list(pool.map(lambda i: directory.authenticate(f"user{i}", f"pass{i}"), range(users)))
+    assert all(results) and not directory.authenticate("user0", "wrong")
+    values = client.worksheet(SHEET_NAME).get_all_values()
+    assert all(row[1].startswith("scrypt$") for row in values[1:])
+    assert all(directory.authenticate(f"user{i}", f"pass{i}") for i in range(users))
+    # 作業量を上げたら次のログインで作り直す
+    passwords._hasher = passwords.PasswordHasher(passwords.ScryptHasher(n=hasher.hasher.n * 2))
+    assert directory.authenticate("user0", "pass0")
+    assert client.worksheet(SHEET_NAME).row_values(2)[1].startswith(f"scrypt${hasher.hasher.n * 2}$")
+    print(f"移行: {directory.stats()}")
+
+
+if __name__ == "__main__":
+    main()
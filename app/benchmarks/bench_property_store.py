@@ -0,0 +1,72 @@
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+from property_store import PropertyStore
+
+# 物件検索の絞り込みを、従来の pandas のマスクと PropertyStore で比較するベンチマーク。
+# 実行方法: cd app && python -m benchmarks.bench_property_store [行数 ...]
+
+WARDS = ["千代田区", "中央区", "港区", "新宿区", "文京区", "台東区", "墨田区", "江東区",
+         "品川区", "目黒区", "大田区", "世田谷区", "渋谷区", "中野区", "杉並区", "豊島区",
+         "北区", "荒川区", "板橋区", "練馬区", "足立区", "葛飾区", "江戸川区"]
+LAYOUTS = ["ワンルーム", "1K", "1DK", "1LDK", "2K", "2DK", "2LDK", "3LDK"]
+
+
+def make_properties(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "property_id": np.arange(1, n + 1),
+        "名称": [f"物件{i}" for i in range(n)],
+        "区": rng.choice(WARDS, n),
+        "間取り": rng.choice(LAYOUTS, n),
+        "家賃": np.round(rng.uniform(3, 50, n), 1),
+        "緯度": rng.uniform(35.5, 35.8, n),
+        "経度": rng.uniform(139.5, 139.9, n),
+    })
+
+
+def pandas_query(df, area, type_options, price_min, price_max):
+    filtered_df = df[(df['区'].isin([area])) & (df['間取り'].isin(type_options))]
+    return filtered_df[(filtered_df['家賃'] >= price_min) & (filtered_df['家賃'] <= price_max)]
+
+
+def timeit(func, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func()
+    return (time.perf_counter() - start) / repeat, result
+
+
+def run(n, repeat=20):
+    df = make_properties(n)
+    build_sec, store = timeit(lambda: PropertyStore(df), 1)
+    rng = np.random.default_rng(1)
+    queries = []
+    for _ in range(repeat):
+        price_min = float(rng.integers(1, 20))
+        queries.append((rng.choice(WARDS), ["1K", "1LDK", "2LDK"], price_min, price_min + 10.0))
+
+    pandas_sec, _ = timeit(lambda: [pandas_query(df, *q) for q in queries], 1)
+    store_sec, _ = timeit(lambda: [store.query(*q) for q in queries], 1)
+    for q in queries:
+        expected = pandas_query(df, *q)
+        actual = store.query(*q)
+        assert expected.index.equals(actual.index), q
+
+    print(f"{n:>9,}行  構築 {build_sec * 1000:8.1f}ms  "
+          f"pandas {pandas_sec / repeat * 1000:7.2f}ms/件  "
+          f"store {store_sec / repeat * 1000:7.2f}ms/件  "
+          f"({pandas_sec / store_sec:5.1f}倍)  "
+          f"メモリ {df.memory_usage(deep=True).sum() / 2**20:7.1f}MB -> 索引込み {store.nbytes / 2**20:7.1f}MB")
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [100_000, 300_000, 1_000_000]
+    for n in sizes:
+        run(n)
+
+
+if __name__ == "__main__":
+    main()
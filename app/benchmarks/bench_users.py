@@ -0,0 +1,76 @@
+import time
+import hashlib
+
+import pandas as pd
+
+import sheets
+from users import UserDirectory, HEADER, SHEET_NAME
+
+# ログインとサインアップを、従来の「get_all_records で全件読み込み→DataFrame で絞り込み」と UserDirectory で比較する。
+# シートはローカルバックエンドを使い、API 1回あたりの遅延を latency 秒で模擬する。
+# 実行方法: cd app && python -m benchmarks.bench_users
+
+
+def make_hashes(password):
+    return hashlib.sha256(str.encode(password)).hexdigest()
+
+
+def make_backend(n, latency):
+    rows = [HEADER] + [[f"user{i}", make_hashes(f"pass{i}")] for i in range(n)]
+    return sheets.LocalSheetsBackend({SHEET_NAME: rows}, latency=latency)
+
+
+def legacy_login(username, password):
+    sheet = sheets.worksheet(SHEET_NAME)
+    if not sheet.get_all_records():
+        sheet.append_row(HEADER)
+    records = sheet.get_all_records()
+    user_df = pd.DataFrame(records)
+    result = user_df[(user_df['username'] == username) & (user_df['password'] == make_hashes(password))]
+    return not result.empty
+
+
+def main(n=100_000, logins=20, latency=0.05):
+    attempts = [(f"user{i * 4999 % n}", f"pass{i * 4999 % n}" if i % 4 else "wrong") for i in range(logins)]
+    expected = [i % 4 != 0 for i in range(logins)]
+
+    client = sheets.set_backend(make_backend(n, latency))
+    start = time.perf_counter()
+    old = [legacy_login(username, password) for username, password in attempts]
+    old_sec = (time.perf_counter() - start) / logins
+    old_calls = client.stats.total_calls() / logins
+    assert old == expected
+
+    client = sheets.set_backend(make_backend(n, latency))
+    directory = UserDirectory()
+    start = time.perf_counter()
+    directory.refresh()
+    load_sec = time.perf_counter() - start
+    client.stats.reset()
+    start = time.perf_counter()
+    # パスワードの検証コストは bench_passwords で測るので、ここでは索引を引くところまでを比べる
+    new = [directory.get_hash(username) == make_hashes(password) for username, password in attempts]
+    new_sec = (time.perf_counter() - start) / logins
+    new_calls = client.stats.total_calls() / logins
+    assert new == expected
+
+    # サインアップ: 重複は断り、新しいユーザーはすぐログインできる
+    start = time.perf_counter()
+    assert not directory.add("user1", "other")
+    assert directory.add("newcomer", "secret")
+    signup_sec = (time.perf_counter() - start) / 2
+    assert directory.authenticate("newcomer", "secret")
+    # 他のプロセスで登録されたユーザーも差分の読み込みで見つかる
+    client.worksheet(SHEET_NAME).append_row(["elsewhere", make_hashes("x")])
+    time.sleep(directory.miss_refresh_interval)
+    assert directory.get_hash("elsewhere") == make_hashes("x")
+
+    print(f"{n:,}ユーザー / ログイン1回あたり")
+    print(f"従来方式        : {old_sec * 1000:8.1f}ms  シート操作 {old_calls:.1f}回")
+    print(f"UserDirectory   : {new_sec * 1000:8.2f}ms  シート操作 {new_calls:.1f}回 (初回読み込み {load_sec:.2f}秒)")
+    print(f"サインアップ    : {signup_sec * 1000:8.1f}ms")
+    print(directory.stats())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+import os
+import json
+import time
+import tempfile
+import threading
+from collections import Counter
+
+import sheets
+import chat_store
+
+# 100人が同時にコメントを投稿したときのスループットを、従来の「見出し確認 + append_row」と
+# chat_store の書き込みバッファで比較する。投稿者が自分のコメントをすぐ読めることと、
+# シートに全件がちょうど1回ずつ書かれることも確かめる。
+# 数値に見える投稿がそのままの文字列で書かれること、書き込めない行があっても後ろの行が書かれること、
+# 一時的な障害が続いても行を捨てないこと、隔離した行が再起動後も残り書き込み直せることも確かめる。
+# 実行方法: cd app && python -m benchmarks.bench_write_behind
+
+HEADER = chat_store.MESSAGE_HEADER
+
+
+def legacy_post(chat_sh, sender, text, property_id):
+    timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
+    if not chat_sh.row_values(1) or chat_sh.row_values(1) != HEADER:
+        chat_sh.insert_row(HEADER, 1)
+    chat_sh.append_row([timestamp, sender, text, property_id])
+
+
+def run_posters(post, posters, posts):
+    def worker(p):
+        for k in range(posts):
+            post(f"user{p}", f"投稿{p}-{k}", p % 10)
+
+    threads = [threading.Thread(target=worker, args=(p,)) for p in range(posters)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - start
+
+
+def written_texts(client):
+    values = client.worksheet(chat_store.MESSAGE_SHEET).get_all_values()
+    assert values[0] == HEADER
+    return Counter(row[2] for row in values[1:])
+
+
+def check_raw_values_and_failures(quarantine_path):
+    backend = sheets.LocalSheetsBackend({chat_store.MESSAGE_SHEET: [HEADER]})
+    sheets.set_backend(backend)
+    local = backend.worksheet(chat_store.MESSAGE_SHEET)
+    append_rows = local.append_rows
+    outage = {"remaining": 0, "reject": True}
+
+    def strict_append_rows(values, **kwargs):
+        # Sheets API と同じく NaN・Infinity を含む JSON は送れない。"reject" は常に失敗する行
+        if outage["remaining"]:
+            outage["remaining"] -= 1
+            raise ConnectionError("unavailable")
+        json.dumps(values, allow_nan=False)
+        if outage["reject"] and any("reject" in row for row in values):
+            raise ValueError("rejected")
+        append_rows(values, **kwargs)
+
+    local.append_rows = strict_append_rows
+    store = chat_store.SheetLog(chat_store.MESSAGE_SHEET, HEADER, flush_interval=60, max_attempts=2,
+                                quarantine_path=quarantine_path)
+    texts = ["007", "0123", "1e3", "nan", "inf"]
+    for text in texts:
+        store.append(["2024-01-01 00:00:00", "user", text, 1])
+    assert store.flush() == len(texts)
+    assert [row[2] for row in local.rows[1:]] == texts, local.rows
+    store.refresh(force=True)
+    assert len(store.records_for(1)) == len(texts)
+
+    store.append(["2024-01-01 00:00:01", "user", "reject", 1])
+    store.append(["2024-01-01 00:00:02", "user", "後の投稿", 1])
+    for _ in range(10):
+        store.flush()
+    assert store.pending() == 0 and store.quarantined() == [["2024-01-01 00:00:01", "user", "reject", 1]]
+    assert local.rows[-1][2] == "後の投稿"
+
+    # 一時的な障害は何回続いても隔離せず、復旧したら書く
+    outage["remaining"] = 20
+    store.append(["2024-01-01 00:00:03", "user", "障害中の投稿", 1])
+    for _ in range(21):
+        store.flush()
+    assert store.pending() == 0 and len(store.quarantined()) == 1
+    assert local.rows[-1][2] == "障害中の投稿"
+
+    # 隔離した行は再起動後も残っていて、書けるようになったら書き込み直せる
+    outage["reject"] = False
+    restarted = chat_store.SheetLog(chat_store.MESSAGE_SHEET, HEADER, flush_interval=60,
+                                    quarantine_path=quarantine_path)
+    assert restarted.replay_quarantined() == 1
+    assert restarted.flush() == 1
+    assert restarted.quarantined() == [] and local.rows[-1][2] == "reject"
+    restarted.refresh(force=True)
+    assert [record["text"] for record in restarted.records_for(1)].count("reject") == 1
+
+
+def main(posters=100, posts=5, latency=0.05):
+    with tempfile.TemporaryDirectory() as directory:
+        check_raw_values_and_failures(os.path.join(directory, "quarantine.sqlite3"))
+
+    total = posters * posts
+    expected = Counter(f"投稿{p}-{k}" for p in range(posters) for k in range(posts))
+
+    client = sheets.set_backend(sheets.LocalSheetsBackend({chat_store.MESSAGE_SHEET: [HEADER]}, latency=latency))
+    chat_sh = client.worksheet(chat_store.MESSAGE_SHEET)
+    old_sec = run_posters(lambda *args: legacy_post(chat_sh, *args), posters, posts)
+    old_calls = client.stats.total_calls()
+    assert written_texts(client) == expected
+
+    client = sheets.set_backend(sheets.LocalSheetsBackend({chat_store.MESSAGE_SHEET: [HEADER]}, latency=latency))
+    store = chat_store.SheetLog(chat_store.MESSAGE_SHEET, HEADER, flush_interval=0.2)
+    stale = []
+
+    def post(sender, text, property_id):
+        store.append([time.strftime("%Y-%m-%d %H:%M:%S"), sender, text, property_id])
+        # 自分の投稿はシートへの書き込みを待たずに読める
+        if text not in {record["text"] for record in store.records_for(property_id)}:
+            stale.append(text)
+
+    new_sec = run_posters(post, posters, posts)
+    start = time.perf_counter()
+    while store.pending():
+        time.sleep(0.01)
+    drained_sec = new_sec + time.perf_counter() - start
+    new_calls = client.stats.total_calls()
+    assert not stale, stale[:5]
+    assert written_texts(client) == expected
+    store.refresh(force=True)
+    in_store = Counter(record["text"] for p in range(10) for record in store.records_for(p))
+    assert in_store == expected
+
+    print(f"{posters}人 x {posts}件 = {total}件 / API 1回 {latency}秒")
+    print(f"従来方式     : {old_sec:6.2f}秒  {total / old_sec:7.1f}件/秒  シート操作 {old_calls:,}回")
+    print(f"書き込みバッファ: {new_sec:6.2f}秒  {total / new_sec:7.1f}件/秒  シート操作 {new_calls:,}回"
+          f"  (書き込み完了まで {drained_sec:.2f}秒)")
+    print(store.stats())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,330 @@
+import os
+import json
+import time
+import atexit
+import logging
+import sqlite3
+import threading
+from collections import Counter
+
+import pandas as pd
+from gspread.exceptions import APIError
+
+import sheets
+
+# チャットデータDB・評価DB を property_id ごとにまとめて持つストア。
+# 読み込みは sheets.TailReader で前回読んだ最終行から後ろだけを取得して差分を追加する。
+# 読み込みは refresh_interval 秒に1回までなので、1回の描画で全タブが同じ取得結果を使う。
+#
+# 書き込みは append でバッファに入れてすぐ読み取りに反映し、バックグラウンドのスレッドが
+# flush_interval 秒ごとに全セッションの分をまとめて append_rows する。
+# シートには入力どおりの値を書き、数値への変換は読み取り用のレコードにだけ行う。
+# 書き込みに失敗したら間隔をあけて再試行し、max_attempts 回続けて失敗したら1行ずつに分けて書く。
+# 通信エラーや 429・5xx のような一時的な失敗は何度でも再試行し、4xx や値の変換エラーのように
+# 再試行しても書けない行だけを SQLite の隔離箱に移して後ろの行の書き込みを止めない。
+# 隔離した行はプロセスを再起動しても残り、replay_quarantined で書き込み直せる。
+# 見出し行の確認は最初の読み込みで1度だけ行う。
+
+logger = logging.getLogger(__name__)
+
+MESSAGE_SHEET = "チャットデータDB"
+MESSAGE_HEADER = ["timestamp", "sender", "text", "property_id"]
+RATING_SHEET = "評価DB"
+RATING_HEADER = ["timestamp", "rater", "rating", "property_id"]
+QUARANTINE_PATH = os.path.join(".cache", "sheet_quarantine.sqlite3")
+
+
+def is_permanent_error(error):
+    """再試行しても成功しない書き込みエラーか。429 以外の 4xx と、値を JSON にできないエラー"""
+    if isinstance(error, APIError):
+        status = getattr(error.response, "status_code", None)
+        return status is not None and 400 <= status < 500 and status != 429
+    return isinstance(error, (ValueError, TypeError))
+
+
+class SheetLog:
+    """追記されていくシートを property_id ごとのレコードのリストで持つ"""
+
+    def __init__(self, sheet_name, header, refresh_interval=3, flush_interval=1.0, max_batch=500,
+                 max_attempts=5, max_backoff=60.0, quarantine_path=None):
+        self.sheet_name = sheet_name
+        self.header = list(header)
+        self.refresh_interval = refresh_interval
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.max_attempts = max_attempts
+        self.max_backoff = max_backoff
+        self._lock = threading.RLock()
+        self._by_property = {}
+        self._tail = sheets.TailReader(self.header)
+        # 全体を読み直すたびに増やす。since の cursor が古い読み込みのものかを見分ける
+        self._generation = 0
+        self._loaded_at = None
+        # まだシートに書いていない (行, レコード)(書き込み中を含む)と、シートから読んだときに読み飛ばす行
+        self._pending = []
+        self._inflight = []
+        self._echo = Counter()
+        # 続けて失敗した回数と次に書き込んでよい時刻
+        self._failures = 0
+        self._retry_at = 0.0
+        # 書き込めずに隔離した行
+        if quarantine_path:
+            os.makedirs(os.path.dirname(os.path.abspath(quarantine_path)), exist_ok=True)
+        self._quarantine = sqlite3.connect(quarantine_path or ":memory:", check_same_thread=False)
+        self._quarantine.execute(
+            "CREATE TABLE IF NOT EXISTS quarantine (id INTEGER PRIMARY KEY AUTOINCREMENT, sheet TEXT, "
+            "row TEXT, error TEXT, created REAL)"
+        )
+        self._quarantine.commit()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._flusher = None
+        self._stats = {"full_loads": 0, "delta_loads": 0, "rows_read": 0,
+                       "appended": 0, "flushes": 0, "flush_errors": 0, "flush_sec": 0.0, "quarantined": 0}
+
+    @property
+    def sheet(self):
+        return sheets.worksheet(self.sheet_name)
+
+    def _normalize(self, row):
+        return list(row[:len(self.header)]) + [""] * (len(self.header) - len(row))
+
+    def _record(self, row):
+        return dict(zip(self.header, sheets.convert_row(self._normalize(row))))
+
+    def _key(self, record):
+        # "nan" は NaN に変換されて自身と等しくならないので、文字列のまま比べる
+        return tuple("nan" if isinstance(record[key], float) and record[key] != record[key] else record[key]
+                     for key in self.header)
+
+    def _reset(self):
+        self._by_property = {}
+
+    def _add(self, record):
+        self._by_property.setdefault(record.get("property_id"), []).append(record)
+
+    def _ingest(self, rows):
+        for row in rows:
+            if not any(value != "" for value in row):
+                continue
+            record = self._record(row)
+            key = self._key(record)
+            # 自分が書いた行はバッファから反映済み
+            if self._echo[key]:
+                self._echo[key] -= 1
+                continue
+            self._add(record)
+
+    def _load(self):
+        rows, _, full = self._tail.read(self.sheet)
+        if full:
+            self._reset()
+            self._generation += 1
+            # 書き込み中の行はシートにあってもなくても二重に数えない
+            self._echo = Counter(self._key(record) for record in self._inflight)
+        self._ingest(rows)
+        if full:
+            for _, record in self._pending:
+                self._add(record)
+        self._stats["full_loads" if full else "delta_loads"] += 1
+        self._stats["rows_read"] += len(rows) + 1
+
+    def refresh(self, force=False):
+        with self._lock:
+            if not force and self._loaded_at is not None and time.monotonic() - self._loaded_at < self.refresh_interval:
+                return
+            self._load()
+            self._loaded_at = time.monotonic()
+
+    def mark_stale(self):
+        """他の経路での書き込みを次の読み込みで反映させる"""
+        with self._lock:
+            self._loaded_at = None
+
+    def append(self, values):
+        """1行をバッファに入れる。シートへの書き込みはバックグラウンドで行う"""
+        row = [value.item() if hasattr(value, "item") else value for value in self._normalize(values)]
+        record = self._record(row)
+        with self._lock:
+            if self._tail.row_count == 0:
+                self.refresh()
+            self._pending.append((row, record))
+            self._add(record)
+            self._stats["appended"] += 1
+            full = len(self._pending) >= self.max_batch
+            self._start_flusher()
+        if full:
+            self._wakeup.set()
+
+    def _start_flusher(self):
+        if self._flusher is None or not self._flusher.is_alive():
+            self._flusher = threading.Thread(target=self._run, name=f"{self.sheet_name}-flusher", daemon=True)
+            self._flusher.start()
+            atexit.register(self.flush)
+
+    def flush(self):
+        """バッファの行を1回の append_rows で書き込む。書き込んだ行数を返す"""
+        with self._flush_lock:
+            with self._lock:
+                # 失敗が続いているときは、どの行で失敗しているかを切り分けるため1行ずつ書く
+                size = 1 if self._failures >= self.max_attempts else self.max_batch
+                batch = self._pending[:size]
+                if not batch:
+                    return 0
+                records = [record for _, record in batch]
+                keys = [self._key(record) for record in records]
+                self._inflight = records
+                self._echo.update(keys)
+            # シートへの書き込み中も読み取りと追加は止めない
+            start = time.perf_counter()
+            try:
+                self.sheet.append_rows([row for row, _ in batch])
+            except Exception as e:
+                with self._lock:
+                    self._inflight = []
+                    self._echo -= Counter(keys)
+                    self._stats["flush_errors"] += 1
+                    self._failures += 1
+                    self._retry_at = time.monotonic() + min(self.flush_interval * 2 ** self._failures, self.max_backoff)
+                    if not is_permanent_error(e):
+                        logger.warning("%s への書き込みに失敗しました (%d回目): %s", self.sheet_name, self._failures, e)
+                    elif len(batch) > 1:
+                        # どの行が書けないのかを1行ずつ書いて切り分ける
+                        self._failures = max(self._failures, self.max_attempts)
+                        self._retry_at = 0.0
+                    else:
+                        # 1行だけでも書けない行は隔離し、後ろの行の書き込みを続ける
+                        logger.error("%s に書き込めない行を隔離しました: %s", self.sheet_name, batch[0][0], exc_info=True)
+                        self._quarantine.execute(
+                            "INSERT INTO quarantine (sheet, row, error, created) VALUES (?, ?, ?, ?)",
+                            (self.sheet_name, json.dumps(batch[0][0], ensure_ascii=False), repr(e), time.time()),
+                        )
+                        self._quarantine.commit()
+                        del self._pending[:1]
+                        self._stats["quarantined"] += 1
+                        self._retry_at = 0.0
+                return 0
+            with self._lock:
+                del self._pending[:len(batch)]
+                self._inflight = []
+                self._failures = 0
+                self._retry_at = 0.0
+                self._stats["flushes"] += 1
+                self._stats["flush_sec"] += time.perf_counter() - start
+            return len(batch)
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            if time.monotonic() < self._retry_at:
+                continue
+            while self.flush() == self.max_batch:
+                pass
+
+    def quarantined(self):
+        """書き込めずに隔離した行"""
+        with self._lock:
+            rows = self._quarantine.execute(
+                "SELECT row FROM quarantine WHERE sheet = ? ORDER BY id", (self.sheet_name,)).fetchall()
+        return [json.loads(row) for row, in rows]
+
+    def replay_quarantined(self):
+        """隔離した行を書き込みバッファに戻す。戻した行数を返す"""
+        with self._lock:
+            rows = self._quarantine.execute(
+                "SELECT id, row FROM quarantine WHERE sheet = ? ORDER BY id", (self.sheet_name,)).fetchall()
+            if not rows:
+                return 0
+            for _, row in rows:
+                row = json.loads(row)
+                self._pending.append((row, self._record(row)))
+            self._quarantine.executemany("DELETE FROM quarantine WHERE id = ?", [(row_id,) for row_id, _ in rows])
+            self._quarantine.commit()
+            # 隔離前に読み取りへ反映済みの行と二重にならないよう、次の読み込みで全体を読み直す
+            self._tail.reset()
+            self._loaded_at = None
+            self._failures = 0
+            self._start_flusher()
+        self._wakeup.set()
+        return len(rows)
+
+    def pending(self):
+        with self._lock:
+            return len(self._pending)
+
+    def records_for(self, property_id):
+        with self._lock:
+            self.refresh()
+            return list(self._by_property.get(property_id, []))
+
+    def since(self, property_id, cursor=None):
+        """(cursor より後に増えたレコード, 次の cursor, 全件を返したか) を返す。
+        cursor を取った後に全体を読み直していたら、増えた分ではなく全件を返す
+        """
+        with self._lock:
+            self.refresh()
+            records = self._by_property.get(property_id, [])
+            generation, count = cursor or (None, 0)
+            next_cursor = (self._generation, len(records))
+            if generation != self._generation:
+                return list(records), next_cursor, True
+            return records[count:], next_cursor, False
+
+    def frame_for(self, property_id):
+        with self._lock:
+            return pd.DataFrame(self.records_for(property_id), columns=self.header)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, rows=max(self._tail.row_count - 1, 0), properties=len(self._by_property),
+                        pending=len(self._pending))
+
+
+class RatingLog(SheetLog):
+    """評価DB。property_id ごとに評価者 -> 最新の評価を追加のたびに更新して持つ"""
+
+    def __init__(self, sheet_name=RATING_SHEET, header=RATING_HEADER, **kwargs):
+        super().__init__(sheet_name, header, **kwargs)
+        self._latest = {}
+
+    def _reset(self):
+        super()._reset()
+        self._latest = {}
+
+    def _add(self, record):
+        super()._add(record)
+        latest = self._latest.setdefault(record.get("property_id"), {})
+        current = latest.get(record.get("rater"))
+        # 同じ時刻なら後から追記された方を採る
+        if current is None or str(record.get("timestamp")) >= str(current.get("timestamp")):
+            latest[record.get("rater")] = record
+
+    def latest_for(self, property_id):
+        """評価者ごとの最新の評価を時刻順の DataFrame で返す"""
+        with self._lock:
+            self.refresh()
+            records = sorted(self._latest.get(property_id, {}).values(), key=lambda record: str(record.get("timestamp")))
+            return pd.DataFrame(records, columns=self.header)
+
+
+_messages = None
+_ratings = None
+_store_lock = threading.Lock()
+
+
+def get_messages():
+    global _messages
+    with _store_lock:
+        if _messages is None:
+            _messages = SheetLog(MESSAGE_SHEET, MESSAGE_HEADER,
+                                 quarantine_path=os.getenv("SHEET_QUARANTINE_PATH", QUARANTINE_PATH))
+        return _messages
+
+
+def get_ratings():
+    global _ratings
+    with _store_lock:
+        if _ratings is None:
+            _ratings = RatingLog(quarantine_path=os.getenv("SHEET_QUARANTINE_PATH", QUARANTINE_PATH))
+        return _ratings
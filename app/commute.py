@@ -0,0 +1,183 @@
+import os
+import json
+import time
+import logging
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# 勤務地から各物件までの距離・所要時間を求めるサービス。
+# 目的地を25件ずつまとめて distance_matrix を呼び、交通手段ごとのリクエストを並列に投げる。
+# 結果は (丸めた勤務地座標, property_id, 交通手段) をキーに SQLite へ保存して使い回す。
+
+logger = logging.getLogger(__name__)
+
+MODES = ["transit", "driving", "walking"]
+MODE_NAMES = {
+    "transit": "公共交通機関",
+    "driving": "車",
+    "walking": "徒歩"
+}
+NO_RESULT = (None, None, None)
+
+
+class CommuteCache:
+    """メモリ上の辞書と SQLite の2段キャッシュ。path が None ならメモリのみ"""
+
+    def __init__(self, path=None):
+        self._memory = {}
+        self._lock = threading.Lock()
+        self._db = None
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS commute (key TEXT PRIMARY KEY, value TEXT)")
+            self._db.commit()
+
+    def get_many(self, keys):
+        result = {}
+        with self._lock:
+            missing = []
+            for key in keys:
+                if key in self._memory:
+                    result[key] = self._memory[key]
+                else:
+                    missing.append(key)
+            if self._db is not None and missing:
+                for i in range(0, len(missing), 500):
+                    chunk = missing[i:i + 500]
+                    rows = self._db.execute(
+                        f"SELECT key, value FROM commute WHERE key IN ({','.join('?' * len(chunk))})", chunk
+                    ).fetchall()
+                    for key, value in rows:
+                        self._memory[key] = json.loads(value)
+                        result[key] = self._memory[key]
+        return result
+
+    def put_many(self, items):
+        with self._lock:
+            self._memory.update(items)
+            if self._db is not None and items:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO commute (key, value) VALUES (?, ?)",
+                    [(key, json.dumps(value)) for key, value in items.items()],
+                )
+                self._db.commit()
+
+
+class CommuteService:
+    def __init__(self, client, cache=None, precision=3, chunk_size=25, max_workers=6):
+        self.client = client
+        self.cache = cache or CommuteCache()
+        self.precision = precision
+        self.chunk_size = chunk_size
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._stats_lock = threading.Lock()
+        self._stats = {"lookups": 0, "cache_hits": 0, "api_calls": 0, "api_sec": 0.0, "errors": 0}
+
+    def _key(self, origin, property_id, mode):
+        lat, lng = (round(float(value), self.precision) for value in origin)
+        return f"{lat},{lng}|{property_id}|{mode}"
+
+    def _request(self, origin, mode, chunk):
+        # chunk: [(property_id, (lat, lng)), ...] 最大 chunk_size 件
+        start = time.perf_counter()
+        try:
+            result = self.client.distance_matrix(origin, [coords for _, coords in chunk], mode=mode)
+        except Exception as e:
+            logger.warning("distance_matrix の呼び出しに失敗しました (%s): %s", mode, e)
+            with self._stats_lock:
+                self._stats["errors"] += 1
+            return {}
+        finally:
+            with self._stats_lock:
+                self._stats["api_calls"] += 1
+                self._stats["api_sec"] += time.perf_counter() - start
+        elements = result["rows"][0]["elements"] if result.get("rows") else []
+        found = {}
+        for (property_id, _), element in zip(chunk, elements):
+            if "distance" in element and "duration" in element:
+                found[property_id] = [element["distance"]["text"], element["duration"]["text"],
+                                      element["duration"].get("value")]
+            else:
+                # ZERO_RESULTS などはその交通手段の経路なしとして保存する
+                found[property_id] = None
+        return found
+
+    def _resolve(self, origin, destinations):
+        # {property_id: (キャッシュ値, 交通手段)} 。どの交通手段でも経路がなければ (None, None)
+        destinations = {
+            property_id: coords for property_id, coords in destinations.items()
+            if coords is not None and all(value == value for value in coords)
+        }
+        keys = {(property_id, mode): self._key(origin, property_id, mode)
+                for property_id in destinations for mode in MODES}
+        cached = self.cache.get_many(list(keys.values()))
+        with self._stats_lock:
+            self._stats["lookups"] += len(keys)
+            self._stats["cache_hits"] += len(cached)
+
+        futures = []
+        for mode in MODES:
+            missing = [(property_id, destinations[property_id]) for property_id in destinations
+                       if keys[(property_id, mode)] not in cached]
+            for i in range(0, len(missing), self.chunk_size):
+                chunk = missing[i:i + self.chunk_size]
+                futures.append((mode, self._executor.submit(self._request, origin, mode, chunk)))
+
+        fetched = {}
+        for mode, future in futures:
+            for property_id, value in future.result().items():
+                fetched[keys[(property_id, mode)]] = value
+        self.cache.put_many(fetched)
+        cached.update(fetched)
+
+        results = {}
+        for property_id in destinations:
+            results[property_id] = (None, None)
+            for mode in MODES:
+                value = cached.get(keys[(property_id, mode)])
+                if value:
+                    results[property_id] = (value, mode)
+                    break
+        return results
+
+    def lookup(self, origin, destinations):
+        """destinations: {property_id: (緯度, 経度)} に対し {property_id: (距離, 所要時間, 交通手段)} を返す"""
+        results = {}
+        for property_id, (value, mode) in self._resolve(origin, destinations).items():
+            results[property_id] = (value[0], value[1], MODE_NAMES[mode]) if value else NO_RESULT
+        return results
+
+    def durations(self, origin, destinations):
+        """{property_id: 所要時間(秒)} を返す。並べ替え用で、求められない物件は None"""
+        results = {}
+        for property_id, (value, _) in self._resolve(origin, destinations).items():
+            results[property_id] = value[2] if value and len(value) > 2 else None
+        return results
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["hit_rate"] = stats["cache_hits"] / stats["lookups"] if stats["lookups"] else 0.0
+        return stats
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_service():
+    global _service
+    with _service_lock:
+        if _service is None:
+            if os.getenv("MAPS_BACKEND") == "stub":
+                from maps_stub import StubMapsClient
+                client = StubMapsClient()
+            else:
+                import googlemaps
+                from config import GOOGLE_MAPS_API_KEY
+                client = googlemaps.Client(key=GOOGLE_MAPS_API_KEY)
+            cache_path = os.getenv("COMMUTE_CACHE_PATH", os.path.join(".cache", "commute.sqlite3"))
+            _service = CommuteService(client, CommuteCache(cache_path or None))
+        return _service
@@ -0,0 +1,14 @@
+import pytest
+
+import sheets
+
+# app のモジュールは互いに `import sheets` のように読み込むので、
+# pytest をどこから実行してもこのディレクトリから import できるようにする(conftest.py のあるディレクトリが sys.path に入る)。
+
+
+@pytest.fixture
+def local_sheets():
+    """Google の代わりにメモリ上のシートを使う。テストごとに空のバックエンドに差し替える"""
+    backend = sheets.LocalSheetsBackend()
+    sheets.set_backend(backend)
+    return backend
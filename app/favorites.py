@@ -0,0 +1,111 @@
+import time
+import threading
+
+import sheets
+import property_details
+
+# お気に入りDB を username -> {property_id: 行番号} の索引で扱うリポジトリ。
+# 追加は重複を確認してから1行追記、解除は該当する1行だけを削除する。
+# 他のプロセスからの書き込みに備え、索引は refresh_interval 秒ごとに読み直し、
+# 削除前には行の内容が索引どおりかを確認する。
+
+SHEET_NAME = "お気に入りDB"
+HEADER = ["username", "property_id"]
+
+
+class FavoritesRepository:
+    def __init__(self, sheet_name=SHEET_NAME, refresh_interval=60):
+        self.sheet_name = sheet_name
+        self.refresh_interval = refresh_interval
+        self._lock = threading.RLock()
+        self._index = {}
+        self._row_count = 0
+        self._loaded_at = None
+
+    @property
+    def sheet(self):
+        return sheets.worksheet(self.sheet_name)
+
+    def _load(self):
+        values = self.sheet.get_all_values()
+        if not values or values[0][:2] != HEADER:
+            self.sheet.insert_row(HEADER, 1)
+            values = [HEADER] + values
+        index = {}
+        for row_number, row in enumerate(values[1:], start=2):
+            if len(row) < 2 or row[0] == "":
+                continue
+            index.setdefault(row[0], {})[sheets.convert_value(row[1])] = row_number
+        self._index = index
+        self._row_count = len(values)
+        self._loaded_at = time.monotonic()
+
+    def _ensure_loaded(self, force=False):
+        if force or self._loaded_at is None or time.monotonic() - self._loaded_at > self.refresh_interval:
+            self._load()
+
+    def list(self, username):
+        with self._lock:
+            self._ensure_loaded()
+            return list(self._index.get(username, {}))
+
+    def contains(self, username, property_id):
+        with self._lock:
+            self._ensure_loaded()
+            return property_id in self._index.get(username, {})
+
+    def add(self, username, property_id):
+        """追加したら True、登録済みなら False"""
+        with self._lock:
+            self._ensure_loaded()
+            if property_id in self._index.get(username, {}):
+                return False
+            self.sheet.append_row([username, property_id])
+            self._row_count += 1
+            self._index.setdefault(username, {})[property_id] = self._row_count
+            return True
+
+    def remove(self, username, property_id):
+        """削除したら True、登録されていなければ False"""
+        with self._lock:
+            self._ensure_loaded()
+            for attempt in range(2):
+                row_number = self._index.get(username, {}).get(property_id)
+                if row_number is None:
+                    return False
+                row = self.sheet.row_values(row_number)
+                if len(row) >= 2 and row[0] == username and sheets.convert_value(row[1]) == property_id:
+                    break
+                # 他のプロセスの書き込みで行がずれていたら読み直す
+                self._load()
+            else:
+                return False
+            self.sheet.delete_rows(row_number)
+            del self._index[username][property_id]
+            for rows in self._index.values():
+                for key, number in rows.items():
+                    if number > row_number:
+                        rows[key] = number - 1
+            self._row_count -= 1
+            return True
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = None
+
+
+_repository = None
+_repository_lock = threading.Lock()
+
+
+def get_repository():
+    global _repository
+    with _repository_lock:
+        if _repository is None:
+            _repository = FavoritesRepository()
+        return _repository
+
+
+def favorite_properties(username):
+    """ユーザーのお気に入りを、登録順に物件DB の詳細と結合した DataFrame で返す"""
+    return property_details.get_index().frame_for(get_repository().list(username))
@@ -0,0 +1,228 @@
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+
+import sheets
+
+# シートから読み込んだ DataFrame を全セッションで共有するキャッシュ。
+# TTL・最大メモリ量・バージョン番号で鮮度を管理する。
+# スクレイピング側はデータ書き込み後に scraping/incremental.py の bump_version で「バージョンDB」を更新し、
+# アプリ側は version_check_interval 秒ごとにそれを確認して古いエントリを捨てる。
+# キャッシュした DataFrame は共有されるため、呼び出し側で変更しないこと。
+
+logger = logging.getLogger(__name__)
+
+VERSION_SHEET = "バージョンDB"
+
+
+class _Entry:
+    def __init__(self, frame, version, loaded_at, nbytes):
+        self.frame = frame
+        self.version = version
+        self.loaded_at = loaded_at
+        self.nbytes = nbytes
+
+
+def _frame_bytes(df):
+    if hasattr(df, "nbytes") and not hasattr(df, "memory_usage"):
+        return int(df.nbytes)
+    try:
+        return int(df.memory_usage(index=True, deep=True).sum())
+    except Exception:
+        return 0
+
+
+def read_versions():
+    records = sheets.worksheet(VERSION_SHEET).get_all_records()
+    return {str(record["sheet_name"]): str(record["version"]) for record in records}
+
+
+class FrameCache:
+    def __init__(self, loader=None, bulk_loader=None, ttl=600, max_bytes=512 * 1024 * 1024,
+                 version_reader=read_versions, version_check_interval=60):
+        self.loader = loader or sheets.load_frame
+        self.bulk_loader = bulk_loader or sheets.load_frames
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.version_reader = version_reader
+        self.version_check_interval = version_check_interval
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._version_lock = threading.Lock()
+        self._key_locks = {}
+        self._versions = {}
+        self._versions_checked_at = 0.0
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+        self._load_times = {}
+
+    def _current_version(self, name):
+        if self.version_reader is None:
+            return None
+        with self._version_lock:
+            now = time.monotonic()
+            if now - self._versions_checked_at >= self.version_check_interval:
+                self._versions_checked_at = now
+                try:
+                    self._versions = self.version_reader()
+                except Exception as e:
+                    logger.warning("バージョン情報の取得に失敗しました: %s", e)
+            return self._versions.get(name)
+
+    def _key_lock(self, key):
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def _lookup(self, key, version):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if time.monotonic() - entry.loaded_at > self.ttl or entry.version != version:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def get(self, name, transform=None):
+        """シート名の DataFrame を返す。transform を指定すると読み込み直後に一度だけ適用する"""
+        key = (name, getattr(transform, "__qualname__", None))
+        version = self._current_version(name)
+        with self._lock:
+            entry = self._lookup(key, version)
+            if entry is not None:
+                self._stats["hits"] += 1
+                return entry.frame
+        # 同じシートの同時読み込みは1回にまとめる
+        with self._key_lock(key):
+            with self._lock:
+                entry = self._lookup(key, version)
+                if entry is not None:
+                    self._stats["hits"] += 1
+                    return entry.frame
+                self._stats["misses"] += 1
+            start = time.perf_counter()
+            frame = self.loader(name)
+            if transform is not None:
+                frame = transform(frame)
+            elapsed = time.perf_counter() - start
+            self.put(key, frame, version)
+            with self._lock:
+                self._load_times[name] = elapsed
+            logger.info("%s を読み込みました (%.3f秒, %d行)", name, elapsed, len(frame))
+            return frame
+
+    def get_many(self, transforms):
+        """{シート名: transform} を受け取り、未キャッシュのシートだけをまとめて読み込む"""
+        keys = {name: (name, getattr(transform, "__qualname__", None)) for name, transform in transforms.items()}
+        versions = {name: self._current_version(name) for name in transforms}
+        result = {}
+        with self._lock:
+            for name, key in keys.items():
+                entry = self._lookup(key, versions[name])
+                if entry is not None:
+                    self._stats["hits"] += 1
+                    result[name] = entry.frame
+        missing = [name for name in transforms if name not in result]
+        if not missing:
+            return result
+        locks = [self._key_lock(keys[name]) for name in sorted(missing)]
+        for lock in locks:
+            lock.acquire()
+        try:
+            with self._lock:
+                for name in list(missing):
+                    entry = self._lookup(keys[name], versions[name])
+                    if entry is not None:
+                        self._stats["hits"] += 1
+                        result[name] = entry.frame
+                        missing.remove(name)
+                self._stats["misses"] += len(missing)
+            if missing:
+                start = time.perf_counter()
+                frames = self.bulk_loader(missing)
+                elapsed = time.perf_counter() - start
+                for name in missing:
+                    frame = frames[name]
+                    if transforms[name] is not None:
+                        frame = transforms[name](frame)
+                    self.put(keys[name], frame, versions[name])
+                    result[name] = frame
+                with self._lock:
+                    for name in missing:
+                        self._load_times[name] = elapsed
+                logger.info("%s をまとめて読み込みました (%.3f秒)", ", ".join(missing), elapsed)
+        finally:
+            for lock in locks:
+                lock.release()
+        return result
+
+    def put(self, key, frame, version=None):
+        entry = _Entry(frame, version, time.monotonic(), _frame_bytes(frame))
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            self._evict()
+
+    def _evict(self):
+        total = sum(entry.nbytes for entry in self._entries.values())
+        while total > self.max_bytes and len(self._entries) > 1:
+            _, entry = self._entries.popitem(last=False)
+            total -= entry.nbytes
+            self._stats["evictions"] += 1
+
+    def invalidate(self, name=None):
+        with self._lock:
+            if name is None:
+                removed = len(self._entries)
+                self._entries.clear()
+            else:
+                keys = [key for key in self._entries if key[0] == name]
+                for key in keys:
+                    del self._entries[key]
+                removed = len(keys)
+            self._versions_checked_at = 0.0
+            self._stats["invalidations"] += removed
+
+    def stats(self):
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return dict(
+                self._stats,
+                hit_rate=self._stats["hits"] / lookups if lookups else 0.0,
+                entries=len(self._entries),
+                bytes=sum(entry.nbytes for entry in self._entries.values()),
+                load_sec=dict(self._load_times),
+            )
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = FrameCache(
+                ttl=float(os.getenv("FRAME_CACHE_TTL", "600")),
+                max_bytes=int(os.getenv("FRAME_CACHE_MAX_MB", "512")) * 1024 * 1024,
+                version_check_interval=float(os.getenv("FRAME_CACHE_VERSION_INTERVAL", "60")),
+            )
+        return _cache
+
+
+def get_frame(name, transform=None):
+    return get_cache().get(name, transform)
+
+
+def get_frames(transforms):
+    return get_cache().get_many(transforms)
+
+
+def invalidate(name=None):
+    get_cache().invalidate(name)
+
+
+def cache_stats():
+    return get_cache().stats()
@@ -0,0 +1,119 @@
+import os
+import re
+import time
+import json
+import sqlite3
+import threading
+import unicodedata
+from collections import OrderedDict
+
+# 勤務地住所のジオコーディング結果を正規化した住所をキーにキャッシュする。
+# メモリ上の LRU と、任意で全セッション共有の SQLite ファイルの2段構成。
+
+
+def normalize_address(address):
+    # 全角英数・空白を揃え、連続する空白を1つにする
+    address = unicodedata.normalize("NFKC", address or "")
+    address = re.sub(r"\s+", " ", address).strip()
+    return address.lower()
+
+
+class GeocodeCache:
+    def __init__(self, client, max_entries=1024, path=None):
+        self.client = client
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS geocode (address TEXT PRIMARY KEY, coords TEXT)")
+            self._db.commit()
+        self._stats = {"lookups": 0, "hits": 0, "disk_hits": 0, "api_calls": 0, "api_sec": 0.0, "skipped": 0}
+
+    def _get_cached(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self._stats["hits"] += 1
+                return True, self._entries[key]
+            if self._db is not None:
+                row = self._db.execute("SELECT coords FROM geocode WHERE address = ?", (key,)).fetchone()
+                if row is not None:
+                    coords = json.loads(row[0])
+                    coords = tuple(coords) if coords else None
+                    self._store_memory(key, coords)
+                    self._stats["hits"] += 1
+                    self._stats["disk_hits"] += 1
+                    return True, coords
+        return False, None
+
+    def _store_memory(self, key, coords):
+        self._entries[key] = coords
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _store(self, key, coords):
+        with self._lock:
+            self._store_memory(key, coords)
+            if self._db is not None:
+                self._db.execute("INSERT OR REPLACE INTO geocode (address, coords) VALUES (?, ?)",
+                                 (key, json.dumps(coords)))
+                self._db.commit()
+
+    def geocode(self, address):
+        """住所を (緯度, 経度) に変換する。見つからない・空の場合は None"""
+        key = normalize_address(address)
+        with self._lock:
+            self._stats["lookups"] += 1
+            if not key:
+                self._stats["skipped"] += 1
+                return None
+        found, coords = self._get_cached(key)
+        if found:
+            return coords
+        start = time.perf_counter()
+        try:
+            # 正規化した住所はキャッシュのキーにだけ使い、API には入力どおりの住所を渡す
+            geocode_result = self.client.geocode(address.strip())
+        finally:
+            with self._lock:
+                self._stats["api_calls"] += 1
+                self._stats["api_sec"] += time.perf_counter() - start
+        coords = None
+        if geocode_result:
+            location = geocode_result[0]['geometry']['location']
+            coords = (location['lat'], location['lng'])
+        self._store(key, coords)
+        return coords
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats["hit_rate"] = stats["hits"] / stats["lookups"] if stats["lookups"] else 0.0
+        # キャッシュヒットで省けた API 呼び出し時間の推定値
+        avg_api_sec = stats["api_sec"] / stats["api_calls"] if stats["api_calls"] else 0.0
+        stats["saved_sec"] = stats["hits"] * avg_api_sec
+        return stats
+
+
+_geocoder = None
+_geocoder_lock = threading.Lock()
+
+
+def get_geocoder():
+    global _geocoder
+    with _geocoder_lock:
+        if _geocoder is None:
+            if os.getenv("MAPS_BACKEND") == "stub":
+                from maps_stub import StubMapsClient
+                client = StubMapsClient()
+            else:
+                import googlemaps
+                from config import GOOGLE_MAPS_API_KEY
+                client = googlemaps.Client(key=GOOGLE_MAPS_API_KEY)
+            cache_path = os.getenv("GEOCODE_CACHE_PATH", os.path.join(".cache", "geocode.sqlite3"))
+            _geocoder = GeocodeCache(client, path=cache_path or None)
+        return _geocoder
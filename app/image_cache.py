@@ -0,0 +1,252 @@
+import io
+import os
+import time
+import hashlib
+import logging
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from PIL import Image
+
+# 物件画像・間取り画像のサムネイルをディスクにキャッシュする。
+# 画像は1度だけダウンロードして縮小し、内容のハッシュをファイル名にして保存する。
+# URL -> ハッシュの対応と最終アクセス時刻を SQLite に持ち、合計サイズを超えたら古いものから消す。
+# 最終アクセス時刻の更新はメモリに溜めて TOUCH_BATCH 件か TOUCH_FLUSH_SEC 秒ごとに1回のコミットで書き込む。
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_SIZE = (600, 600)
+RETRY_AFTER_SEC = 600
+TOUCH_BATCH = 256
+TOUCH_FLUSH_SEC = 30
+# 消すときは上限の EVICT_TO 割まで減らし、ダウンロードのたびに追い出しが走らないようにする
+EVICT_TO = 0.9
+# 件数がまだないときに事前取得の上限を見積もるための1枚あたりのサイズ
+ESTIMATED_SIZE = 64 * 1024
+
+
+class ImageCache:
+    def __init__(self, directory, max_bytes=256 * 1024 * 1024, session=None, timeout=10, max_workers=4,
+                 prefetch_interval=0.1):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        # 事前取得で画像配信元に送るリクエストの最小間隔（秒）
+        self.prefetch_interval = prefetch_interval
+        self.session = session or requests.Session()
+        os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(os.path.join(directory, "index.sqlite3"), check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS images (url TEXT PRIMARY KEY, digest TEXT, size INTEGER, accessed REAL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS images_accessed ON images (accessed)")
+        self._db.commit()
+        # 失敗済みの Future に add_done_callback するとその場で _forget が呼ばれるので再入可能にする
+        self._lock = threading.RLock()
+        self._inflight = {}
+        self._failures = {}
+        self._touched = {}
+        self._flushed_at = time.monotonic()
+        self._total, self._entries = self._db.execute(
+            "SELECT COALESCE(SUM(size), 0), COUNT(*) FROM images").fetchone()
+        self._throttle_lock = threading.Lock()
+        self._next_request = 0.0
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._stats = {"hits": 0, "misses": 0, "errors": 0, "evictions": 0, "download_sec": 0.0}
+
+    def _path(self, digest):
+        return os.path.join(self.directory, digest[:2], digest + ".jpg")
+
+    def _lookup(self, url):
+        with self._lock:
+            row = self._db.execute("SELECT digest, size FROM images WHERE url = ?", (url,)).fetchone()
+            if row is None:
+                return None
+            path = self._path(row[0])
+            if not os.path.exists(path):
+                self._db.execute("DELETE FROM images WHERE url = ?", (url,))
+                self._db.commit()
+                self._total -= row[1]
+                self._entries -= 1
+                self._touched.pop(url, None)
+                return None
+            self._touched[url] = time.time()
+            if len(self._touched) >= TOUCH_BATCH or time.monotonic() - self._flushed_at >= TOUCH_FLUSH_SEC:
+                self._flush_touched()
+            return path
+
+    def _flush_touched(self):
+        # 呼び出し側で self._lock を取っていること
+        if self._touched:
+            self._db.executemany("UPDATE images SET accessed = ? WHERE url = ?",
+                                 [(accessed, url) for url, accessed in self._touched.items()])
+            self._db.commit()
+            self._touched.clear()
+        self._flushed_at = time.monotonic()
+
+    def _cached_urls(self, urls):
+        # 取得済みの URL を1回の SELECT でまとめて調べる。最終アクセス時刻は更新しない
+        cached = set()
+        with self._lock:
+            for i in range(0, len(urls), 500):
+                chunk = urls[i:i + 500]
+                placeholders = ", ".join("?" * len(chunk))
+                cached.update(row[0] for row in self._db.execute(
+                    f"SELECT url FROM images WHERE url IN ({placeholders})", chunk))
+        return cached
+
+    def _throttle(self):
+        with self._throttle_lock:
+            now = time.monotonic()
+            wait = self._next_request - now
+            self._next_request = max(now, self._next_request) + self.prefetch_interval
+        if wait > 0:
+            time.sleep(wait)
+
+    def _download(self, url, throttle=False):
+        if throttle:
+            self._throttle()
+        start = time.perf_counter()
+        response = self.session.get(url, timeout=self.timeout)
+        response.raise_for_status()
+        image = Image.open(io.BytesIO(response.content))
+        image.thumbnail(THUMBNAIL_SIZE)
+        buffer = io.BytesIO()
+        image.convert("RGB").save(buffer, format="JPEG", quality=85)
+        data = buffer.getvalue()
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._path(digest)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if not os.path.exists(path):
+            with open(path + ".tmp", "wb") as f:
+                f.write(data)
+            os.replace(path + ".tmp", path)
+        with self._lock:
+            old = self._db.execute("SELECT size FROM images WHERE url = ?", (url,)).fetchone()
+            self._db.execute("INSERT OR REPLACE INTO images (url, digest, size, accessed) VALUES (?, ?, ?, ?)",
+                             (url, digest, len(data), time.time()))
+            self._db.commit()
+            self._touched.pop(url, None)
+            if old is None:
+                self._entries += 1
+            self._total += len(data) - (old[0] if old else 0)
+            self._stats["download_sec"] += time.perf_counter() - start
+            if self._total > self.max_bytes:
+                self._evict()
+        return path
+
+    def _fetch(self, url, throttle=False):
+        # 同じ URL の同時ダウンロードは1回にまとめる
+        with self._lock:
+            future = self._inflight.get(url)
+            if future is None:
+                future = self._executor.submit(self._download, url, throttle)
+                self._inflight[url] = future
+                future.add_done_callback(lambda done: self._forget(url, done))
+        return future
+
+    def _forget(self, url, future):
+        with self._lock:
+            self._inflight.pop(url, None)
+            if future.exception() is not None:
+                self._failures[url] = time.monotonic()
+
+    def _backing_off(self, url):
+        # 失敗した URL はしばらく取りに行かない。呼び出し側で self._lock を取っていること
+        return time.monotonic() - self._failures.get(url, -RETRY_AFTER_SEC) < RETRY_AFTER_SEC
+
+    def thumbnail(self, url):
+        """サムネイルのローカルパスを返す。取得できなければ元の URL を返す"""
+        if not isinstance(url, str) or not url:
+            return url
+        path = self._lookup(url)
+        if path is not None:
+            with self._lock:
+                self._stats["hits"] += 1
+            return path
+        with self._lock:
+            self._stats["misses"] += 1
+            if self._backing_off(url):
+                return url
+        try:
+            return self._fetch(url).result()
+        except Exception as e:
+            logger.warning("画像の取得に失敗しました %s: %s", url, e)
+            with self._lock:
+                self._stats["errors"] += 1
+            return url
+
+    def prefetch(self, urls):
+        """未取得の画像をバックグラウンドでダウンロードし、その Future のリストを返す。
+        表示するページ分の URL を渡す想定で、キャッシュに収まる枚数までしか取りに行かない
+        """
+        urls = [url for url in dict.fromkeys(urls) if isinstance(url, str) and url]
+        if not urls:
+            return []
+        cached = self._cached_urls(urls)
+        with self._lock:
+            average = self._total / self._entries if self._entries else ESTIMATED_SIZE
+            limit = int(self.max_bytes * EVICT_TO // max(average, 1))
+            targets = [url for url in urls if url not in cached and not self._backing_off(url)][:limit]
+        return [self._fetch(url, throttle=True) for url in targets]
+
+    def _evict(self):
+        # 呼び出し側で self._lock を取っていること。アクセスの古いものから EVICT_TO 割まで消す
+        self._flush_touched()
+        target = self.max_bytes * EVICT_TO
+        while self._total > target:
+            rows = self._db.execute(
+                "SELECT url, digest, size FROM images ORDER BY accessed LIMIT 64").fetchall()
+            if not rows:
+                break
+            for url, digest, size in rows:
+                if self._total <= target:
+                    break
+                self._db.execute("DELETE FROM images WHERE url = ?", (url,))
+                self._total -= size
+                self._entries -= 1
+                self._stats["evictions"] += 1
+                # 同じ内容を別の URL が参照していなければファイルも消す
+                shared = self._db.execute("SELECT 1 FROM images WHERE digest = ? LIMIT 1", (digest,)).fetchone()
+                if shared is None:
+                    try:
+                        os.remove(self._path(digest))
+                    except FileNotFoundError:
+                        pass
+        self._db.commit()
+
+    def flush(self):
+        """溜めている最終アクセス時刻を書き込む"""
+        with self._lock:
+            self._flush_touched()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"], stats["bytes"] = self._entries, self._total
+        return stats
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ImageCache(
+                os.getenv("IMAGE_CACHE_DIR", os.path.join(".cache", "images")),
+                max_bytes=int(os.getenv("IMAGE_CACHE_MAX_MB", "256")) * 1024 * 1024,
+            )
+        return _cache
+
+
+def thumbnail(url):
+    return get_cache().thumbnail(url)
+
+
+def prefetch(urls):
+    return get_cache().prefetch(urls)
@@ -0,0 +1,133 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+import folium
+from folium.plugins import FastMarkerCluster
+
+# 検索結果の地図を組み立てて HTML として返す。
+# 物件・周辺施設ごとに1つの FastMarkerCluster レイヤーを列の配列から作り、
+# 1件ずつ folium.Marker を作る代わりにブラウザ側でマーカーを生成する。
+# 同じ入力に対しては描画済みの HTML を使い回す。
+
+MAX_MARKERS = 5000
+DISABLE_CLUSTERING_AT_ZOOM = 16
+
+POI_STYLES = {
+    "スーパー": ("green", "shopping-cart"),
+    "コンビニ": ("orange", "info-sign"),
+    "銀行": ("red", "usd"),
+    "カフェ": ("purple", "coffee"),
+}
+
+MARKER_CALLBACK = """
+function (row) {
+    var marker = L.marker(new L.LatLng(row[0], row[1]));
+    marker.bindPopup(row[2], {maxWidth: 400});
+    return marker;
+};
+"""
+
+POI_CALLBACK = """
+function (row) {
+    var icon = L.AwesomeMarkers.icon({icon: '%s', markerColor: '%s', prefix: 'glyphicon'});
+    var marker = L.marker(new L.LatLng(row[0], row[1]), {icon: icon});
+    marker.bindPopup(row[2], {maxWidth: 200});
+    return marker;
+};
+"""
+
+_html_cache = OrderedDict()
+_html_cache_lock = threading.Lock()
+HTML_CACHE_SIZE = 64
+
+
+def _text(series):
+    return series.astype(str)
+
+
+def property_popups(df, commutes=None):
+    # 列単位の文字列連結でポップアップの HTML をまとめて作る
+    popups = (
+        "<b>名称:</b> " + _text(df['名称']) + "<br>"
+        + "<b>アドレス:</b> " + _text(df['アドレス']) + "<br>"
+        + "<b>家賃:</b> " + _text(df['家賃']) + "万円<br>"
+        + "<b>間取り:</b> " + _text(df['間取り']) + "<br>"
+        + '<a href="' + _text(df['物件詳細URL']) + '" target="_blank">物件詳細</a><br>'
+    )
+    if commutes:
+        extra = []
+        for property_id in df['property_id']:
+            distance, duration, mode = commutes.get(property_id, (None, None, None))
+            if distance and duration:
+                extra.append(f"<b>勤務地までの距離:</b> {distance}<br>"
+                             f"<b>勤務地までの時間:</b> {duration}<br>"
+                             f"<b>交通手段:</b> {mode}<br>")
+            else:
+                extra.append("")
+        popups = popups + pd.Series(extra, index=df.index)
+    return popups
+
+
+def _layer_data(lat, lng, popups, max_markers):
+    lat = pd.to_numeric(lat, errors="coerce").to_numpy(dtype=float)
+    lng = pd.to_numeric(lng, errors="coerce").to_numpy(dtype=float)
+    popups = np.asarray(popups, dtype=object)
+    valid = ~(np.isnan(lat) | np.isnan(lng))
+    lat, lng, popups = lat[valid], lng[valid], popups[valid]
+    if len(lat) > max_markers:
+        lat, lng, popups = lat[:max_markers], lng[:max_markers], popups[:max_markers]
+    return [[a, b, c] for a, b, c in zip(lat.tolist(), lng.tolist(), popups.tolist())]
+
+
+def _cluster_options():
+    return {"disableClusteringAtZoom": DISABLE_CLUSTERING_AT_ZOOM, "chunkedLoading": True}
+
+
+def build_map(filtered_df, commutes=None, poi_layers=None, max_markers=MAX_MARKERS):
+    """poi_layers: {"スーパー": DataFrame, ...} 表示する周辺施設のみ渡す"""
+    map_center = [filtered_df['緯度'].mean(), filtered_df['経度'].mean()]
+    m = folium.Map(location=map_center, zoom_start=12)
+
+    data = _layer_data(filtered_df['緯度'], filtered_df['経度'], property_popups(filtered_df, commutes), max_markers)
+    FastMarkerCluster(data, callback=MARKER_CALLBACK, options=_cluster_options(), name="物件").add_to(m)
+
+    for name, poi_df in (poi_layers or {}).items():
+        if poi_df is None or poi_df.empty:
+            continue
+        color, icon = POI_STYLES[name]
+        popups = "<b>店舗名称:</b> " + _text(poi_df['店舗名称']) + "<br>"
+        data = _layer_data(poi_df['Latitude'], poi_df['Longitude'], popups, max_markers)
+        FastMarkerCluster(data, callback=POI_CALLBACK % (icon, color), options=_cluster_options(), name=name).add_to(m)
+    return m
+
+
+def _cache_key(filtered_df, commutes, poi_layers):
+    # マーカーの位置とポップアップに使う列をすべて含める
+    digest = hashlib.sha1()
+    columns = ['property_id', '緯度', '経度', '名称', 'アドレス', '家賃', '間取り', '物件詳細URL']
+    digest.update(pd.util.hash_pandas_object(filtered_df[columns], index=False).to_numpy().tobytes())
+    if commutes:
+        for property_id in filtered_df['property_id']:
+            digest.update(repr((property_id, commutes.get(property_id))).encode("utf-8"))
+    for name, poi_df in sorted((poi_layers or {}).items()):
+        digest.update(name.encode("utf-8"))
+        digest.update(pd.util.hash_pandas_object(poi_df[['Latitude', 'Longitude', '店舗名称']], index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def render_map_html(filtered_df, commutes=None, poi_layers=None):
+    key = _cache_key(filtered_df, commutes, poi_layers)
+    with _html_cache_lock:
+        if key in _html_cache:
+            _html_cache.move_to_end(key)
+            return _html_cache[key]
+    m = build_map(filtered_df, commutes, poi_layers)
+    html = folium.Figure().add_child(m).render()
+    with _html_cache_lock:
+        _html_cache[key] = html
+        while len(_html_cache) > HTML_CACHE_SIZE:
+            _html_cache.popitem(last=False)
+    return html
@@ -0,0 +1,193 @@
+import os
+import time
+import logging
+import sqlite3
+import threading
+
+import requests
+
+# LINE 通知をバックグラウンドのスレッドから送る。
+# 送信したいメッセージはまず SQLite の送信箱に書き、ワーカーが送信できたものから消し込む。
+# 同じ物件へのメッセージは coalesce_sec 秒待ってまとめて1通にし、送信間隔は min_interval 秒以上あける。
+# 失敗したら指数バックオフで再送し、max_attempts 回失敗したら諦める。プロセスが落ちても未送信分は次回送る。
+
+logger = logging.getLogger(__name__)
+
+LINE_NOTIFY_URL = "https://notify-api.line.me/api/notify"
+MAX_BACKOFF_SEC = 300
+
+
+def format_message(property_name, messages):
+    """messages は (sender, text) のリスト"""
+    if len(messages) == 1:
+        sender, text = messages[0]
+        return f"{sender}さんから新しいメッセージ: {text} (物件名: {property_name})"
+    lines = [f"{property_name}に新しいメッセージが{len(messages)}件あります"]
+    lines += [f"{sender}さん: {text}" for sender, text in messages]
+    return "\n".join(lines)
+
+
+class Notifier:
+    def __init__(self, token, url=LINE_NOTIFY_URL, outbox_path=None, session=None, timeout=10,
+                 coalesce_sec=2.0, min_interval=1.0, max_attempts=5, backoff_sec=2.0):
+        self.token = token
+        self.url = url
+        self.timeout = timeout
+        self.coalesce_sec = coalesce_sec
+        self.min_interval = min_interval
+        self.max_attempts = max_attempts
+        self.backoff_sec = backoff_sec
+        self.session = session or requests.Session()
+        if outbox_path:
+            os.makedirs(os.path.dirname(os.path.abspath(outbox_path)), exist_ok=True)
+        self._db = sqlite3.connect(outbox_path or ":memory:", check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS outbox (id INTEGER PRIMARY KEY AUTOINCREMENT, property_id TEXT, "
+            "property_name TEXT, sender TEXT, text TEXT, created REAL, attempts INTEGER DEFAULT 0, "
+            "next_attempt REAL)"
+        )
+        self._db.commit()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = False
+        self._worker = None
+        self._last_sent = 0.0
+        self._stats = {"enqueued": 0, "notifications": 0, "delivered": 0, "coalesced": 0,
+                       "retries": 0, "dropped": 0, "send_sec": 0.0}
+
+    def start(self):
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._stopped = False
+                self._worker = threading.Thread(target=self._run, name="line-notifier", daemon=True)
+                self._worker.start()
+        return self
+
+    def stop(self, timeout=None):
+        self._stopped = True
+        self._wakeup.set()
+        if self._worker is not None:
+            self._worker.join(timeout)
+
+    def enqueue(self, sender, text, property_id, property_name):
+        """送信箱に入れてすぐ戻る"""
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO outbox (property_id, property_name, sender, text, created, next_attempt) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (str(property_id), property_name, sender, text, now, now + self.coalesce_sec),
+            )
+            self._db.commit()
+            self._stats["enqueued"] += 1
+        self.start()
+        self._wakeup.set()
+
+    def pending(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+
+    def flush(self, timeout=30):
+        """送信箱が空になるまで待つ。空になれば True"""
+        deadline = time.monotonic() + timeout
+        while self.pending():
+            if time.monotonic() > deadline:
+                return False
+            self._wakeup.set()
+            time.sleep(0.05)
+        return True
+
+    def _next_batch(self):
+        # 最初のメッセージから coalesce_sec 秒経った物件(再送待ちならその時刻を過ぎたもの)のうち、
+        # 最も古いものについて溜まっているメッセージを全部まとめる
+        ready = "MAX(MIN(next_attempt), MAX(CASE WHEN attempts > 0 THEN next_attempt ELSE 0 END))"
+        with self._lock:
+            groups = self._db.execute(
+                f"SELECT property_id, {ready} AS ready_at FROM outbox GROUP BY property_id ORDER BY MIN(created)"
+            ).fetchall()
+            now = time.time()
+            due = [property_id for property_id, ready_at in groups if ready_at <= now]
+            if not due:
+                return None, (min(ready_at for _, ready_at in groups) - now if groups else None)
+            rows = self._db.execute(
+                "SELECT id, property_name, sender, text, attempts FROM outbox WHERE property_id = ? ORDER BY id",
+                (due[0],)
+            ).fetchall()
+            return rows, 0.0
+
+    def _run(self):
+        while not self._stopped:
+            rows, wait = self._next_batch()
+            if rows is None:
+                self._wakeup.wait(wait)
+                self._wakeup.clear()
+                continue
+            # 送信間隔を守る
+            delay = self._last_sent + self.min_interval - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            self._deliver(rows)
+
+    def _deliver(self, rows):
+        ids = [row[0] for row in rows]
+        message = format_message(rows[-1][1], [(row[2], row[3]) for row in rows])
+        attempts = max(row[4] for row in rows) + 1
+        start = time.perf_counter()
+        retry_after = None
+        try:
+            response = self.session.post(self.url, headers={"Authorization": f"Bearer {self.token}"},
+                                         data={"message": message}, timeout=self.timeout)
+            status = response.status_code
+            retry_after = response.headers.get("Retry-After")
+        except requests.RequestException as e:
+            logger.warning("LINE 通知の送信に失敗しました: %s", e)
+            status = None
+        self._last_sent = time.monotonic()
+        placeholders = ",".join("?" * len(ids))
+        with self._lock:
+            self._stats["send_sec"] += time.perf_counter() - start
+            if status is not None and 200 <= status < 300:
+                self._db.execute(f"DELETE FROM outbox WHERE id IN ({placeholders})", ids)
+                self._stats["notifications"] += 1
+                self._stats["delivered"] += len(ids)
+                self._stats["coalesced"] += len(ids) - 1
+            elif (status is None or status == 429 or status >= 500) and attempts < self.max_attempts:
+                delay = min(self.backoff_sec * 2 ** (attempts - 1), MAX_BACKOFF_SEC)
+                if retry_after and retry_after.isdigit():
+                    delay = max(delay, int(retry_after))
+                self._db.execute(f"UPDATE outbox SET attempts = ?, next_attempt = ? WHERE id IN ({placeholders})",
+                                 [attempts, time.time() + delay] + ids)
+                self._stats["retries"] += 1
+            else:
+                logger.error("LINE 通知を破棄しました status=%s: %s", status, message)
+                self._db.execute(f"DELETE FROM outbox WHERE id IN ({placeholders})", ids)
+                self._stats["dropped"] += len(ids)
+            self._db.commit()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats["pending"] = self.pending()
+        return stats
+
+
+_notifier = None
+_notifier_lock = threading.Lock()
+
+
+def get_notifier():
+    global _notifier
+    with _notifier_lock:
+        if _notifier is None:
+            from config import LINE_NOTIFY_TOKEN
+            outbox_path = os.getenv("NOTIFY_OUTBOX_PATH", os.path.join(".cache", "notify_outbox.sqlite3"))
+            _notifier = Notifier(LINE_NOTIFY_TOKEN, url=os.getenv("LINE_NOTIFY_URL", LINE_NOTIFY_URL),
+                                 outbox_path=outbox_path or None)
+            # 前回のプロセスで送れなかった分を送る
+            if _notifier.pending():
+                _notifier.start()
+        return _notifier
+
+
+def notify(sender, text, property_id, property_name):
+    get_notifier().enqueue(sender, text, property_id, property_name)
@@ -1,147 +1,89 @@
 import streamlit as st
-import gspread
-from google.oauth2.service_account import Credentials
 import pandas as pd
-import folium
-from streamlit_folium import folium_static
+import streamlit.components.v1 as components
 import googlemaps
-from config import SPREADSHEET_DB_ID, PRIVATE_KEY_PATH, GOOGLE_MAPS_API_KEY, scopes
-
-def get_credentials():
-    return Credentials.from_service_account_info(PRIVATE_KEY_PATH, scopes=scopes)
-
-def load_data_from_gsheet(spreadsheet_id, sheet_name):
-    creds = get_credentials()
-    client = gspread.authorize(creds)
-    sheet = client.open_by_key(spreadsheet_id).worksheet(sheet_name)
-    data = sheet.get_all_records()
-    df = pd.DataFrame(data)
-    return df
+import image_cache
+import frame_cache
+import commute
+import geocode
+import map_builder
+import pagination
+import favorites
+import stage_cache
+from property_store import PropertyStore
+from spatial import build_poi_index
+
+POI_RADIUS_M = 800
 
 def preprocess_dataframe(df):
-    df['家賃'] = pd.to_numeric(df['家賃'], errors='coerce')
+    df = df.assign(家賃=pd.to_numeric(df['家賃'], errors='coerce'))
     df = df.dropna(subset=['家賃'])
     return df
 
+def build_property_store(df):
+    return PropertyStore(preprocess_dataframe(df))
+
+def prefetch_next_page(sorted_df, page, page_size):
+    # 次のページの画像だけを裏で取得しておき、ページを送ったときにすぐ表示できるようにする
+    next_df, next_page = pagination.paginate(sorted_df, page + 1, page_size)
+    if next_page != page:
+        image_cache.prefetch(list(next_df['物件画像URL']) + list(next_df['間取画像URL']))
+
+def run_search(store, search_params):
+    # 一覧用の絞り込み結果と、地図用に緯度・経度のあるものだけにした結果
+    filtered_df = store.query(*search_params)
+    return filtered_df, filtered_df.dropna(subset=['緯度', '経度'])
+
 def make_clickable(url, name):
     return f'<a target="_blank" href="{url}">{name}</a>'
 
-def calculate_distance_and_time(gmaps, start_coords, end_coords):
-    modes = ["transit", "driving", "walking"]
-    mode_names = {
-        "transit": "公共交通機関",
-        "driving": "車",
-        "walking": "徒歩"
+def commute_destinations(filtered_df):
+    located = filtered_df.dropna(subset=['緯度', '経度'])
+    return dict(zip(located['property_id'], zip(located['緯度'], located['経度'])))
+
+def lookup_commutes(filtered_df, workplace_coords):
+    if not workplace_coords:
+        return {}
+    return commute.get_service().lookup(workplace_coords, commute_destinations(filtered_df))
+
+def display_results_table(filtered_df, commutes):
+    columns = [column for column in ['名称', 'アドレス', '家賃', '間取り', '面積', '階数', '物件詳細URL'] if column in filtered_df.columns]
+    table = filtered_df[columns].copy()
+    if commutes:
+        table['通勤時間'] = [commutes.get(property_id, commute.NO_RESULT)[1] for property_id in filtered_df['property_id']]
+    st.dataframe(
+        table,
+        column_config={"物件詳細URL": st.column_config.LinkColumn("物件詳細URL", display_text="リンク")},
+        hide_index=True,
+    )
+
+def nearby_pois(filtered_df, poi_indexes):
+    # 表示中の物件から POI_RADIUS_M 以内にある施設だけを地図に載せる
+    poi_layers = {}
+    for name, index in poi_indexes.items():
+        positions = index.union_within(filtered_df['緯度'], filtered_df['経度'], POI_RADIUS_M)
+        poi_layers[name] = index.frame.iloc[positions]
+    return poi_layers
+
+def create_map(filtered_df, commutes, poi_layers):
+    return map_builder.render_map_html(filtered_df, commutes, poi_layers)
+
+def display_stage_timings(stages):
+    with st.expander('処理時間'):
+        for stage, timing in stages.timings().items():
+            status = '計算' if timing['recomputed'] else '再利用'
+            st.write(f"{stage}: {status} {timing['sec'] * 1000:.1f}ms")
+    stages.log_timings('物件検索')
+
+def count_amenities(filtered_df, poi_indexes):
+    return {
+        name: pd.Series(index.count_within(filtered_df['緯度'], filtered_df['経度'], POI_RADIUS_M), index=filtered_df.index)
+        for name, index in poi_indexes.items()
     }
-    for mode in modes:
-        try:
-            result = gmaps.distance_matrix(start_coords, end_coords, mode=mode)
-            if 'rows' in result and result['rows']:
-                elements = result['rows'][0]['elements']
-                if elements and 'distance' in elements[0] and 'duration' in elements[0]:
-                    distance = elements[0]['distance']['text']
-                    duration = elements[0]['duration']['text']
-                    return distance, duration, mode_names[mode]
-                elif elements and elements[0]['status'] == 'ZERO_RESULTS':
-                    continue
-        except googlemaps.exceptions.ApiError as e:
-            st.error(f"Google Maps API error: {e}")
-        except Exception as e:
-            st.error(f"Error calculating distance and time: {e}")
-    return None, None, None
-
-def create_map(filtered_df, workplace_coords, show_supermarkets, supermarket_df=None, show_convenience_stores=False, convenience_store_df=None, show_banks=False, bank_df=None, show_cafes=False, cafe_df=None):
-    map_center = [filtered_df['緯度'].mean(), filtered_df['経度'].mean()]
-    m = folium.Map(location=map_center, zoom_start=12)
-    gmaps = googlemaps.Client(key=GOOGLE_MAPS_API_KEY)
-    
-    for idx, row in filtered_df.iterrows():
-        if pd.notnull(row['緯度']) and pd.notnull(row['経度']):
-            popup_html = f"""
-            <b>名称:</b> {row['名称']}<br>
-            <b>アドレス:</b> {row['アドレス']}<br>
-            <b>家賃:</b> {row['家賃']}万円<br>
-            <b>間取り:</b> {row['間取り']}<br>
-            <a href="{row['物件詳細URL']}" target="_blank">物件詳細</a>
-            """
-            if workplace_coords:
-                distance, duration, mode = calculate_distance_and_time(gmaps, workplace_coords, (row['緯度'], row['経度']))
-                if distance and duration:
-                    popup_html += f"""
-                    <b>勤務地までの距離:</b> {distance}<br>
-                    <b>勤務地までの時間:</b> {duration}<br>
-                    <b>交通手段:</b> {mode}<br>
-                    """
-
-            popup = folium.Popup(popup_html, max_width=400)
-            folium.Marker(
-                [row['緯度'], row['経度']],
-                popup=popup
-            ).add_to(m)
-    
-    if show_supermarkets and supermarket_df is not None:
-        filtered_supermarket_df = supermarket_df[supermarket_df['区'].isin(filtered_df['区'].unique())]
-        for idx, row in filtered_supermarket_df.iterrows():
-            if pd.notnull(row['Latitude']) and pd.notnull(row['Longitude']):
-                popup_html = f"""
-                <b>店舗名称:</b> {row['店舗名称']}<br>
-                """
-                popup = folium.Popup(popup_html, max_width=200)
-                folium.Marker(
-                    [row['Latitude'], row['Longitude']],
-                    popup=popup,
-                    icon=folium.Icon(color='green', icon='shopping-cart')
-                ).add_to(m)
-    
-    if show_convenience_stores and convenience_store_df is not None:
-        filtered_convenience_store_df = convenience_store_df[convenience_store_df['区'].isin(filtered_df['区'].unique())]
-        for idx, row in filtered_convenience_store_df.iterrows():
-            if pd.notnull(row['Latitude']) and pd.notnull(row['Longitude']):
-                popup_html = f"""
-                <b>店舗名称:</b> {row['店舗名称']}<br>
-                """
-                popup = folium.Popup(popup_html, max_width=200)
-                folium.Marker(
-                    [row['Latitude'], row['Longitude']],
-                    popup=popup,
-                    icon=folium.Icon(color='orange', icon='info-sign')
-                ).add_to(m)
-    
-    if show_banks and bank_df is not None:
-        filtered_bank_df = bank_df[bank_df['区'].isin(filtered_df['区'].unique())]
-        for idx, row in filtered_bank_df.iterrows():
-            if pd.notnull(row['Latitude']) and pd.notnull(row['Longitude']):
-                popup_html = f"""
-                <b>店舗名称:</b> {row['店舗名称']}<br>
-                """
-                popup = folium.Popup(popup_html, max_width=200)
-                folium.Marker(
-                    [row['Latitude'], row['Longitude']],
-                    popup=popup,
-                    icon=folium.Icon(color='red', icon='usd')
-                ).add_to(m)
-    
-    if show_cafes and cafe_df is not None:
-        filtered_cafe_df = cafe_df[cafe_df['区'].isin(filtered_df['区'].unique())]
-        for idx, row in filtered_cafe_df.iterrows():
-            if pd.notnull(row['Latitude']) and pd.notnull(row['Longitude']):
-                popup_html = f"""
-                <b>店舗名称:</b> {row['店舗名称']}<br>
-                """
-                popup = folium.Popup(popup_html, max_width=200)
-                folium.Marker(
-                    [row['Latitude'], row['Longitude']],
-                    popup=popup,
-                    icon=folium.Icon(color='purple', icon='coffee')
-                ).add_to(m)
-    
-    return m
 
-def display_search_results(filtered_df, workplace_coords):
-    gmaps = googlemaps.Client(key=GOOGLE_MAPS_API_KEY)
-    
+def display_search_results(filtered_df, workplace_coords, commutes, amenities):
     for idx, row in filtered_df.iterrows():
-        st.write(f"### 物件番号: {idx+1}")
+        st.write(f"### 物件番号: {row['property_id']}")
         st.write(f"**名称:** {row['名称']}")
         st.write(f"**アドレス:** {row['アドレス']}")
         st.write(f"**階数:** {row['階数']}")
@@ -151,53 +93,32 @@ def display_search_results(filtered_df, workplace_coords):
         if pd.notnull(row['物件画像URL']) and pd.notnull(row['間取画像URL']):
             col1, col2 = st.columns(2)
             with col1:
-                st.image(row['物件画像URL'], width=300)
+                st.image(image_cache.thumbnail(row['物件画像URL']), width=300)
             with col2:
-                st.image(row['間取画像URL'], width=300)
+                st.image(image_cache.thumbnail(row['間取画像URL']), width=300)
         elif pd.notnull(row['物件画像URL']):
-            st.image(row['物件画像URL'], width=300)
+            st.image(image_cache.thumbnail(row['物件画像URL']), width=300)
         elif pd.notnull(row['間取画像URL']):
-            st.image(row['間取画像URL'], width=300)
+            st.image(image_cache.thumbnail(row['間取画像URL']), width=300)
         
         if workplace_coords:
-            distance, duration, mode = calculate_distance_and_time(gmaps, workplace_coords, (row['緯度'], row['経度']))
+            distance, duration, mode = commutes.get(row['property_id'], commute.NO_RESULT)
             if distance and duration:
                 st.write(f"**勤務先までの距離:** {distance}")
                 st.write(f"**通勤時間の目安:** {duration}（交通手段: {mode}）")
             else:
                 st.write("**勤務地までの距離と時間の計算に失敗しました。**")
 
-        if st.button(f"お気に入り登録", key=f"favorite_{idx+1}"):
-            save_favorite_property(st.session_state['username'], idx+1)
-            st.success(f"{row['名称']}をお気に入りに追加しました")
-        st.write("---")
-
-def save_favorite_property(username, property_id):
-    creds = get_credentials()
-    client = gspread.authorize(creds)
-    sheet = client.open_by_key(SPREADSHEET_DB_ID).worksheet("お気に入りDB")
-    sheet.append_row([username, property_id])
+        if amenities:
+            counts = " / ".join(f"{name} {int(amenity_counts[idx])}件" for name, amenity_counts in amenities.items())
+            st.write(f"**周辺施設 (半径{POI_RADIUS_M}m):** {counts}")
 
-def get_favorite_properties(username):
-    creds = get_credentials()
-    client = gspread.authorize(creds)
-    sheet = client.open_by_key(SPREADSHEET_DB_ID).worksheet("お気に入りDB")
-    records = sheet.get_all_records()
-    fav_df = pd.DataFrame(records)
-    properties = fav_df[fav_df['username'] == username]['property_id'].tolist()
-    return properties
-
-def remove_favorite_property(username, property_id):
-    creds = get_credentials()
-    client = gspread.authorize(creds)
-    sheet = client.open_by_key(SPREADSHEET_DB_ID).worksheet("お気に入りDB")
-    records = sheet.get_all_records()
-    fav_df = pd.DataFrame(records)
-    fav_df = fav_df[(fav_df['username'] != username) | (fav_df['property_id'] != property_id)]
-    sheet.clear()
-    sheet.append_row(["username", "property_id"])
-    for index, row in fav_df.iterrows():
-        sheet.append_row([row['username'], row['property_id']])
+        if st.button(f"お気に入り登録", key=f"favorite_{row['property_id']}"):
+            if favorites.get_repository().add(st.session_state['username'], row['property_id']):
+                st.success(f"{row['名称']}をお気に入りに追加しました")
+            else:
+                st.info(f"{row['名称']}はお気に入りに登録済みです")
+        st.write("---")
 
 def main():
     st.title("物件検索")
@@ -207,13 +128,18 @@ def main():
         st.write("ログインページへ移動")
         return
 
-    df = load_data_from_gsheet(SPREADSHEET_DB_ID, "物件DB")
-    df = preprocess_dataframe(df)
-
-    supermarket_df = load_data_from_gsheet(SPREADSHEET_DB_ID, "スーパーDB")
-    convenience_store_df = load_data_from_gsheet(SPREADSHEET_DB_ID, "コンビニDB")
-    bank_df = load_data_from_gsheet(SPREADSHEET_DB_ID, "銀行DB")
-    cafe_df = load_data_from_gsheet(SPREADSHEET_DB_ID, "カフェDB")
+    frames = frame_cache.get_frames({
+        "物件DB": build_property_store,
+        "スーパーDB": build_poi_index,
+        "コンビニDB": build_poi_index,
+        "銀行DB": build_poi_index,
+        "カフェDB": build_poi_index,
+    })
+    store = frames["物件DB"]
+    df = store.frame
+    # 入力ごとの各段階の結果をセッションに覚えておき、変わった入力に依存する段階だけ計算し直す
+    stages = stage_cache.get_session_cache(st.session_state)
+    stages.begin()
 
     with st.sidebar:
         area = st.radio('■ エリア選択', df['区'].unique())
@@ -226,14 +152,16 @@ def main():
             format='%.1f'
         )
         type_options = st.multiselect('■ 間取り選択', df['間取り'].unique(), default=['1K', '1LDK', '2LDK'])
-        workplace_address = st.text_input("■ 現在の勤務地住所を入力")
+        # 入力途中の住所でジオコーディングしないよう、確定ボタンを押したときだけ反映する
+        with st.form('workplace_form'):
+            address_input = st.text_input("■ 現在の勤務地住所を入力", value=st.session_state.get('workplace_address', ""))
+            if st.form_submit_button('勤務地を設定'):
+                st.session_state['workplace_address'] = address_input
+        workplace_address = st.session_state.get('workplace_address', "")
         workplace_coords = None
         if workplace_address:
-            gmaps = googlemaps.Client(key=GOOGLE_MAPS_API_KEY)
             try:
-                geocode_result = gmaps.geocode(workplace_address)
-                if geocode_result:
-                    workplace_coords = (geocode_result[0]['geometry']['location']['lat'], geocode_result[0]['geometry']['location']['lng'])
+                workplace_coords = geocode.get_geocoder().geocode(workplace_address)
             except googlemaps.exceptions.ApiError as e:
                 st.error(f"Google Maps API error: {e}")
             except Exception as e:
@@ -245,37 +173,69 @@ def main():
         show_cafes = st.checkbox("カフェ", value=False)
 
         if st.button('検索＆更新', key='search_button'):
-            st.session_state['filtered_df'] = df[(df['区'].isin([area])) & (df['間取り'].isin(type_options))]
-            st.session_state['filtered_df'] = st.session_state['filtered_df'][(st.session_state['filtered_df']['家賃'] >= price_min) & (st.session_state['filtered_df']['家賃'] <= price_max)]
-            st.session_state['filtered_df2'] = st.session_state['filtered_df'].dropna(subset=['緯度', '経度'])
+            st.session_state['search_params'] = (area, tuple(type_options), price_min, price_max)
             st.session_state['search_clicked'] = True
             st.session_state['selected_property'] = None
+            st.session_state['result_page'] = 1
 
     if st.session_state.get('search_clicked', False):
-        filtered_count = len(st.session_state['filtered_df'])
+        search_params = st.session_state['search_params']
+        # 物件DB を読み込み直したら store が変わるので、キーには store そのものを含める
+        filter_key = (store, search_params)
+        searched_df, filtered_df2 = stages.get('絞り込み', filter_key, lambda: run_search(store, search_params))
+        workplace_key = tuple(workplace_coords) if workplace_coords else None
+        filtered_count = len(searched_df)
         total_count = len(df)
         st.write(f"物件検索数: {filtered_count}件 / 全{total_count}件")
 
-        filtered_df2 = st.session_state.get('filtered_df2', st.session_state['filtered_df'])
-        m = create_map(
-            filtered_df2,
-            workplace_coords,
-            show_supermarkets,
-            supermarket_df,
-            show_convenience_stores,
-            convenience_store_df,
-            show_banks,
-            bank_df,
-            show_cafes,
-            cafe_df
-        )
-        folium_static(m)
-
         selected_property = st.session_state.get('selected_property', None)
-        if selected_property is not None:
-            display_search_results(selected_property, workplace_coords)
+        filtered_df = selected_property if selected_property is not None else searched_df
+
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            sort_option = st.selectbox('並べ替え', list(pagination.SORT_OPTIONS), key='result_sort')
+        with col2:
+            page_size = st.selectbox('表示件数', pagination.PAGE_SIZES, key='result_page_size')
+        with col3:
+            compact = st.toggle('一覧表で表示', key='result_compact')
+
+        # 通勤時間順のときだけ全件の通勤時間を求め、それ以外は表示中のページ分だけ求める
+        commute_seconds = None
+        if workplace_coords and pagination.needs_all_commutes(sort_option):
+            commute_seconds = stages.get('通勤時間(全件)', (filter_key, workplace_key), lambda: commute.get_service().durations(
+                workplace_coords, commute_destinations(filtered_df)))
+        sort_key = (filter_key, sort_option, workplace_key if commute_seconds is not None else None)
+        sorted_df = stages.get('並べ替え', sort_key, lambda: pagination.sort_results(filtered_df, sort_option, commute_seconds))
+        page_total = pagination.page_count(len(sorted_df), page_size)
+        if st.session_state.get('result_page', 1) > page_total:
+            st.session_state['result_page'] = page_total
+        page = st.number_input(f'ページ (全{page_total}ページ)', min_value=1, max_value=page_total, step=1, key='result_page')
+        page_df, page = pagination.paginate(sorted_df, page, page_size)
+
+        page_key = (tuple(page_df['property_id']), workplace_key)
+        commutes = stages.get('通勤時間', page_key, lambda: lookup_commutes(page_df, workplace_coords))
+        poi_indexes = {
+            name: frames[sheet_name]
+            for name, sheet_name, show in [
+                ("スーパー", "スーパーDB", show_supermarkets),
+                ("コンビニ", "コンビニDB", show_convenience_stores),
+                ("銀行", "銀行DB", show_banks),
+                ("カフェ", "カフェDB", show_cafes),
+            ]
+            if show
+        }
+        poi_key = tuple(poi_indexes.items())
+        poi_layers = stages.get('周辺施設', (filter_key, poi_key), lambda: nearby_pois(filtered_df2, poi_indexes))
+        map_html = stages.get('地図', (filter_key, page_key, poi_key), lambda: create_map(filtered_df2, commutes, poi_layers))
+        components.html(map_html, height=510, width=700)
+
+        if compact:
+            display_results_table(page_df, commutes)
         else:
-            display_search_results(st.session_state['filtered_df'], workplace_coords)
+            amenities = stages.get('施設数', (page_key, poi_key), lambda: count_amenities(page_df, poi_indexes))
+            display_search_results(page_df, workplace_coords, commutes, amenities)
+            prefetch_next_page(sorted_df, page, page_size)
+        display_stage_timings(stages)
 
 if __name__ == '__main__':
     main()
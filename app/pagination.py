@@ -0,0 +1,44 @@
+import math
+import pandas as pd
+
+# 検索結果の並べ替えとページ分割。
+
+SORT_OPTIONS = {
+    "標準": None,
+    "家賃が安い順": ("家賃", True),
+    "家賃が高い順": ("家賃", False),
+    "面積が広い順": ("面積", False),
+    "通勤時間が短い順": ("通勤時間", True),
+}
+PAGE_SIZES = [10, 20, 50, 100]
+
+
+def needs_all_commutes(sort_option):
+    return SORT_OPTIONS.get(sort_option) == ("通勤時間", True)
+
+
+def sort_results(df, sort_option, commute_seconds=None):
+    """commute_seconds: {property_id: 秒}。通勤時間順のときのみ使う"""
+    option = SORT_OPTIONS.get(sort_option)
+    if option is None or df.empty:
+        return df
+    column, ascending = option
+    if column == "通勤時間":
+        keys = df['property_id'].map(commute_seconds or {})
+    elif column in df.columns:
+        keys = pd.to_numeric(df[column], errors='coerce')
+    else:
+        return df
+    order = keys.reset_index(drop=True).sort_values(ascending=ascending, na_position='last', kind='stable').index
+    return df.iloc[order]
+
+
+def page_count(total, page_size):
+    return max(1, math.ceil(total / page_size))
+
+
+def paginate(df, page, page_size):
+    """1始まりの page 番目の行を返す。範囲外のページは最後のページに丸める"""
+    page = min(max(1, page), page_count(len(df), page_size))
+    start = (page - 1) * page_size
+    return df.iloc[start:start + page_size], page
@@ -0,0 +1,199 @@
+import os
+import hmac
+import json
+import time
+import base64
+import hashlib
+import argparse
+import threading
+
+# パスワードのハッシュ化。ユーザーごとのソルト付きで scrypt か PBKDF2 を使う。
+# 保存形式は "アルゴリズム$パラメータ...$ソルト$ハッシュ" で、パラメータごと保存するので
+# 作業量を変えても古い行はそのまま検証でき、次のログイン時に新しい設定で作り直す。
+# ソルトなし SHA-256 の16進文字列(従来の形式)も検証でき、ログイン時に作り直す。
+# 作業量は `python -m passwords --target-ms 250` でこのマシンに合わせて決め、プロファイルに保存する。
+
+PROFILE_PATH = os.path.join(".cache", "password_profile.json")
+SALT_BYTES = 16
+
+
+def _b64encode(data):
+    return base64.b64encode(data).decode("ascii").rstrip("=")
+
+
+def _b64decode(text):
+    return base64.b64decode(text + "=" * (-len(text) % 4))
+
+
+class Pbkdf2Hasher:
+    algorithm = "pbkdf2_sha256"
+
+    def __init__(self, iterations=600_000):
+        self.iterations = iterations
+
+    def encode(self, password, salt=None):
+        salt = salt or os.urandom(SALT_BYTES)
+        digest = hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), salt, self.iterations)
+        return f"{self.algorithm}${self.iterations}${_b64encode(salt)}${_b64encode(digest)}"
+
+    def verify(self, password, encoded):
+        _, iterations, salt, digest = encoded.split("$")
+        actual = hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), _b64decode(salt), int(iterations))
+        return hmac.compare_digest(actual, _b64decode(digest))
+
+    def is_current(self, encoded):
+        return encoded.split("$")[1] == str(self.iterations)
+
+    def profile(self):
+        return {"algorithm": self.algorithm, "iterations": self.iterations}
+
+
+class ScryptHasher:
+    algorithm = "scrypt"
+
+    def __init__(self, n=2 ** 14, r=8, p=1):
+        self.n = n
+        self.r = r
+        self.p = p
+
+    def _derive(self, password, salt, n, r, p):
+        return hashlib.scrypt(password.encode("utf-8"), salt=salt, n=n, r=r, p=p,
+                              maxmem=256 * n * r + 1024 * 1024, dklen=32)
+
+    def encode(self, password, salt=None):
+        salt = salt or os.urandom(SALT_BYTES)
+        digest = self._derive(password, salt, self.n, self.r, self.p)
+        return f"{self.algorithm}${self.n}${self.r}${self.p}${_b64encode(salt)}${_b64encode(digest)}"
+
+    def verify(self, password, encoded):
+        _, n, r, p, salt, digest = encoded.split("$")
+        actual = self._derive(password, _b64decode(salt), int(n), int(r), int(p))
+        return hmac.compare_digest(actual, _b64decode(digest))
+
+    def is_current(self, encoded):
+        return encoded.split("$")[1:4] == [str(self.n), str(self.r), str(self.p)]
+
+    def profile(self):
+        return {"algorithm": self.algorithm, "n": self.n, "r": self.r, "p": self.p}
+
+
+class LegacySha256Hasher:
+    """従来の make_hashes と同じソルトなし SHA-256。検証のみに使う"""
+    algorithm = "sha256"
+
+    @staticmethod
+    def matches(encoded):
+        return len(encoded) == 64 and "$" not in encoded
+
+    def verify(self, password, encoded):
+        return hmac.compare_digest(hashlib.sha256(password.encode("utf-8")).hexdigest(), encoded)
+
+
+HASHERS = {Pbkdf2Hasher.algorithm: Pbkdf2Hasher, ScryptHasher.algorithm: ScryptHasher}
+
+
+def hasher_from_profile(profile):
+    params = dict(profile)
+    return HASHERS[params.pop("algorithm")](**{key: value for key, value in params.items() if key != "ms"})
+
+
+class PasswordHasher:
+    """新しいハッシュは hasher で作り、検証は保存形式のアルゴリズムで行う"""
+
+    def __init__(self, hasher=None):
+        self.hasher = hasher or ScryptHasher()
+        self._legacy = LegacySha256Hasher()
+
+    def _hasher_for(self, encoded):
+        if LegacySha256Hasher.matches(encoded):
+            return self._legacy
+        algorithm = encoded.split("$", 1)[0]
+        if algorithm == self.hasher.algorithm:
+            return self.hasher
+        return HASHERS[algorithm]()
+
+    def hash(self, password):
+        return self.hasher.encode(password)
+
+    def verify(self, password, encoded):
+        if not encoded:
+            return False
+        try:
+            return self._hasher_for(encoded).verify(password, encoded)
+        except (KeyError, ValueError):
+            return False
+
+    def needs_rehash(self, encoded):
+        return (LegacySha256Hasher.matches(encoded)
+                or encoded.split("$", 1)[0] != self.hasher.algorithm
+                or not self.hasher.is_current(encoded))
+
+    def verify_and_update(self, password, encoded):
+        """(一致したか, 作り直したハッシュ) を返す。作り直す必要がなければ2つ目は None"""
+        if not self.verify(password, encoded):
+            return False, None
+        return True, (self.hash(password) if self.needs_rehash(encoded) else None)
+
+
+def calibrate(algorithm="scrypt", target_ms=250, samples=3):
+    """1回の検証が target_ms を超えない範囲で最大の作業量を探す"""
+    def measure(hasher):
+        salt = os.urandom(SALT_BYTES)
+        start = time.perf_counter()
+        for _ in range(samples):
+            hasher.encode("calibration", salt)
+        return (time.perf_counter() - start) / samples * 1000
+
+    if algorithm == "scrypt":
+        best, n = ScryptHasher(n=2 ** 12), 2 ** 13
+        while n <= 2 ** 20 and measure(ScryptHasher(n=n)) <= target_ms:
+            best, n = ScryptHasher(n=n), n * 2
+    else:
+        # PBKDF2 の所要時間は回数に比例する
+        ms = measure(Pbkdf2Hasher(iterations=100_000))
+        best = Pbkdf2Hasher(iterations=max(int(100_000 * target_ms / ms) // 1000 * 1000, 100_000))
+    return dict(best.profile(), ms=round(measure(best), 1))
+
+
+def load_profile(path=None):
+    path = path or os.getenv("PASSWORD_PROFILE_PATH", PROFILE_PATH)
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def save_profile(profile, path=None):
+    path = path or os.getenv("PASSWORD_PROFILE_PATH", PROFILE_PATH)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(profile, f, ensure_ascii=False, indent=2)
+
+
+_hasher = None
+_hasher_lock = threading.Lock()
+
+
+def get_hasher():
+    global _hasher
+    with _hasher_lock:
+        if _hasher is None:
+            profile = load_profile()
+            _hasher = PasswordHasher(hasher_from_profile(profile) if profile else None)
+        return _hasher
+
+
+def main():
+    parser = argparse.ArgumentParser(description="このマシンでのパスワードハッシュの作業量を決めて保存する")
+    parser.add_argument("--algorithm", choices=sorted(HASHERS), default="scrypt")
+    parser.add_argument("--target-ms", type=float, default=250)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+    profile = calibrate(args.algorithm, args.target_ms)
+    save_profile(profile, args.output)
+    print(json.dumps(profile, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+import frame_cache
+
+# 物件DB を property_id で引くための索引。
+# frame_cache 上に property_id をインデックスにした DataFrame と、
+# property_id -> レコード(dict) の辞書を1つだけ持ち、全ページで共有する。
+
+SHEET_NAME = "物件DB"
+
+
+class PropertyIndex:
+    def __init__(self, frame):
+        if 'property_id' in frame.columns:
+            frame = frame.drop_duplicates(subset='property_id', keep='first')
+            self.frame = frame.set_index('property_id', drop=False)
+        else:
+            self.frame = frame.iloc[0:0]
+        self.records = dict(zip(self.frame.index, self.frame.to_dict('records')))
+
+    def __len__(self):
+        return len(self.frame)
+
+    def __contains__(self, property_id):
+        return property_id in self.frame.index
+
+    @property
+    def nbytes(self):
+        return int(self.frame.memory_usage(index=True, deep=True).sum())
+
+    def get(self, property_id):
+        return self.records.get(property_id)
+
+    def get_many(self, property_ids):
+        """{property_id: レコード} を property_ids の順に返す。物件DB にない id は除く"""
+        return {property_id: self.records[property_id] for property_id in property_ids if property_id in self.records}
+
+    def frame_for(self, property_ids):
+        """property_ids の順に詳細の DataFrame を返す。物件DB にない id は除く"""
+        present = [property_id for property_id in property_ids if property_id in self.frame.index]
+        return self.frame.loc[present]
+
+
+def build_property_index(frame):
+    return PropertyIndex(frame)
+
+
+def get_index():
+    return frame_cache.get_frame(SHEET_NAME, build_property_index)
+
+
+def get(property_id):
+    return get_index().get(property_id)
+
+
+def get_many(property_ids):
+    return get_index().get_many(property_ids)
@@ -0,0 +1,72 @@
+import numpy as np
+import pandas as pd
+
+# 物件DB を検索用の列指向データに変換して保持するストア。
+# 区・間取りはカテゴリコード、家賃・緯度・経度は float32 で持ち、
+# 区ごとの家賃順のインデックスでエリア・間取り・家賃の条件を絞り込む。
+
+
+class PropertyStore:
+    def __init__(self, frame):
+        self.frame = frame
+        wards = pd.Categorical(self.frame["区"].astype(str))
+        layouts = pd.Categorical(self.frame["間取り"].astype(str))
+        self.wards = list(wards.categories)
+        self.layouts = list(layouts.categories)
+        self._ward_lookup = {ward: code for code, ward in enumerate(self.wards)}
+        self._layout_lookup = {layout: code for code, layout in enumerate(self.layouts)}
+        self.ward_codes = wards.codes.astype(np.int16)
+        self.layout_codes = layouts.codes.astype(np.int16)
+        self.rent = pd.to_numeric(self.frame["家賃"], errors="coerce").to_numpy(dtype=np.float32)
+        self.lat = _float32_column(self.frame, "緯度")
+        self.lng = _float32_column(self.frame, "経度")
+
+        # 全体の家賃順インデックス
+        self.rent_order = np.argsort(self.rent, kind="stable").astype(np.int32)
+        self.sorted_rent = self.rent[self.rent_order]
+
+        # 区内の家賃順インデックス
+        self.ward_rent_index = {}
+        for code in range(len(self.wards)):
+            mask = self.ward_codes[self.rent_order] == code
+            positions = self.rent_order[mask]
+            self.ward_rent_index[code] = (positions, self.rent[positions])
+
+    def __len__(self):
+        return len(self.frame)
+
+    @property
+    def nbytes(self):
+        arrays = [self.ward_codes, self.layout_codes, self.rent, self.lat, self.lng,
+                  self.rent_order, self.sorted_rent]
+        index_bytes = sum(positions.nbytes + rents.nbytes for positions, rents in self.ward_rent_index.values())
+        frame_bytes = int(self.frame.memory_usage(index=True, deep=True).sum())
+        return sum(array.nbytes for array in arrays) + index_bytes + frame_bytes
+
+    def query_positions(self, area=None, layouts=None, price_min=None, price_max=None):
+        """条件に合う行番号を元の並び順で返す"""
+        if area is not None:
+            if area not in self._ward_lookup:
+                return np.empty(0, dtype=np.int32)
+            positions, rents = self.ward_rent_index[self._ward_lookup[area]]
+        else:
+            positions, rents = self.rent_order, self.sorted_rent
+
+        lo = 0 if price_min is None else np.searchsorted(rents, np.float32(price_min), side="left")
+        hi = len(rents) if price_max is None else np.searchsorted(rents, np.float32(price_max), side="right")
+        positions = positions[lo:hi]
+
+        if layouts is not None:
+            codes = [self._layout_lookup[layout] for layout in layouts if layout in self._layout_lookup]
+            positions = positions[np.isin(self.layout_codes[positions], codes)]
+        return np.sort(positions)
+
+    def query(self, area=None, layouts=None, price_min=None, price_max=None):
+        positions = self.query_positions(area, layouts, price_min, price_max)
+        return self.frame.iloc[positions]
+
+
+def _float32_column(frame, column):
+    if column not in frame.columns:
+        return np.full(len(frame), np.nan, dtype=np.float32)
+    return pd.to_numeric(frame[column], errors="coerce").to_numpy(dtype=np.float32)
@@ -0,0 +1,452 @@
+import os
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+from gspread.utils import numericise, numericise_all
+
+# Google スプレッドシートへのアクセスをプロセス全体で共有するモジュール。
+# 認証済みクライアント・スプレッドシート・ワークシートのハンドルを1度だけ作り、
+# 全ページから使い回す。SHEETS_BACKEND=local でGoogleを使わないローカル実装に切り替えられる。
+
+logger = logging.getLogger(__name__)
+
+
+class LatencyStats:
+    """ワークシート操作ごとの呼び出し回数と所要時間を集計する"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def record(self, op, elapsed):
+        with self._lock:
+            stat = self._stats.setdefault(op, {"calls": 0, "total_sec": 0.0, "max_sec": 0.0})
+            stat["calls"] += 1
+            stat["total_sec"] += elapsed
+            stat["max_sec"] = max(stat["max_sec"], elapsed)
+
+    def snapshot(self):
+        with self._lock:
+            result = {}
+            for op, stat in self._stats.items():
+                result[op] = dict(stat, avg_sec=stat["total_sec"] / stat["calls"])
+            return result
+
+    def total_calls(self):
+        with self._lock:
+            return sum(stat["calls"] for stat in self._stats.values())
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+
+class TimedWorksheet:
+    """ワークシートのメソッド呼び出しを計測するプロキシ"""
+
+    def __init__(self, worksheet, name, stats):
+        self._worksheet = worksheet
+        self._name = name
+        self._stats = stats
+
+    @property
+    def title(self):
+        return self._name
+
+    def __getattr__(self, attr):
+        value = getattr(self._worksheet, attr)
+        if not callable(value):
+            return value
+
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return value(*args, **kwargs)
+            finally:
+                self._stats.record(f"{self._name}.{attr}", time.perf_counter() - start)
+        return timed
+
+
+class GoogleSheetsBackend:
+    """gspread を使う本番用バックエンド"""
+
+    def __init__(self, spreadsheet_id, credentials_info, scopes, pool_size=16):
+        import gspread
+        from google.oauth2.service_account import Credentials
+        from requests.adapters import HTTPAdapter
+
+        creds = Credentials.from_service_account_info(credentials_info, scopes=scopes)
+        self.client = gspread.authorize(creds)
+        # gspread のバージョンによってセッションの場所が異なる
+        session = getattr(getattr(self.client, "http_client", self.client), "session", None)
+        if session is not None:
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            session.mount("https://", adapter)
+        self.spreadsheet_id = spreadsheet_id
+        self._spreadsheet = None
+        self._worksheets = None
+        self._lock = threading.Lock()
+
+    def spreadsheet(self):
+        with self._lock:
+            if self._spreadsheet is None:
+                self._spreadsheet = self.client.open_by_key(self.spreadsheet_id)
+            return self._spreadsheet
+
+    def worksheet(self, name):
+        spreadsheet = self.spreadsheet()
+        # 全シートのメタデータを1回で取得してタイトルで引く
+        with self._lock:
+            if self._worksheets is None:
+                self._worksheets = {ws.title: ws for ws in spreadsheet.worksheets()}
+            if name in self._worksheets:
+                return self._worksheets[name]
+        return spreadsheet.worksheet(name)
+
+    def batch_get(self, names):
+        # values:batchGet で複数シートの値を1リクエストで取得する
+        ranges = ["'{}'".format(name.replace("'", "''")) for name in names]
+        response = self.spreadsheet().values_batch_get(ranges)
+        value_ranges = response.get("valueRanges", [])
+        return {name: value_range.get("values", []) for name, value_range in zip(names, value_ranges)}
+
+
+class LocalWorksheet:
+    """gspread.Worksheet のうちアプリで使う操作だけを実装したメモリ上のシート"""
+
+    def __init__(self, title, rows=None, latency=0.0):
+        self.title = title
+        self.rows = [list(row) for row in (rows or [])]
+        self.latency = latency
+        self._lock = threading.Lock()
+
+    def _wait(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    @property
+    def row_count(self):
+        return len(self.rows)
+
+    def get_all_values(self):
+        self._wait()
+        with self._lock:
+            return [list(row) for row in self.rows]
+
+    def get_all_records(self):
+        values = self.get_all_values()
+        if not values:
+            return []
+        header = values[0]
+        records = []
+        for row in values[1:]:
+            row = row + [""] * (len(header) - len(row))
+            records.append(dict(zip(header, convert_row(row))))
+        return records
+
+    def row_values(self, row):
+        self._wait()
+        with self._lock:
+            return list(self.rows[row - 1]) if row <= len(self.rows) else []
+
+    def append_row(self, values, **kwargs):
+        self.append_rows([values])
+
+    def append_rows(self, values, **kwargs):
+        self._wait()
+        with self._lock:
+            self.rows.extend(list(row) for row in values)
+
+    def insert_row(self, values, index=1, **kwargs):
+        self._wait()
+        with self._lock:
+            self.rows.insert(index - 1, list(values))
+
+    def get(self, range_name, **kwargs):
+        # "A5:D" / "A5:D9" 形式の範囲を読む。gspread と同じく行末の空セルと末尾の空行は返さない
+        self._wait()
+        start, _, end = range_name.partition(":")
+        row, col = _parse_cell(start)
+        end_row, end_col = _parse_cell(end or start)
+        with self._lock:
+            rows = self.rows[(row or 1) - 1:end_row]
+        values = []
+        for source in rows:
+            cells = list(source[col:end_col + 1])
+            while cells and cells[-1] == "":
+                cells.pop()
+            values.append(cells)
+        while values and not values[-1]:
+            values.pop()
+        return values
+
+    def update(self, range_name, values, **kwargs):
+        # "A2:C2" 形式の範囲に値を書き込む
+        self._wait()
+        row, col = _parse_cell(range_name.split(":")[0])
+        with self._lock:
+            for r, row_values in enumerate(values, start=row - 1):
+                while len(self.rows) <= r:
+                    self.rows.append([])
+                target = self.rows[r]
+                for c, value in enumerate(row_values, start=col):
+                    while len(target) <= c:
+                        target.append("")
+                    target[c] = value
+
+    def delete_rows(self, start_index, end_index=None):
+        self._wait()
+        end_index = end_index or start_index
+        with self._lock:
+            del self.rows[start_index - 1:end_index]
+
+    def clear(self):
+        self._wait()
+        with self._lock:
+            self.rows = []
+
+
+def values_to_frame(values):
+    # get_all_values 形式の2次元配列を get_all_records と同じ型変換で DataFrame にする
+    if not values:
+        return pd.DataFrame()
+    header = values[0]
+    width = len(header)
+    rows = [convert_row((row + [""] * (width - len(row)))[:width]) for row in values[1:]]
+    return pd.DataFrame(rows, columns=header)
+
+
+def _column_index(letters):
+    index = 0
+    for letter in letters.upper():
+        index = index * 26 + (ord(letter) - ord("A") + 1)
+    return index - 1
+
+
+def _parse_cell(cell):
+    # "D5" -> (5, 3)。行を省略した "D" は最終行まで
+    letters = cell.rstrip("0123456789")
+    digits = cell[len(letters):]
+    return (int(digits) if digits else None), _column_index(letters)
+
+
+def column_letter(index):
+    # 0 -> "A", 26 -> "AA"
+    letters = ""
+    index += 1
+    while index:
+        index, rest = divmod(index - 1, 26)
+        letters = chr(ord("A") + rest) + letters
+    return letters
+
+
+class TailReader:
+    """追記されていくシートを、前回読んだ最終行から後ろだけ読み進める。
+    最終行の内容が前回と変わっていたら(他のプロセスで行の挿入・削除があったら)全体を読み直す。
+    全体を読むときに見出し行がなければ追加する
+    """
+
+    def __init__(self, header, normalize=None):
+        self.header = list(header)
+        self.normalize = normalize or self._pad
+        self.row_count = 0
+        self.last_row = None
+
+    def _pad(self, row):
+        return list(row[:len(self.header)]) + [""] * (len(self.header) - len(row))
+
+    def reset(self):
+        """次の read で全体を読ませる"""
+        self.row_count = 0
+        self.last_row = None
+
+    def read(self, sheet, full=False):
+        """(まだ読んでいない行, その先頭の行番号, 全体を読み直したか) を返す"""
+        if not full and self.row_count:
+            values = sheet.get(f"A{self.row_count}:{column_letter(len(self.header) - 1)}")
+            if values and self.normalize(values[0]) == self.last_row:
+                first_row = self.row_count + 1
+                self.row_count += len(values) - 1
+                self.last_row = self.normalize(values[-1])
+                return values[1:], first_row, False
+        values = sheet.get_all_values()
+        if not values or self.normalize(values[0]) != self.header:
+            sheet.insert_row(self.header, 1)
+            values = [self.header] + values
+        self.row_count = len(values)
+        self.last_row = self.normalize(values[-1])
+        return values[1:], 2, True
+
+    def appended(self, row):
+        """自分で1行追記したときに読み位置を進め、追記した行の行番号を返す"""
+        self.row_count += 1
+        self.last_row = self.normalize(row)
+        return self.row_count
+
+    def updated(self, row_number, row):
+        """自分で行を書き換えたとき、それが最終行なら比較用の内容も合わせる"""
+        if row_number == self.row_count:
+            self.last_row = self.normalize(row)
+
+
+def convert_row(values):
+    # gspread の get_all_records と同じ numericise で、数値に見える値を数値に変換する
+    return numericise_all(list(values))
+
+
+def convert_value(value):
+    return numericise(value)
+
+
+class LocalSheetsBackend:
+    """Google を使わずにベンチマーク・動作確認を行うためのメモリ上のバックエンド"""
+
+    def __init__(self, tables=None, latency=0.0, data_dir=None):
+        self.latency = latency
+        self._worksheets = {}
+        self._lock = threading.Lock()
+        if data_dir:
+            self._load_dir(data_dir)
+        for name, rows in (tables or {}).items():
+            self.add_worksheet(name, rows)
+
+    def _load_dir(self, data_dir):
+        # <シート名>.csv をシートとして読み込む
+        for filename in os.listdir(data_dir):
+            if filename.endswith(".csv"):
+                df = pd.read_csv(os.path.join(data_dir, filename), dtype=str, keep_default_na=False)
+                rows = [list(df.columns)] + df.values.tolist()
+                self.add_worksheet(filename[:-4], rows)
+
+    def add_worksheet(self, name, rows=None):
+        with self._lock:
+            self._worksheets[name] = LocalWorksheet(name, rows, self.latency)
+            return self._worksheets[name]
+
+    def worksheet(self, name):
+        with self._lock:
+            if name not in self._worksheets:
+                self._worksheets[name] = LocalWorksheet(name, latency=self.latency)
+            return self._worksheets[name]
+
+    def batch_get(self, names):
+        if self.latency:
+            time.sleep(self.latency)
+        result = {}
+        for name in names:
+            sheet = self.worksheet(name)
+            with sheet._lock:
+                result[name] = [list(row) for row in sheet.rows]
+        return result
+
+
+class SheetsClient:
+    """バックエンドの上にワークシートのハンドルキャッシュと計測を載せたクライアント"""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.stats = LatencyStats()
+        self._worksheets = {}
+        self._lock = threading.Lock()
+
+    def worksheet(self, name):
+        with self._lock:
+            if name not in self._worksheets:
+                start = time.perf_counter()
+                sheet = self.backend.worksheet(name)
+                self.stats.record(f"{name}.open", time.perf_counter() - start)
+                self._worksheets[name] = TimedWorksheet(sheet, name, self.stats)
+            return self._worksheets[name]
+
+    def load_frame(self, name):
+        return pd.DataFrame(self.worksheet(name).get_all_records())
+
+    def load_frames(self, names, max_workers=8):
+        """複数シートを DataFrame の辞書として読み込む。
+        バックエンドが batch_get に対応していれば1リクエスト、そうでなければスレッドで並列に取得する
+        """
+        names = list(names)
+        if not names:
+            return {}
+        if hasattr(self.backend, "batch_get"):
+            start = time.perf_counter()
+            try:
+                values = self.backend.batch_get(names)
+            except Exception:
+                logger.warning("batch_get に失敗したため、シートごとの読み込みに切り替えます: %s", names, exc_info=True)
+                values = None
+            finally:
+                self.stats.record("batch_get", time.perf_counter() - start)
+            if values is not None:
+                return {name: values_to_frame(values.get(name, [])) for name in names}
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(names))) as executor:
+            frames = executor.map(self.load_frame, names)
+            return dict(zip(names, frames))
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def _default_backend():
+    if os.getenv("SHEETS_BACKEND") == "local":
+        return LocalSheetsBackend(
+            data_dir=os.getenv("SHEETS_LOCAL_DIR"),
+            latency=float(os.getenv("SHEETS_LOCAL_LATENCY", "0")),
+        )
+    from config import SPREADSHEET_DB_ID, PRIVATE_KEY_PATH, scopes
+    return GoogleSheetsBackend(SPREADSHEET_DB_ID, PRIVATE_KEY_PATH, scopes)
+
+
+def get_client():
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = SheetsClient(_default_backend())
+        return _client
+
+
+def set_backend(backend):
+    # テストやベンチマークでバックエンドを差し替える
+    global _client
+    with _client_lock:
+        _client = SheetsClient(backend)
+        return _client
+
+
+def worksheet(name):
+    return get_client().worksheet(name)
+
+
+def load_frame(name):
+    return get_client().load_frame(name)
+
+
+def load_frames(names):
+    return get_client().load_frames(names)
+
+
+def latency_stats():
+    return get_client().stats.snapshot()
+
+
+class RenderTimer:
+    """ページ1回の描画で行ったシート操作の回数と時間を記録する。
+    集計はプロセス全体なので、同時に描画している他のセッションの操作も含まれる
+    """
+
+    def __init__(self, page_name):
+        self.page_name = page_name
+        self._stats = get_client().stats
+        self._calls = self._stats.total_calls()
+        self._start = time.perf_counter()
+
+    def finish(self):
+        result = {
+            "calls": self._stats.total_calls() - self._calls,
+            "sec": time.perf_counter() - self._start,
+        }
+        logger.info("%s: シート操作 %d回, %.3f秒", self.page_name, result["calls"], result["sec"])
+        return result
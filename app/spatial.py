@@ -0,0 +1,116 @@
+import math
+import numpy as np
+import pandas as pd
+
+# 周辺施設（スーパー・コンビニ・銀行・カフェ）の座標に対するグリッド型の空間インデックス。
+# 緯度経度を基準緯度での平面座標（メートル）に変換し、一定サイズのセルに振り分けておく。
+# 「各物件から半径 N m 以内の施設」「各物件に最も近い K 件」をまとめて求める。
+
+EARTH_RADIUS_M = 6371000.0
+
+
+class SpatialIndex:
+    def __init__(self, frame, lat_column="Latitude", lng_column="Longitude", cell_size_m=250.0):
+        self.frame = frame
+        self.cell_size = cell_size_m
+        lat = pd.to_numeric(frame[lat_column], errors="coerce").to_numpy(dtype=float) if len(frame) else np.empty(0)
+        lng = pd.to_numeric(frame[lng_column], errors="coerce").to_numpy(dtype=float) if len(frame) else np.empty(0)
+        valid = ~(np.isnan(lat) | np.isnan(lng))
+        self.ref_lat = float(np.mean(lat[valid])) if valid.any() else 35.68
+        self.positions = np.flatnonzero(valid)
+        self.x, self.y = self.project(lat[valid], lng[valid])
+
+        cx = np.floor(self.x / self.cell_size).astype(np.int64)
+        cy = np.floor(self.y / self.cell_size).astype(np.int64)
+        order = np.lexsort((cy, cx))
+        self.positions, self.x, self.y = self.positions[order], self.x[order], self.y[order]
+        cx, cy = cx[order], cy[order]
+        # セル -> (開始, 終了) の範囲
+        self.cells = {}
+        if len(cx):
+            boundaries = np.flatnonzero((np.diff(cx) != 0) | (np.diff(cy) != 0)) + 1
+            starts = np.concatenate(([0], boundaries))
+            ends = np.concatenate((boundaries, [len(cx)]))
+            for start, end in zip(starts, ends):
+                self.cells[(int(cx[start]), int(cy[start]))] = (int(start), int(end))
+
+    def __len__(self):
+        return len(self.frame)
+
+    @property
+    def nbytes(self):
+        return (self.positions.nbytes + self.x.nbytes + self.y.nbytes
+                + int(self.frame.memory_usage(index=True, deep=True).sum()))
+
+    def project(self, lat, lng):
+        lat = np.asarray(lat, dtype=float)
+        lng = np.asarray(lng, dtype=float)
+        x = np.radians(lng) * EARTH_RADIUS_M * math.cos(math.radians(self.ref_lat))
+        y = np.radians(lat) * EARTH_RADIUS_M
+        return x, y
+
+    def _candidates(self, x, y, rings):
+        # 調べるセル数が全セル数を超えるなら全件を候補にする
+        if (2 * rings + 1) ** 2 >= len(self.cells):
+            return np.arange(len(self.x))
+        cx = math.floor(x / self.cell_size)
+        cy = math.floor(y / self.cell_size)
+        ranges = []
+        for i in range(cx - rings, cx + rings + 1):
+            for j in range(cy - rings, cy + rings + 1):
+                cell = self.cells.get((i, j))
+                if cell is not None:
+                    ranges.append(np.arange(cell[0], cell[1]))
+        return np.concatenate(ranges) if ranges else np.empty(0, dtype=np.int64)
+
+    def within(self, lat, lng, radius_m):
+        """各点から半径 radius_m 以内の施設の行番号（frame 上の位置）のリストを返す"""
+        qx, qy = self.project(lat, lng)
+        rings = int(math.ceil(radius_m / self.cell_size))
+        results = []
+        for x, y in zip(qx, qy):
+            if np.isnan(x) or np.isnan(y):
+                results.append(np.empty(0, dtype=np.int64))
+                continue
+            candidates = self._candidates(x, y, rings)
+            d2 = (self.x[candidates] - x) ** 2 + (self.y[candidates] - y) ** 2
+            results.append(self.positions[candidates[d2 <= radius_m ** 2]])
+        return results
+
+    def count_within(self, lat, lng, radius_m):
+        return np.array([len(found) for found in self.within(lat, lng, radius_m)], dtype=np.int64)
+
+    def union_within(self, lat, lng, radius_m):
+        """いずれかの点から半径 radius_m 以内にある施設の行番号（重複なし）"""
+        found = self.within(lat, lng, radius_m)
+        if not found:
+            return np.empty(0, dtype=np.int64)
+        return np.unique(np.concatenate(found))
+
+    def nearest(self, lat, lng, k=1):
+        """各点に近い順に k 件の (行番号, 距離m) を返す。足りない分は -1 / inf で埋める"""
+        qx, qy = self.project(lat, lng)
+        indices = np.full((len(qx), k), -1, dtype=np.int64)
+        distances = np.full((len(qx), k), np.inf)
+        if not len(self.x):
+            return indices, distances
+        for row, (x, y) in enumerate(zip(qx, qy)):
+            if np.isnan(x) or np.isnan(y):
+                continue
+            rings = 1
+            while True:
+                candidates = self._candidates(x, y, rings)
+                d = np.sqrt((self.x[candidates] - x) ** 2 + (self.y[candidates] - y) ** 2)
+                # リング内で k 件見つかり、k 件目がリングの内接円より近ければ確定
+                if len(d) == len(self.x) or \
+                        (len(d) >= k and np.partition(d, k - 1)[k - 1] <= rings * self.cell_size):
+                    break
+                rings *= 2
+            order = np.argsort(d)[:k]
+            indices[row, :len(order)] = self.positions[candidates[order]]
+            distances[row, :len(order)] = d[order]
+        return indices, distances
+
+
+def build_poi_index(frame):
+    return SpatialIndex(frame)
@@ -0,0 +1,58 @@
+import time
+import logging
+from collections import OrderedDict
+
+# 1つのセッションの中で、検索ページの各段階(絞り込み・通勤時間・地図など)の結果を入力ごとに覚えておく。
+# 段階ごとに別々のキーで持つので、入力を1つ変えたときはそれに依存する段階だけが計算し直される。
+# 実際に計算したか・覚えていた結果を使ったかと所要時間を、描画ごとに timings() で確認できる。
+
+logger = logging.getLogger(__name__)
+
+
+class StageCache:
+    def __init__(self, max_entries=4):
+        self.max_entries = max_entries
+        self._stages = {}
+        self._timings = OrderedDict()
+
+    def begin(self):
+        """描画の始めに呼び、前回の描画の計測結果を捨てる"""
+        self._timings = OrderedDict()
+
+    def get(self, stage, key, compute):
+        entries = self._stages.setdefault(stage, OrderedDict())
+        start = time.perf_counter()
+        if key in entries:
+            entries.move_to_end(key)
+            value = entries[key]
+            recomputed = False
+        else:
+            value = compute()
+            entries[key] = value
+            while len(entries) > self.max_entries:
+                entries.popitem(last=False)
+            recomputed = True
+        self._timings[stage] = {"recomputed": recomputed, "sec": time.perf_counter() - start}
+        return value
+
+    def invalidate(self, stage=None):
+        if stage is None:
+            self._stages.clear()
+        else:
+            self._stages.pop(stage, None)
+
+    def timings(self):
+        return OrderedDict(self._timings)
+
+    def log_timings(self, page_name):
+        summary = ", ".join(
+            f"{stage}={'計算' if timing['recomputed'] else '再利用'} {timing['sec'] * 1000:.1f}ms"
+            for stage, timing in self._timings.items()
+        )
+        logger.info("%s: %s", page_name, summary)
+
+
+def get_session_cache(session_state, name="stage_cache", max_entries=4):
+    if name not in session_state:
+        session_state[name] = StageCache(max_entries)
+    return session_state[name]
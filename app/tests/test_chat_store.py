@@ -0,0 +1,99 @@
+import pytest
+
+import chat_store
+
+# SheetLog の差分読み込みと、自分が書いた行をシートから読み直したときに二重に数えないことを確かめる。
+# 実行方法: cd app && python -m pytest -q
+
+HEADER = chat_store.MESSAGE_HEADER
+
+
+@pytest.fixture
+def sheet(local_sheets):
+    return local_sheets.add_worksheet(chat_store.MESSAGE_SHEET, [HEADER])
+
+
+@pytest.fixture
+def log(sheet):
+    return chat_store.SheetLog(chat_store.MESSAGE_SHEET, HEADER, flush_interval=60)
+
+
+def texts(log, property_id=1):
+    return [record["text"] for record in log.records_for(property_id)]
+
+
+def test_append_is_readable_before_flush(log, sheet):
+    log.append(["2024-01-01 00:00:00", "alice", "こんにちは", 1])
+    assert texts(log) == ["こんにちは"]
+    assert sheet.rows == [HEADER]
+
+
+def test_flushed_rows_are_not_read_twice(log, sheet):
+    log.append(["2024-01-01 00:00:00", "alice", "こんにちは", 1])
+    assert log.flush() == 1
+    log.refresh(force=True)
+    assert texts(log) == ["こんにちは"]
+    assert len(sheet.rows) == 2
+
+
+def test_identical_row_from_another_writer_is_kept(log, sheet):
+    row = ["2024-01-01 00:00:00", "alice", "同じ内容", 1]
+    log.append(row)
+    log.flush()
+    sheet.append_rows([row])
+    log.refresh(force=True)
+    assert texts(log) == ["同じ内容", "同じ内容"]
+
+
+def test_delta_load_reads_only_new_rows(log, sheet):
+    log.refresh(force=True)
+    sheet.append_rows([["2024-01-01 00:00:00", "bob", "別のプロセス", 1],
+                       ["2024-01-01 00:00:01", "bob", "他の物件", 2]])
+    log.refresh(force=True)
+    stats = log.stats()
+    assert stats["full_loads"] == 1 and stats["delta_loads"] == 1
+    assert texts(log) == ["別のプロセス"] and texts(log, 2) == ["他の物件"]
+
+
+def test_deleted_row_triggers_full_reload(log, sheet):
+    sheet.append_rows([["2024-01-01 00:00:00", "bob", "消される", 2],
+                       ["2024-01-01 00:00:01", "bob", "残る", 1]])
+    log.refresh(force=True)
+    log.append(["2024-01-01 00:00:02", "alice", "未送信", 1])
+    sheet.delete_rows(3)
+    log.refresh(force=True)
+    assert log.stats()["full_loads"] == 2
+    assert texts(log) == ["未送信"] and texts(log, 2) == ["消される"]
+
+
+def test_numeric_looking_text_is_written_as_is(log, sheet):
+    log.append(["2024-01-01 00:00:00", "alice", "007", 1])
+    log.flush()
+    log.refresh(force=True)
+    assert sheet.rows[-1][2] == "007"
+    assert texts(log) == [7]
+
+
+def test_since_returns_only_new_records_until_reload(log, sheet):
+    records, cursor, reloaded = log.since(1)
+    assert records == [] and reloaded
+    log.append(["2024-01-01 00:00:00", "alice", "1件目", 1])
+    records, cursor, reloaded = log.since(1, cursor)
+    assert [record["text"] for record in records] == ["1件目"] and not reloaded
+
+    log.flush()
+    log.refresh(force=True)
+    sheet.rows.insert(1, ["2023-12-31 00:00:00", "bob", "前に挿入", 1])
+    log.mark_stale()
+    records, cursor, reloaded = log.since(1, cursor)
+    assert reloaded and [record["text"] for record in records] == ["前に挿入", "1件目"]
+    assert log.since(1, cursor) == ([], cursor, False)
+
+
+def test_rating_log_keeps_latest_per_rater(local_sheets):
+    local_sheets.add_worksheet(chat_store.RATING_SHEET, [chat_store.RATING_HEADER,
+                                                         ["2024-01-01 00:00:00", "alice", "3", "1"],
+                                                         ["2024-01-02 00:00:00", "alice", "4.5", "1"],
+                                                         ["2024-01-01 12:00:00", "bob", "2", "1"]])
+    latest = chat_store.RatingLog().latest_for(1)
+    assert latest.set_index("rater")["rating"].to_dict() == {"alice": 4.5, "bob": 2}
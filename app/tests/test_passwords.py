@@ -0,0 +1,64 @@
+import hashlib
+
+import pytest
+
+import passwords
+import users
+
+# 保存形式ごとの検証と、古い形式・古い作業量のハッシュをログイン時に作り直すことを確かめる。
+# テストを速くするため作業量は小さくする。
+# 実行方法: cd app && python -m pytest -q
+
+
+def legacy_hash(password):
+    return hashlib.sha256(password.encode("utf-8")).hexdigest()
+
+
+@pytest.fixture
+def hasher():
+    return passwords.PasswordHasher(passwords.ScryptHasher(n=2 ** 10))
+
+
+def test_hash_verifies_and_is_current(hasher):
+    encoded = hasher.hash("secret")
+    assert encoded.startswith("scrypt$1024$8$1$")
+    assert hasher.verify("secret", encoded) and not hasher.verify("wrong", encoded)
+    assert not hasher.needs_rehash(encoded)
+    assert hasher.hash("secret") != encoded
+
+
+def test_legacy_sha256_is_verified_and_rehashed(hasher):
+    ok, new_hash = hasher.verify_and_update("secret", legacy_hash("secret"))
+    assert ok and new_hash.startswith("scrypt$")
+    assert hasher.verify("secret", new_hash) and not hasher.needs_rehash(new_hash)
+
+
+def test_wrong_password_is_not_rehashed(hasher):
+    assert hasher.verify_and_update("wrong", legacy_hash("secret")) == (False, None)
+
+
+def test_other_algorithm_and_old_work_factor_are_rehashed(hasher):
+    pbkdf2 = passwords.Pbkdf2Hasher(iterations=1000).encode("secret")
+    weaker = passwords.ScryptHasher(n=2 ** 9).encode("secret")
+    for encoded in (pbkdf2, weaker):
+        ok, new_hash = hasher.verify_and_update("secret", encoded)
+        assert ok and new_hash is not None and not hasher.needs_rehash(new_hash)
+
+
+@pytest.mark.parametrize("encoded", ["", "unknown$1$2", "scrypt$broken", legacy_hash("secret")[:63]])
+def test_malformed_hash_does_not_verify(hasher, encoded):
+    assert not hasher.verify("secret", encoded)
+
+
+def test_login_rewrites_legacy_hash_in_sheet(local_sheets, hasher, monkeypatch):
+    monkeypatch.setattr(passwords, "_hasher", hasher)
+    sheet = local_sheets.add_worksheet(users.SHEET_NAME, [users.HEADER,
+                                                          ["alice", legacy_hash("secret")],
+                                                          ["bob", legacy_hash("other")]])
+    directory = users.UserDirectory()
+    assert not directory.authenticate("alice", "wrong")
+    assert sheet.rows[1][1] == legacy_hash("secret")
+    assert directory.authenticate("alice", "secret")
+    assert sheet.rows[1][1].startswith("scrypt$") and hasher.verify("secret", sheet.rows[1][1])
+    assert sheet.rows[2][1] == legacy_hash("other")
+    assert directory.authenticate("alice", "secret") and directory.stats()["rehashed"] == 1
@@ -0,0 +1,129 @@
+import time
+import logging
+import threading
+
+import sheets
+import passwords
+
+# ユーザーDB を username -> パスワードのハッシュ の索引で扱う。
+# 読み込みは sheets.TailReader で前回読んだ最終行から後ろだけを取得して索引に追加する。
+# 索引にないユーザー名は他のプロセスで登録された可能性があるので、差分を読み直してから判定する。
+# 同じユーザー名の行が複数あるときは最初の行だけを使い、後からの重複登録は受け付けない。
+# パスワードの検証は passwords に任せ、古い形式のハッシュはログインに成功したときに作り直して書き戻す。
+
+logger = logging.getLogger(__name__)
+
+SHEET_NAME = "ユーザーDB"
+HEADER = ["username", "password"]
+
+
+class UserDirectory:
+    def __init__(self, sheet_name=SHEET_NAME, refresh_interval=60, miss_refresh_interval=1.0):
+        self.sheet_name = sheet_name
+        self.refresh_interval = refresh_interval
+        self.miss_refresh_interval = miss_refresh_interval
+        self._lock = threading.RLock()
+        self._index = {}
+        self._rows = {}
+        self._tail = sheets.TailReader(HEADER, self._normalize)
+        self._loaded_at = None
+        self._stats = {"full_loads": 0, "delta_loads": 0, "lookups": 0, "rehashed": 0}
+
+    @property
+    def sheet(self):
+        return sheets.worksheet(self.sheet_name)
+
+    def _normalize(self, row):
+        return [str(value) for value in row[:2]] + [""] * (2 - len(row))
+
+    def _ingest(self, rows, first_row):
+        for row_number, row in enumerate(rows, start=first_row):
+            username, password = self._normalize(row)
+            if username and username not in self._index:
+                self._index[username] = password
+                self._rows[username] = row_number
+
+    def _load(self, full=False):
+        rows, first_row, full = self._tail.read(self.sheet, full)
+        if full:
+            self._index = {}
+            self._rows = {}
+        self._ingest(rows, first_row)
+        self._stats["full_loads" if full else "delta_loads"] += 1
+
+    def refresh(self, force=False):
+        with self._lock:
+            if not force and self._loaded_at is not None and time.monotonic() - self._loaded_at < self.refresh_interval:
+                return
+            self._load()
+            self._loaded_at = time.monotonic()
+
+    def get_hash(self, username):
+        """登録済みならパスワードのハッシュ、なければ None"""
+        with self._lock:
+            self._stats["lookups"] += 1
+            self.refresh()
+            # 見つからないときの読み直しは miss_refresh_interval 秒に1回まで
+            if username not in self._index and time.monotonic() - self._loaded_at >= self.miss_refresh_interval:
+                self.refresh(force=True)
+            return self._index.get(username)
+
+    def exists(self, username):
+        return self.get_hash(username) is not None
+
+    def authenticate(self, username, password):
+        """パスワードが一致すれば True。古い形式のハッシュはこのとき作り直す"""
+        stored = self.get_hash(username)
+        if stored is None:
+            return False
+        ok, new_hash = passwords.get_hasher().verify_and_update(password, stored)
+        if ok and new_hash is not None:
+            self._update_hash(username, stored, new_hash)
+        return ok
+
+    def _update_hash(self, username, old_hash, new_hash):
+        with self._lock:
+            for attempt in range(2):
+                row_number = self._rows.get(username)
+                if row_number is None:
+                    return
+                if self._normalize(self.sheet.row_values(row_number)) == [username, old_hash]:
+                    break
+                # 行番号が索引と合わなければ、シート全体から索引を作り直してもう1度探す
+                self._load(full=True)
+            else:
+                logger.warning("%s のパスワードを作り直せませんでした", username)
+                return
+            self.sheet.update(f"B{row_number}", [[new_hash]])
+            self._index[username] = new_hash
+            self._tail.updated(row_number, [username, new_hash])
+            self._stats["rehashed"] += 1
+
+    def add(self, username, password):
+        """登録したら True、ユーザー名が使われていれば False"""
+        password_hash = passwords.get_hasher().hash(password)
+        with self._lock:
+            # 他のプロセスでの登録も含めて重複を確かめる
+            self.refresh(force=True)
+            if username in self._index:
+                return False
+            self.sheet.append_row([username, password_hash])
+            self._index[username] = password_hash
+            self._rows[username] = self._tail.appended([username, password_hash])
+            return True
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, users=len(self._index))
+
+
+_directory = None
+_directory_lock = threading.Lock()
+
+
+def get_directory():
+    global _directory
+    with _directory_lock:
+        if _directory is None:
+            _directory = UserDirectory()
+        return _directory
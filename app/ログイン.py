@@ -1,10 +1,6 @@
 import os
 import streamlit as st
-import pandas as pd
-import gspread
-from google.oauth2.service_account import Credentials
-import hashlib
-from config import SPREADSHEET_DB_ID, PRIVATE_KEY_PATH, scopes
+import users
 
 
 base="light"
@@ -12,43 +8,13 @@ backgroundColor="#fbf3c8"
 secondaryBackgroundColor="#ffe8b8"
 
 
-def get_credentials():
-    return Credentials.from_service_account_info(PRIVATE_KEY_PATH, scopes=scopes)
-
 if 'logged_in' not in st.session_state:
     st.session_state['logged_in'] = False
 if 'username' not in st.session_state:
     st.session_state['username'] = ""
 
-def make_hashes(password):
-    return hashlib.sha256(str.encode(password)).hexdigest()
-
-def check_hashes(password, hashed_text):
-    if make_hashes(password) == hashed_text:
-        return hashed_text
-    return False
-
-def create_user():
-    creds = get_credentials()
-    client = gspread.authorize(creds)
-    sheet = client.open_by_key(SPREADSHEET_DB_ID).worksheet("ユーザーDB")
-    if not sheet.get_all_records():
-        sheet.append_row(["username", "password"])
-
-def add_user(username, password):
-    creds = get_credentials()
-    client = gspread.authorize(creds)
-    sheet = client.open_by_key(SPREADSHEET_DB_ID).worksheet("ユーザーDB")
-    sheet.append_row([username, password])
-
 def login_user(username, password):
-    creds = get_credentials()
-    client = gspread.authorize(creds)
-    sheet = client.open_by_key(SPREADSHEET_DB_ID).worksheet("ユーザーDB")
-    records = sheet.get_all_records()
-    user_df = pd.DataFrame(records)
-    result = user_df[(user_df['username'] == username) & (user_df['password'] == password)]
-    return result
+    return users.get_directory().authenticate(username, password)
 
 def main():
     st.title("ログイン")
@@ -61,10 +27,9 @@ def main():
         username = st.text_input("ユーザー名を入力してください")
         password = st.text_input("パスワードを入力してください", type='password')
         if st.button("ログイン"):
-            create_user()
-            hashed_pswd = make_hashes(password)
-            result = login_user(username, check_hashes(password, hashed_pswd))
-            if not result.empty:
+            with st.spinner("確認しています..."):
+                result = login_user(username, password)
+            if result:
                 st.success(f"{username}さんでログインしました")
                 st.session_state['logged_in'] = True
                 st.session_state['username'] = username
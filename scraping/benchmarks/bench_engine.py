@@ -0,0 +1,110 @@
+import os
+import time
+import tempfile
+
+import requests
+
+from engine import ScraperEngine, Checkpoint
+from fixture_server import FixtureSite, FixtureServer
+from scraping_suumo import parse_listing_page, scrape_wards
+
+# test.txt から組み立てた一覧ページをローカルのサーバーで返し、
+# 1ページずつ requests.get する従来の取得と ScraperEngine を比べる。
+# 取得結果が同じか、チェックポイントから再開できるか、エラー時に再試行するか、
+# ホストごとの上限を守るか(429 を受けないか)も確かめる。
+# 実行方法: cd scraping && python -m benchmarks.bench_engine
+
+WARD_CODES = ["13101", "13102", "13103", "13104"]
+
+
+def sequential_crawl(url_template, wards):
+    """従来: 区ごとに1ページずつ取得して解析する"""
+    rows = []
+    for ward in wards:
+        page, last_page = 1, 1
+        while page <= last_page:
+            response = requests.get(url_template.format(ward=ward, page=page))
+            page_rows, last_page = parse_listing_page(response.content)
+            rows.extend(page_rows)
+            page += 1
+    return rows
+
+
+class FailingSession(requests.Session):
+    """wards の区のページには 404 を返すセッション"""
+
+    def __init__(self, wards):
+        super().__init__()
+        self.wards = wards
+
+    def get(self, url, **kwargs):
+        if any(f"sc={ward}&" in url for ward in self.wards):
+            response = requests.Response()
+            response.status_code = 404
+            response.url = url
+            return response
+        return super().get(url, **kwargs)
+
+
+def main(pages=5, items=10, latency=0.2):
+    site = FixtureSite(pages_per_ward=pages, items_per_page=items)
+
+    with FixtureServer(site, latency=latency) as server:
+        start = time.perf_counter()
+        expected = sequential_crawl(server.url_template, WARD_CODES)
+        old_sec = time.perf_counter() - start
+
+        engine = ScraperEngine(parse_listing_page, max_workers=8, rate_per_host=20)
+        start = time.perf_counter()
+        rows = engine.crawl_wards(server.url_template, WARD_CODES)
+        new_sec = time.perf_counter() - start
+        assert rows == expected, "取得結果が従来と一致しません"
+        assert len(rows) == len(WARD_CODES) * pages * items * 3
+
+        print(f"{len(WARD_CODES)}区 x {pages}ページ x {items}棟 ({len(rows)}部屋) / 1ページの応答 {latency}秒")
+        print(f"従来         : {old_sec:6.2f}秒")
+        print(f"ScraperEngine: {new_sec:6.2f}秒  同時取得 最大{server.stats['max_concurrency']}  x{old_sec / new_sec:.1f}")
+        print(engine.stats())
+
+        # 途中で失敗しても、チェックポイントにあるページは取り直さない
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "checkpoint.sqlite3")
+            partial = scrape_wards(WARD_CODES, url_template=server.url_template, checkpoint_path=path,
+                                   session=FailingSession(WARD_CODES[2:]), max_workers=8, rate_per_host=20)
+            assert len(partial) == 2 * pages * items * 3
+            before = server.stats["requests"]
+            resumed = ScraperEngine(parse_listing_page, checkpoint=Checkpoint(path), max_workers=8, rate_per_host=20)
+            assert resumed.crawl_wards(server.url_template, WARD_CODES) == expected
+            stats = resumed.stats()
+            assert stats["resumed"] == 2 * pages and stats["pages"] == 2 * pages, stats
+            assert server.stats["requests"] - before == 2 * pages
+            print(f"再開         : {stats['resumed']}ページをチェックポイントから読み、{stats['pages']}ページを取得")
+
+            # 失敗せずに終わった実行のチェックポイントは消え、次の実行は全ページを取り直す
+            assert scrape_wards(WARD_CODES, url_template=server.url_template, checkpoint_path=path,
+                                max_workers=8, rate_per_host=20) == expected
+            before = server.stats["requests"]
+            assert scrape_wards(WARD_CODES, url_template=server.url_template, checkpoint_path=path,
+                                max_workers=8, rate_per_host=20) == expected
+            assert server.stats["requests"] - before == len(WARD_CODES) * pages
+
+    # 2割のリクエストが 503 になっても、再試行して全ページを取得する
+    with FixtureServer(site, error_rate=0.2, seed=1) as server:
+        engine = ScraperEngine(parse_listing_page, max_workers=8, rate_per_host=50, backoff_sec=0.05)
+        assert engine.crawl_wards(server.url_template, WARD_CODES) == expected
+        stats = engine.stats()
+        assert stats["retries"] == server.stats["errors"] > 0 and stats["failed"] == 0, stats
+        print(f"エラー注入   : 503 を{server.stats['errors']}回受け、すべて再試行で取得")
+
+    # サーバーが 10 回/秒 までしか受け付けないとき、8 回/秒 に抑えれば 429 を受けない
+    with FixtureServer(site, rate_limit=10) as server:
+        engine = ScraperEngine(parse_listing_page, max_workers=8, rate_per_host=8)
+        start = time.perf_counter()
+        assert engine.crawl_wards(server.url_template, WARD_CODES) == expected
+        polite_sec = time.perf_counter() - start
+        assert server.stats["throttled"] == 0 and engine.stats()["retries"] == 0, server.stats
+        print(f"レート制限   : {server.stats['requests']}リクエストを {polite_sec:.2f}秒で取得、429 は0回")
+
+
+if __name__ == "__main__":
+    main()
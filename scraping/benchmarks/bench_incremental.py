@@ -0,0 +1,197 @@
+import time
+
+import pandas as pd
+from gspread.exceptions import WorksheetNotFound
+from gspread.utils import a1_to_rowcol
+
+from fixture_server import FixtureSite, FixtureServer
+from incremental import (PROPERTY_SHEET, VERSION_SHEET, HASH_COLUMN, REFERENCING_SHEETS, COORDINATE_COLUMNS,
+                         is_listing_id, sheet_value)
+from scraping_suumo import scrape_incremental, scrape_wards, process_real_estate_data
+
+# ローカルのテスト用サーバーで掲載内容を変えながら scrape_incremental を繰り返し実行し、
+# 全件取得し直す場合と比べて取得ページ数・書き込み回数・時間がどれだけ減るかを測る。
+# 各回の後で、物件DB の内容が全件取得・加工し直した結果と一致することも確かめる。
+# 連番の property_id と緯度・経度を持つ以前の物件DB が、行を消さずに jnc 番号へ移行されることも確かめる。
+# 実行方法: cd scraping && python -m benchmarks.bench_incremental
+
+WARD_CODES = ["13101", "13102", "13103", "13104"]
+
+
+class MemorySheet:
+    """gspread.Worksheet のうち差分更新で使う操作だけを持つメモリ上のシート。API 呼び出しを数える"""
+
+    def __init__(self):
+        self.rows = []
+        self.calls = 0
+
+    def get_all_values(self):
+        self.calls += 1
+        return [[str(value) for value in row] for row in self.rows]
+
+    def batch_update(self, data):
+        self.calls += 1
+        for item in data:
+            number, column = a1_to_rowcol(item["range"].split(":")[0])
+            while len(self.rows) < number:
+                self.rows.append([])
+            row = self.rows[number - 1]
+            values = list(item["values"][0])
+            row.extend([""] * (column - 1 + len(values) - len(row)))
+            row[column - 1:column - 1 + len(values)] = values
+
+    def append_rows(self, values):
+        self.calls += 1
+        self.rows.extend(list(row) for row in values)
+
+    def append_row(self, values):
+        self.append_rows([values])
+
+    def insert_row(self, values, index=1):
+        self.calls += 1
+        self.rows.insert(index - 1, list(values))
+
+    def update(self, range_name, values):
+        self.batch_update([{"range": range_name, "values": values}])
+
+    def delete_rows(self, start_index, end_index=None):
+        self.calls += 1
+        del self.rows[start_index - 1:(end_index or start_index)]
+
+
+class MemorySpreadsheet:
+    def __init__(self):
+        self.sheets = {name: MemorySheet() for name in [PROPERTY_SHEET, VERSION_SHEET] + REFERENCING_SHEETS}
+
+    def worksheet(self, name):
+        if name not in self.sheets:
+            raise WorksheetNotFound(name)
+        return self.sheets[name]
+
+
+def sheet_records(sheet):
+    header = sheet.rows[0]
+    return {str(row[header.index("property_id")]): {column: str(value) for column, value in zip(header, row)
+                                                     if column != HASH_COLUMN}
+            for row in sheet.rows[1:]}
+
+
+def full_records(url_template):
+    frame = process_real_estate_data(pd.DataFrame(scrape_wards(WARD_CODES, url_template=url_template,
+                                                               max_workers=8, rate_per_host=100)))
+    return {str(record["property_id"]): {column: str(sheet_value(value)) for column, value in record.items()}
+            for record in frame.to_dict("records")}
+
+
+def check_legacy_sheet(site, url_template):
+    """連番の property_id と緯度・経度を持つ以前の物件DB を差分更新する"""
+    spreadsheet = MemorySpreadsheet()
+    property_sheet = spreadsheet.sheets[PROPERTY_SHEET]
+    records = list(full_records(url_template).values())
+    header = [column for column in records[0] if column != "property_id"] + ["property_id"] + COORDINATE_COLUMNS
+    listing_ids = {}
+    property_sheet.rows = [header]
+    for i, record in enumerate(records, start=1):
+        legacy_id = str(i)
+        listing_ids[legacy_id] = record["property_id"]
+        record = dict(record, property_id=legacy_id, 緯度=f"35.{i:04d}", 経度="139.7")
+        property_sheet.rows.append([record[column] for column in header])
+    # 面積を書き換えた行と、今は掲載されていない行は対応が付かないので連番のまま残る
+    property_sheet.rows[1][header.index("面積")] = "999.9"
+    property_sheet.rows.append(list(property_sheet.rows[-1]))
+    property_sheet.rows[-1][header.index("property_id")] = str(len(records) + 1)
+    property_sheet.rows[-1][header.index("物件詳細URL")] = "https://suumo.jp/chintai/jnc_ended/"
+    legacy_rows = len(property_sheet.rows) - 1
+    spreadsheet.sheets["お気に入りDB"].rows = [["username", "property_id"], ["alice", "1"], ["alice", "2"], ["bob", "3"]]
+    spreadsheet.sheets["チャットデータDB"].rows = [["timestamp", "sender", "text", "property_id"],
+                                                 ["2024-01-01 00:00:00", "alice", "007", "3"]]
+    spreadsheet.sheets["評価DB"].rows = [["timestamp", "rater", "rating", "property_id"],
+                                       ["2024-01-01 00:00:00", "alice", "5", str(len(records) + 1)]]
+
+    site.add_listings(WARD_CODES[2], 1)
+    lookups = []
+
+    def geocode(address):
+        lookups.append(address)
+        return 35.5, 139.5
+
+    summary = scrape_incremental(spreadsheet, WARD_CODES, url_template=url_template, early_stop=False,
+                                 geocode=geocode, max_workers=8, rate_per_host=100)
+    assert summary["migrated"] == len(records) - 1 and summary["removed"] == 0, summary
+    # 新着3部屋と、面積を書き換えたために対応が付かなかった1部屋
+    assert summary["new"] == 4 and summary["changed"] == len(records) - 1, summary
+
+    rows = property_sheet.rows
+    header = rows[0]
+    by_id = {row[header.index("property_id")]: dict(zip(header, row)) for row in rows[1:]}
+    assert len(rows) - 1 == legacy_rows + summary["new"]
+    assert sorted(property_id for property_id in by_id if not is_listing_id(property_id)) == ["1", str(len(records) + 1)]
+    for legacy_id, listing_id in list(listing_ids.items())[1:]:
+        assert by_id[listing_id]["緯度"] == f"35.{int(legacy_id):04d}" and by_id[listing_id][HASH_COLUMN], listing_id
+    new_rows = [record for property_id, record in by_id.items()
+                if is_listing_id(property_id) and property_id not in listing_ids.values()]
+    assert len(new_rows) == 3 and all((record["緯度"], record["経度"]) == (35.5, 139.5) for record in new_rows)
+    assert len(lookups) == len(set(lookups))
+    assert spreadsheet.sheets["お気に入りDB"].rows[1:] == [["alice", "1"], ["alice", listing_ids["2"]], ["bob", listing_ids["3"]]]
+    assert spreadsheet.sheets["チャットデータDB"].rows[1][3] == listing_ids["3"]
+    assert spreadsheet.sheets["評価DB"].rows[1][3] == str(len(records) + 1)
+
+    summary = scrape_incremental(spreadsheet, WARD_CODES, url_template=url_template, early_stop=False,
+                                 geocode=geocode, max_workers=8, rate_per_host=100)
+    assert (summary["new"], summary["changed"], summary["removed"], summary["migrated"]) == (0, 0, 0, 0), summary
+    assert len(property_sheet.rows) == len(rows)
+    print(f"以前の物件DB の移行: {len(records) - 1}行を jnc 番号に書き換え、対応の付かない2行は残し、"
+          f"新着 {len(new_rows)}行に緯度・経度を付けました")
+
+
+def main(pages=5, items=10, latency=0.05):
+    site = FixtureSite(pages_per_ward=pages, items_per_page=items)
+    spreadsheet = MemorySpreadsheet()
+    property_sheet = spreadsheet.sheets[PROPERTY_SHEET]
+    versions = spreadsheet.sheets[VERSION_SHEET]
+
+    def run(label, early_stop=True):
+        property_sheet.calls = 0
+        start = time.perf_counter()
+        summary = scrape_incremental(spreadsheet, WARD_CODES, url_template=server.url_template,
+                                     early_stop=early_stop, max_workers=8, rate_per_host=100)
+        sec = time.perf_counter() - start
+        expected = full_records(server.url_template)
+        actual = sheet_records(property_sheet)
+        if early_stop:
+            # 途中で取得をやめた区の掲載終了は、次の全ページ取得まで物件DB に残る
+            actual = {property_id: record for property_id, record in actual.items() if property_id in expected}
+        assert actual == expected, f"{label}: 物件DB が全件取得の結果と一致しません"
+        print(f"{label}: {sec:5.2f}秒  {summary['pages']:3d}ページ  シート操作 {property_sheet.calls}回  "
+              f"新着 {summary['new']} / 変更 {summary['changed']} / 掲載終了 {summary['removed']} / 変更なし {summary['unchanged']}")
+        return summary
+
+    with FixtureServer(site, latency=latency) as server:
+        summary = run("初回(全件)")
+        assert summary["new"] == len(WARD_CODES) * pages * items * 3
+        total_pages = summary["pages"]
+
+        # 変更がなければ各区の1ページ目だけを取得し、物件DB もバージョンDB も書き換えない
+        version_rows = [list(row) for row in versions.rows]
+        summary = run("変更なし")
+        assert summary["pages"] == len(WARD_CODES) and property_sheet.calls == 1, summary
+        assert versions.rows == version_rows, "変更がないのにバージョンDB が更新されました"
+
+        # 新着3件、家賃の変更1件、2ページ目の物件の掲載終了1件
+        site.add_listings(WARD_CODES[0], 3)
+        site.revise_listing(WARD_CODES[1], 2)
+        site.remove_listing(WARD_CODES[1], items + 5)
+        summary = run("差分")
+        assert (summary["new"], summary["changed"], summary["removed"]) == (9, 1, 0), summary
+        assert summary["pages"] < total_pages / 2, summary
+        assert versions.rows != version_rows
+
+        summary = run("全ページ", early_stop=False)
+        assert (summary["new"], summary["changed"], summary["removed"]) == (0, 0, 3), summary
+        assert summary["pages"] >= total_pages
+
+        check_legacy_sheet(site, server.url_template)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+import time
+
+from fixture_server import FixtureSite
+from listing_parser import parse_listing_page
+from scraping_suumo import parse_listing_page_soup
+
+# test.txt から組み立てた一覧ページを BeautifulSoup 版と lxml 版の両方で解析し、
+# 結果が同じであることを確かめてから、1秒あたりに解析できる物件数を比べる。
+# 欄が欠けた物件・ページ送りのないページ・空のページも照合に含める。
+# 実行方法: cd scraping && python -m benchmarks.bench_listing_parser
+
+
+def build_corpus(site, wards, pages):
+    corpus = [site.page_html(ward, page).encode("utf-8") for ward in wards for page in range(1, pages + 1)]
+
+    # 欄が欠けた物件(カテゴリ・築年数/構造・画像がない、部屋が1つ多い)
+    broken = (site.template
+              .replace('<div class="cassetteitem_content-label"><span class="ui-pct ui-pct--util1">賃貸マンション</span></div>', "")
+              .replace('<li class="cassetteitem_detail-col3">', '<li class="cassetteitem_detail-col9">')
+              .replace('class="cassetteitem_object-item"', 'class="cassetteitem_object-none"'))
+    broken = broken.replace("</tbody>", "</tbody><tbody><tr><td></td><td>-</td></tr></tbody>", 1)
+    corpus.append(f"<html><body>{broken}{site.item_html('13101', 1, 0)}</body></html>".encode("utf-8"))
+    corpus.append(site.template.encode("utf-8"))
+    corpus.append("<html><body><p>該当する物件がありません</p></body></html>".encode("utf-8"))
+    return corpus
+
+
+def measure(parse, corpus, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        results = [parse(html) for html in corpus]
+    return (time.perf_counter() - start) / repeat, results
+
+
+def main(wards=("13101", "13103", "13113"), pages=4, items=30, repeat=3):
+    site = FixtureSite(pages_per_ward=pages, items_per_page=items)
+    corpus = build_corpus(site, wards, pages)
+    buildings = sum(html.count(b'class="cassetteitem"') for html in corpus)
+
+    old_sec, expected = measure(parse_listing_page_soup, corpus, repeat)
+    new_sec, results = measure(parse_listing_page, corpus, repeat)
+    for html, old, new in zip(corpus, expected, results):
+        assert old == new, f"解析結果が一致しません: {html[:80]!r}"
+    rooms = sum(len(rows) for rows, _ in results)
+    assert rooms == len(wards) * pages * items * 3 + 10
+
+    print(f"{len(corpus)}ページ / {buildings}物件 / {rooms}部屋")
+    print(f"BeautifulSoup: {old_sec:6.3f}秒  {buildings / old_sec:8.0f}物件/秒")
+    print(f"lxml XPath   : {new_sec:6.3f}秒  {buildings / new_sec:8.0f}物件/秒  x{old_sec / new_sec:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+import os
+import time
+import tempfile
+import tracemalloc
+
+import pandas as pd
+
+from engine import ScraperEngine, Checkpoint
+from fixture_server import FixtureSite, FixtureServer
+from pipeline import StreamingPipeline, SheetWriter, ADDRESS_COLUMNS, ACCESS_COLUMNS
+from scraping_suumo import parse_listing_page, process_real_estate_data, scrape_wards
+
+# 全件を溜めてから加工・書き込みする従来の流れと StreamingPipeline を、ローカルのテスト用サーバーで比べる。
+# 書き込む内容が同じこと、取得ページ数を増やしてもパイプラインの最大メモリ量がほぼ変わらないこと、
+# 書き込み中に落ちても再実行で続きから書き込み、失うのが1チャンク以内であることを確かめる。
+# 生データだけ書き込んだところで落ちても生データが重複しないこと、古いチェックポイントからは再開しないことも確かめる。
+# 実行方法: cd scraping && python -m benchmarks.bench_pipeline
+
+WARD_CODES = ["13101", "13102", "13103", "13104"]
+
+
+class MemorySheet:
+    """書き込まれた行を持つメモリ上のシート。keep=False なら見出し以外は行数だけ数える"""
+
+    def __init__(self, keep=True, fail_after=None):
+        self.keep = keep
+        self.fail_after = fail_after
+        self.rows = []
+        self.count = 0
+        self.appends = 0
+
+    def clear(self):
+        self.rows = []
+        self.count = 0
+
+    def row_values(self, row):
+        return list(self.rows[row - 1]) if row <= len(self.rows) else []
+
+    def append_rows(self, values):
+        if self.fail_after is not None and self.appends >= self.fail_after:
+            raise ConnectionError("書き込みに失敗しました")
+        self.appends += 1
+        for row in values:
+            if self.keep or not self.rows:
+                self.rows.append(list(row))
+            self.count += 1
+
+
+def sheet_records(rows):
+    header = rows[0]
+    return sorted(tuple(str(value) for value in row) for row in rows[1:]), header
+
+
+def batch_run(url_template, raw_sheet, processed_sheet):
+    """従来: 全ページを取得してから DataFrame にし、生データと加工データをまとめて書き込む"""
+    df = pd.DataFrame(scrape_wards(WARD_CODES, url_template=url_template, max_workers=8, rate_per_host=200))
+    df = df.drop_duplicates()
+    SheetWriter(raw_sheet).write(df)
+    processed = process_real_estate_data(df)
+    SheetWriter(processed_sheet).write(processed.reindex(columns=list(df.columns) + ADDRESS_COLUMNS + ACCESS_COLUMNS))
+
+
+def stream_run(url_template, raw_sheet, processed_sheet, chunk_rows, checkpoint=None, max_age=None):
+    pipeline = StreamingPipeline(
+        ScraperEngine(parse_listing_page, max_workers=8, rate_per_host=200), parse_listing_page,
+        process_real_estate_data, raw_writer=SheetWriter(raw_sheet), processed_writer=SheetWriter(processed_sheet),
+        chunk_rows=chunk_rows, checkpoint=checkpoint, max_age=max_age)
+    pipeline.run(url_template, WARD_CODES)
+    return pipeline
+
+
+def measure(run):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = run()
+    sec = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return sec, peak / 1024 / 1024, result
+
+
+def main(items=10, chunk_rows=300):
+    # 書き込む内容が従来と同じ
+    site = FixtureSite(pages_per_ward=5, items_per_page=items)
+    with FixtureServer(site) as server:
+        batch_raw, batch_processed = MemorySheet(), MemorySheet()
+        batch_run(server.url_template, batch_raw, batch_processed)
+        raw, processed = MemorySheet(), MemorySheet()
+        pipeline = stream_run(server.url_template, raw, processed, chunk_rows)
+        assert sheet_records(raw.rows) == sheet_records(batch_raw.rows)
+        assert sheet_records(processed.rows) == sheet_records(batch_processed.rows)
+        print("照合: 生データ・加工データとも従来の書き込み内容と一致")
+        print(pipeline.report())
+
+    # 取得ページ数を増やしたときの時間と最大メモリ量
+    print(f"\n{'ページ/区':>8} {'行数':>6} {'従来 秒':>8} {'従来 MB':>8} {'パイプライン 秒':>14} {'パイプライン MB':>14}")
+    for pages in [5, 10, 20, 40]:
+        site = FixtureSite(pages_per_ward=pages, items_per_page=items)
+        with FixtureServer(site) as server:
+            old_sec, old_mb, _ = measure(lambda: batch_run(server.url_template, MemorySheet(False), MemorySheet(False)))
+            sheet = MemorySheet(False)
+            new_sec, new_mb, _ = measure(lambda: stream_run(server.url_template, sheet, MemorySheet(False), chunk_rows))
+        print(f"{pages:>8} {sheet.count - 1:>6} {old_sec:8.2f} {old_mb:8.1f} {new_sec:14.2f} {new_mb:14.1f}")
+
+    # 4チャンク目の書き込みで落ちても、再実行で続きから書き込み、重複も欠けもない。
+    # 生データを書き込んで加工データで落ちたページは、取り直して加工データにだけ書き込む
+    site = FixtureSite(pages_per_ward=5, items_per_page=items)
+    total_pages = len(WARD_CODES) * 5
+    with FixtureServer(site) as server:
+        for failing in ["raw", "processed"]:
+            with tempfile.TemporaryDirectory() as directory:
+                path = os.path.join(directory, "checkpoint.sqlite3")
+                sheets = {"raw": MemorySheet(), "processed": MemorySheet()}
+                sheets[failing].fail_after = 3
+                try:
+                    stream_run(server.url_template, sheets["raw"], sheets["processed"], 3 * items * 3, Checkpoint(path))
+                    raise AssertionError("書き込みの失敗が伝わっていません")
+                except ConnectionError:
+                    pass
+                written = sheets[failing].count - 1
+                assert len(Checkpoint(path).seen_ids()) == written
+                before = server.stats["requests"]
+                sheets[failing].fail_after = None
+                pipeline = stream_run(server.url_template, sheets["raw"], sheets["processed"], 3 * items * 3,
+                                      Checkpoint(path))
+                refetched = server.stats["requests"] - before
+                assert sheet_records(sheets["raw"].rows) == sheet_records(batch_raw.rows), failing
+                assert sheet_records(sheets["processed"].rows) == sheet_records(batch_processed.rows), failing
+                assert Checkpoint(path).done_pages(WARD_CODES[0], "raw") == set(), "完了後にチェックポイントが残っています"
+                assert refetched == total_pages - written // (items * 3), refetched
+                print(f"\n再開({failing} で失敗): 落ちる前に{written}行を書き込み、再実行で{refetched}ページを取得して"
+                      f"残りを書き込み(重複・欠けなし)")
+        print(pipeline.report())
+
+        # max_age より前に始めた実行のチェックポイントからは再開せず、最初から書き込み直す
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "checkpoint.sqlite3")
+            raw, processed = MemorySheet(fail_after=3), MemorySheet()
+            try:
+                stream_run(server.url_template, raw, processed, 3 * items * 3, Checkpoint(path))
+            except ConnectionError:
+                pass
+            raw.fail_after = None
+            before = server.stats["requests"]
+            stream_run(server.url_template, raw, processed, 3 * items * 3, Checkpoint(path), max_age=0)
+            assert server.stats["requests"] - before == total_pages
+            assert sheet_records(raw.rows) == sheet_records(batch_raw.rows)
+            assert sheet_records(processed.rows) == sheet_records(batch_processed.rows)
+            print("古いチェックポイント: 再開せずに全ページを取得し直して書き込み")
+
+if __name__ == "__main__":
+    main()
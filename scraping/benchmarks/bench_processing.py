@@ -0,0 +1,30 @@
+import time
+
+import pandas as pd
+from pandas.testing import assert_frame_equal
+
+from conftest import synthetic_rows
+from scraping_suumo import process_real_estate_data, process_real_estate_data_apply
+
+# process_real_estate_data(列ごとの処理)と process_real_estate_data_apply(1行ずつの処理)の所要時間を
+# 10万行の合成データで比べる。結果が一致することは tests/test_processing.py で確かめる。
+# 実行方法: cd scraping && python -m benchmarks.bench_processing
+
+
+def main(n=100_000):
+    frame = pd.DataFrame(synthetic_rows(n))
+    start = time.perf_counter()
+    expected = process_real_estate_data_apply(frame.copy())
+    old_sec = time.perf_counter() - start
+    start = time.perf_counter()
+    actual = process_real_estate_data(frame)
+    new_sec = time.perf_counter() - start
+    assert_frame_equal(actual, expected)
+
+    print(f"{n}行")
+    print(f"1行ずつ(apply): {old_sec:6.2f}秒")
+    print(f"列ごと        : {new_sec:6.2f}秒  x{old_sec / new_sec:.1f}")
+
+
+if __name__ == "__main__":
+    main()
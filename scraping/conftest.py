@@ -0,0 +1,47 @@
+import random
+
+from engine import WARDS
+
+# scraping のモジュールは互いに `from engine import ...` のように読み込むので、
+# pytest をどこから実行してもこのディレクトリから import できるようにする(conftest.py のあるディレクトリが sys.path に入る)。
+# tests と benchmarks で共有する合成データ(一覧ページから取った形の行)もここに置く。
+
+LINES = ["ＪＲ山手線", "東京メトロ丸ノ内線", "都営大江戸線", "東急東横線", "京王線"]
+STATIONS = ["神田駅", "大手町駅", "新宿駅", "渋谷駅", "中野駅", "新日本橋駅"]
+
+
+def synthetic_rows(n, seed=0, max_access=4):
+    rng = random.Random(seed)
+    wards = list(WARDS.values())
+
+    def access():
+        items = []
+        for _ in range(rng.randint(1, max_access)):
+            kind = rng.random()
+            if kind < 0.8:
+                items.append(f"{rng.choice(LINES)}/{rng.choice(STATIONS)} 歩{rng.randint(1, 25)}分")
+            elif kind < 0.9:
+                items.append(f"{rng.choice(LINES)}/{rng.choice(STATIONS)} バス{rng.randint(5, 20)}分")
+            else:
+                items.append(rng.choice(LINES))
+        return ", ".join(items)
+
+    rows = []
+    for _ in range(n):
+        top = rng.randint(2, 40)
+        floor = rng.choice([f"{rng.randint(1, top)}階", f"B{rng.randint(1, 2)}階", f"{rng.randint(1, 3)}-{rng.randint(4, 6)}階"])
+        rows.append({
+            "名称": f"テストレジデンス{rng.randint(1, 999)}",
+            "アドレス": f"東京都{rng.choice(wards)}テスト町{rng.randint(1, 9)}",
+            "アクセス": access(),
+            "築年数": "新築" if rng.random() < 0.1 else f"築{rng.randint(1, 60)}年",
+            "構造": rng.choice([f"{top}階建", f"地下1地上{top}階建", f"B1/{top}階建", "平屋"]),
+            "階数": floor,
+            "家賃": f"{rng.randint(50, 400) / 10}万円",
+            "管理費": rng.choice(["-", f"{rng.randint(0, 30) * 1000}円"]),
+            "敷金": rng.choice(["-", f"{rng.randint(5, 40) / 10}万円"]),
+            "礼金": rng.choice(["-", f"{rng.randint(5, 40) / 10}万円"]),
+            "間取り": rng.choice(["1K", "1LDK", "2LDK", "3LDK"]),
+            "面積": f"{rng.randint(150, 900) / 10}m2",
+        })
+    return rows
@@ -0,0 +1,278 @@
+import time
+import json
+import random
+import sqlite3
+import logging
+import threading
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# 一覧ページをまとめて取得するスクレイピングエンジン。
+# 1つのセッションを使い回し、同時取得数を max_workers に、同じホストへのリクエストを
+# rate_per_host 回/秒 に抑える。失敗したリクエストは指数バックオフで再試行し(429 は Retry-After に従う)、
+# 取得・解析できたページは (区, ページ) ごとに SQLite のチェックポイントに保存して、中断しても続きから再開できる。
+
+logger = logging.getLogger(__name__)
+
+# 東京23区の区コード
+WARDS = {
+    "13101": "千代田区", "13102": "中央区", "13103": "港区", "13104": "新宿区", "13105": "文京区",
+    "13106": "台東区", "13107": "墨田区", "13108": "江東区", "13109": "品川区", "13110": "目黒区",
+    "13111": "大田区", "13112": "世田谷区", "13113": "渋谷区", "13114": "中野区", "13115": "杉並区",
+    "13116": "豊島区", "13117": "北区", "13118": "荒川区", "13119": "板橋区", "13120": "練馬区",
+    "13121": "足立区", "13122": "葛飾区", "13123": "江戸川区",
+}
+
+SUUMO_URL = (
+    "https://suumo.jp/jj/chintai/ichiran/FR301FC001/?ar=030&bs=040&ta=13&sc={ward}&cb=0.0&ct=9999999"
+    "&et=9999999&cn=9999999&mb=0&mt=9999999&shkr1=03&shkr2=03&shkr3=03&shkr4=03&fw2=&srch_navi=1&page={page}"
+)
+# 新着順に並べた一覧。差分更新(incremental)で途中のページで取得をやめられるようにする
+SUUMO_NEW_ARRIVALS_URL = SUUMO_URL + "&po1=09&po2=99"
+USER_AGENT = "Mozilla/5.0 (compatible; tech0-step3-scraper)"
+
+
+class FetchError(Exception):
+    pass
+
+
+class HostRateLimiter:
+    """ホストごとにリクエストの間隔を 1 / rate_per_sec 秒以上あける"""
+
+    def __init__(self, rate_per_sec):
+        self.interval = 1.0 / rate_per_sec if rate_per_sec else 0.0
+        self._next = {}
+        self._lock = threading.Lock()
+
+    def wait(self, host):
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next.get(host, 0.0))
+            self._next[host] = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+    def pause(self, host, seconds):
+        """429 などでサーバーに待つよう言われたら、そのホストへの次のリクエストを遅らせる"""
+        with self._lock:
+            self._next[host] = max(self._next.get(host, 0.0), time.monotonic() + seconds)
+
+
+class Checkpoint:
+    """(キー, ページ) ごとの解析結果と書き込み先ごとの書き込み済みの印、キーごとの最終ページ番号、
+    書き込んだ property_id を SQLite に保存する。begin で実行を始めると、別の実行や古い実行の記録は消える"""
+
+    def __init__(self, path):
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("CREATE TABLE IF NOT EXISTS pages (key TEXT, page INTEGER, rows TEXT, PRIMARY KEY (key, page))")
+        self._db.execute("CREATE TABLE IF NOT EXISTS last_pages (key TEXT PRIMARY KEY, last_page INTEGER)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS written "
+                         "(key TEXT, page INTEGER, stage TEXT, PRIMARY KEY (key, page, stage))")
+        self._db.execute("CREATE TABLE IF NOT EXISTS seen (property_id TEXT PRIMARY KEY)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS run (id INTEGER PRIMARY KEY CHECK (id = 0), name TEXT, started REAL)")
+        self._db.commit()
+        self._lock = threading.Lock()
+
+    def begin(self, name, max_age=None):
+        """name の実行を始める。同じ name で max_age 秒以内に始めた実行の記録があれば True を返して続きから、
+        なければ記録を消して新しく始め False を返す"""
+        with self._lock:
+            row = self._db.execute("SELECT name, started FROM run").fetchone()
+        if row and row[0] == name and (max_age is None or time.time() - row[1] <= max_age):
+            return True
+        self.clear()
+        with self._lock:
+            self._db.execute("INSERT INTO run (id, name, started) VALUES (0, ?, ?)", (name, time.time()))
+            self._db.commit()
+        return False
+
+    def get(self, key, page):
+        with self._lock:
+            row = self._db.execute("SELECT rows FROM pages WHERE key = ? AND page = ?", (key, page)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, key, page, rows):
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO pages (key, page, rows) VALUES (?, ?, ?)",
+                             (key, page, json.dumps(rows, ensure_ascii=False)))
+            self._db.commit()
+
+    def last_page(self, key):
+        with self._lock:
+            row = self._db.execute("SELECT last_page FROM last_pages WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_last_page(self, key, last_page):
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO last_pages (key, last_page) VALUES (?, ?)", (key, last_page))
+            self._db.commit()
+
+    def mark_done(self, pages, stage="done", property_ids=()):
+        """pages は (キー, ページ) のリスト。stage(書き込み先)への書き込みまで終わったページとして記録する。
+        property_ids はそのページで書き込んだ物件で、次の実行で重複を除くのに使う"""
+        with self._lock:
+            self._db.executemany("INSERT OR REPLACE INTO written (key, page, stage) VALUES (?, ?, ?)",
+                                 [(key, page, stage) for key, page in pages])
+            self._db.executemany("INSERT OR IGNORE INTO seen (property_id) VALUES (?)",
+                                 [(str(property_id),) for property_id in property_ids])
+            self._db.commit()
+
+    def done_pages(self, key, stage="done"):
+        with self._lock:
+            return {row[0] for row in self._db.execute("SELECT page FROM written WHERE key = ? AND stage = ?",
+                                                       (key, stage))}
+
+    def seen_ids(self):
+        with self._lock:
+            return {row[0] for row in self._db.execute("SELECT property_id FROM seen")}
+
+    def clear(self):
+        with self._lock:
+            self._db.execute("DELETE FROM pages")
+            self._db.execute("DELETE FROM last_pages")
+            self._db.execute("DELETE FROM written")
+            self._db.execute("DELETE FROM seen")
+            self._db.execute("DELETE FROM run")
+            self._db.commit()
+
+
+class ScraperEngine:
+    def __init__(self, parse_page, session=None, max_workers=8, rate_per_host=1.0, max_retries=4,
+                 backoff_sec=1.0, timeout=15, checkpoint=None):
+        """parse_page(html) は (部屋ごとのデータのリスト, 最終ページ番号) を返す関数"""
+        self.parse_page = parse_page
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.backoff_sec = backoff_sec
+        self.timeout = timeout
+        self.checkpoint = checkpoint
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            session.headers["User-Agent"] = USER_AGENT
+        self.session = session
+        self.limiter = HostRateLimiter(rate_per_host)
+        self._lock = threading.Lock()
+        self._stats = {"requests": 0, "retries": 0, "pages": 0, "resumed": 0, "failed": 0,
+                       "rows": 0, "bytes": 0, "fetch_sec": 0.0}
+
+    def _count(self, **values):
+        with self._lock:
+            for key, value in values.items():
+                self._stats[key] += value
+
+    def fetch(self, url):
+        host = urlsplit(url).netloc
+        for attempt in range(self.max_retries + 1):
+            self.limiter.wait(host)
+            start = time.perf_counter()
+            retry_after = None
+            try:
+                response = self.session.get(url, timeout=self.timeout)
+                self._count(requests=1, fetch_sec=time.perf_counter() - start)
+                if response.status_code == 200:
+                    self._count(bytes=len(response.content))
+                    return response.content
+                if response.status_code != 429 and response.status_code < 500:
+                    raise FetchError(f"{url}: HTTP {response.status_code}")
+                error = f"HTTP {response.status_code}"
+                retry_after = response.headers.get("Retry-After")
+            except requests.RequestException as e:
+                self._count(requests=1, fetch_sec=time.perf_counter() - start)
+                error = str(e)
+            if attempt == self.max_retries:
+                raise FetchError(f"{url}: {error}")
+            delay = self.backoff_sec * 2 ** attempt * random.uniform(0.5, 1.5)
+            if retry_after and retry_after.isdigit():
+                delay = max(delay, float(retry_after))
+                self.limiter.pause(host, float(retry_after))
+            logger.info("再試行します (%d回目) %s: %s", attempt + 1, url, error)
+            self._count(retries=1)
+            time.sleep(delay)
+
+    def fetch_page(self, key, page, url):
+        """(部屋ごとのデータ, 最終ページ番号) を返す。チェックポイントにあれば取得しない"""
+        if self.checkpoint is not None:
+            rows = self.checkpoint.get(key, page)
+            if rows is not None:
+                self._count(resumed=1)
+                return rows, self.checkpoint.last_page(key)
+        rows, last_page = self.parse_page(self.fetch(url))
+        if self.checkpoint is not None:
+            if page == 1:
+                self.checkpoint.set_last_page(key, last_page)
+            self.checkpoint.put(key, page, rows)
+        self._count(pages=1, rows=len(rows))
+        return rows, last_page
+
+    def _fetch_all(self, jobs):
+        # jobs は (key, page, url) のリスト。失敗したページは飛ばし、次回の実行で取り直す
+        def run(job):
+            try:
+                return self.fetch_page(*job)
+            except FetchError as e:
+                logger.warning("ページを取得できませんでした: %s", e)
+                self._count(failed=1)
+                return None
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            return dict(zip([job[:2] for job in jobs], pool.map(run, jobs)))
+
+    def crawl_pages(self, url_template, pages):
+        """url_template の {} にページ番号を入れた各ページを取得し、ページ順に部屋ごとのデータを返す"""
+        pages = list(pages)
+        results = self._fetch_all([(url_template, page, url_template.format(page)) for page in pages])
+        return [row for page in pages if results[(url_template, page)] for row in results[(url_template, page)][0]]
+
+    def crawl_wards(self, url_template, wards, max_page=None):
+        """区ごとに1ページ目で最終ページを調べてから残りのページを取得し、区・ページ順に部屋ごとのデータを返す"""
+        def url(ward, page):
+            return url_template.format(ward=ward, page=page)
+
+        first = self._fetch_all([(ward, 1, url(ward, 1)) for ward in wards])
+        jobs = []
+        for ward in wards:
+            if first[(ward, 1)] is None:
+                continue
+            last_page = first[(ward, 1)][1] or 1
+            if max_page:
+                last_page = min(last_page, max_page)
+            jobs += [(ward, page, url(ward, page)) for page in range(2, last_page + 1)]
+        results = {**first, **self._fetch_all(jobs)}
+        rows = []
+        for key in sorted(results, key=lambda key: (wards.index(key[0]), key[1])):
+            if results[key] is not None:
+                rows.extend(results[key][0])
+        return rows
+
+    def crawl_until(self, url_template, wards, stop, max_page=None):
+        """区ごとにページ順に取得し、stop(ward, rows) が真を返したらその区の残りのページは取得しない。
+        区は並行して取得する。{区: (部屋ごとのデータ, 最終ページまで取得できたか)} を返す"""
+        def crawl(ward):
+            rows, page, last_page = [], 1, 1
+            try:
+                while page <= last_page:
+                    page_rows, last = self.fetch_page(ward, page, url_template.format(ward=ward, page=page))
+                    if page == 1:
+                        last_page = last or 1
+                    rows.extend(page_rows)
+                    if page < last_page and (stop(ward, page_rows) or page == max_page):
+                        return rows, False
+                    page += 1
+            except FetchError as e:
+                logger.warning("ページを取得できませんでした: %s", e)
+                self._count(failed=1)
+                return rows, False
+            return rows, True
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            return dict(zip(wards, pool.map(crawl, wards)))
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
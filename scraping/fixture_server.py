@@ -0,0 +1,205 @@
+import os
+import time
+import random
+import argparse
+import threading
+from urllib.parse import urlsplit, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from engine import WARDS
+
+# 保存した物件1件分の HTML(test.txt)から一覧ページを組み立てて返すローカルのテスト用サーバー。
+# 区コード・ページ番号ごとに名称・住所・物件番号を変えた物件を items_per_page 件並べ、
+# SUUMO と同じ形のページ送りを付ける。遅延・エラー・429(レート制限)と、新着・家賃変更・掲載終了も模擬できる。
+# 実行方法: cd scraping && python fixture_server.py --port 8000
+
+TEMPLATE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "test.txt")
+TEMPLATE_NAME = "コスモグラシア内神田"
+TEMPLATE_ADDRESS = "東京都千代田区内神田２"
+TEMPLATE_IDS = ["100376326647", "100373752572", "100374980864"]
+TEMPLATE_JNC = ["000088343514", "000089592711", "000089777970"]
+TEMPLATE_RENT = ">24.8万円<"
+REVISED_RENT = ">23.8万円<"
+LISTING_PATH = "/jj/chintai/ichiran/FR301FC001/"
+
+
+class FixtureSite:
+    """区ごとの物件の並び(新着順)を持ち、add_listings / revise_listing / remove_listing で掲載内容を変えられる"""
+
+    def __init__(self, template_path=TEMPLATE_PATH, pages_per_ward=5, items_per_page=10):
+        with open(template_path, encoding="utf-8") as f:
+            self.template = f.read()
+        self.pages_per_ward = pages_per_ward
+        self.items_per_page = items_per_page
+        self._listings = {}
+        self._revised = set()
+        self._added = 0
+
+    def listings(self, ward):
+        """区の物件のキー (ページ, 位置) を掲載順に返す。新しく追加した物件はページ 0"""
+        if ward not in self._listings:
+            pages = self.pages_per_ward
+            pages = pages(ward) if callable(pages) else pages
+            self._listings[ward] = [(page, index) for page in range(1, pages + 1) for index in range(self.items_per_page)]
+        return self._listings[ward]
+
+    def last_page(self, ward):
+        return max(-(-len(self.listings(ward)) // self.items_per_page), 1)
+
+    def add_listings(self, ward, count):
+        """新着の物件を count 件、一覧の先頭に追加する"""
+        added = [(0, self._added + i) for i in range(count)]
+        self._added += count
+        self.listings(ward)[:0] = added
+
+    def revise_listing(self, ward, position):
+        """position 番目の物件の最初の部屋の家賃を下げる"""
+        self._revised.add((ward, self.listings(ward)[position]))
+
+    def remove_listing(self, ward, position):
+        self.listings(ward).pop(position)
+
+    def item_html(self, ward, page, index):
+        html = self.template
+        name = WARDS.get(ward, ward)
+        html = html.replace(TEMPLATE_NAME, f"{name}レジデンス{page}-{index}")
+        html = html.replace(TEMPLATE_ADDRESS, f"東京都{name}テスト町{index % 9 + 1}")
+        if (ward, (page, index)) in self._revised:
+            html = html.replace(TEMPLATE_RENT, REVISED_RENT, 1)
+        # 物件番号は区・ページ・位置から一意に決める
+        serial = f"{ward[-2:]}{page:05d}{index:03d}"
+        for room, (bukken_id, jnc) in enumerate(zip(TEMPLATE_IDS, TEMPLATE_JNC)):
+            html = html.replace(bukken_id, f"1{serial}{room}").replace(jnc, f"0{serial}{room}")
+        return html
+
+    def pagination_html(self, ward, page):
+        last = self.last_page(ward)
+        links = "".join(
+            f'<li><a href="{LISTING_PATH}?sc={ward}&amp;page={number}">{number}</a></li>'
+            for number in sorted({1, max(page - 1, 1), page, min(page + 1, last), last})
+            if number <= last
+        )
+        return f'<div class="pagination pagination_set-nav"><ol class="pagination-parts">{links}</ol></div>'
+
+    def page_html(self, ward, page):
+        start = (page - 1) * self.items_per_page
+        keys = self.listings(ward)[start:start + self.items_per_page] if page >= 1 else []
+        items = "\n".join(self.item_html(ward, *key) for key in keys)
+        return (
+            '<!DOCTYPE html><html><head><meta charset="utf-8"><title>一覧</title></head><body>'
+            f'<div id="js-bukkenList">{items}</div>{self.pagination_html(ward, page)}</body></html>'
+        )
+
+
+class FixtureServer:
+    """FixtureSite を HTTP で返す。error_rate の割合で 503 を返し、rate_limit 回/秒 を超えたら 429 を返す"""
+
+    def __init__(self, site=None, latency=0.0, error_rate=0.0, rate_limit=None, seed=0, port=0):
+        self.site = site or FixtureSite()
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._recent = []
+        self._active = 0
+        self.stats = {"requests": 0, "errors": 0, "throttled": 0, "max_concurrency": 0}
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self._thread = None
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.httpd.server_address[1]}"
+
+    @property
+    def url_template(self):
+        """engine.ScraperEngine.crawl_wards に渡す URL"""
+        return self.base_url + LISTING_PATH + "?sc={ward}&page={page}"
+
+    def _admit(self):
+        # 503 を返すか、429 を返すか、通常どおり返すかを決める
+        with self._lock:
+            self.stats["requests"] += 1
+            now = time.monotonic()
+            if self.rate_limit:
+                self._recent = [t for t in self._recent if now - t < 1.0]
+                if len(self._recent) >= self.rate_limit:
+                    self.stats["throttled"] += 1
+                    return 429
+                self._recent.append(now)
+            if self._random.random() < self.error_rate:
+                self.stats["errors"] += 1
+                return 503
+            self._active += 1
+            self.stats["max_concurrency"] = max(self.stats["max_concurrency"], self._active)
+            return 200
+
+    def _release(self):
+        with self._lock:
+            self._active -= 1
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlsplit(self.path)
+                if url.path != LISTING_PATH:
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+                status = server._admit()
+                if status != 200:
+                    self.send_response(status)
+                    if status == 429:
+                        self.send_header("Retry-After", "1")
+                    self.end_headers()
+                    return
+                try:
+                    time.sleep(server.latency)
+                    query = parse_qs(url.query)
+                    body = server.site.page_html(query["sc"][0], int(query.get("page", ["1"])[0])).encode("utf-8")
+                finally:
+                    server._release()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="test.txt から組み立てた一覧ページを返すテスト用サーバー")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--pages", type=int, default=5)
+    parser.add_argument("--items", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.0)
+    args = parser.parse_args()
+    server = FixtureServer(FixtureSite(pages_per_ward=args.pages, items_per_page=args.items),
+                           latency=args.latency, port=args.port)
+    print(f"serving {server.url_template}")
+    server.httpd.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,239 @@
+import re
+import json
+import math
+import hashlib
+import logging
+from collections import Counter
+from datetime import datetime
+
+from gspread.exceptions import WorksheetNotFound
+from gspread.utils import rowcol_to_a1
+
+from engine import WARDS
+
+# 物件DB の差分更新。部屋ごとの property_id(詳細URL の jnc_ 番号)と取得内容のハッシュを物件DB に持たせ、
+# 新着・変更のあった行だけを書き込み、掲載が終わった行を消す。変更がなければ何も書かないので、
+# アプリ側のキャッシュ(バージョンDB)も更新されない。
+# 一覧は新着順に並ぶので、1ページすべてが既知かつ変更なしの物件ならその区の残りのページは取得しない。
+# 途中で取得をやめた区では掲載終了を判定できないため、ときどき early_stop=False で全ページを取得する。
+#
+# 以前の物件DB は property_id が連番だった。migrate_legacy_ids で取得した部屋と突き合わせて jnc 番号に書き換え、
+# property_id を参照するシート(お気に入りDB など)も同じく書き換える。対応が付かない連番の行は消さずに残す。
+# 緯度・経度は物件DB 側で付けた値を残し、新着の行には geocode で付ける。
+
+logger = logging.getLogger(__name__)
+
+PROPERTY_SHEET = "物件DB"
+VERSION_SHEET = "バージョンDB"
+VERSION_HEADER = ["sheet_name", "version", "updated_at"]
+HASH_COLUMN = "content_hash"
+COORDINATE_COLUMNS = ["緯度", "経度"]
+# property_id で物件DB の行を参照するシート
+REFERENCING_SHEETS = ["お気に入りDB", "チャットデータDB", "評価DB"]
+# 連番の行と取得した部屋を突き合わせる列
+MATCH_COLUMNS = ["物件詳細URL", "階数", "家賃", "間取り", "面積"]
+_LISTING_ID = re.compile(r"\d{12}")
+
+
+def is_listing_id(property_id):
+    """詳細URL の jnc_ 番号(12桁)の property_id か。連番の property_id は False"""
+    return bool(_LISTING_ID.fullmatch(str(property_id)))
+
+
+def content_hash(row):
+    """取得した部屋のデータ(property_id を除く)のハッシュ"""
+    content = {key: value for key, value in row.items() if key != "property_id"}
+    return hashlib.sha1(json.dumps(content, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()[:16]
+
+
+def sheet_value(value):
+    # NaN や numpy の数値をシートに書ける値にする
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return ""
+    return value.item() if hasattr(value, "item") else value
+
+
+class ListingIndex:
+    """物件DB の現在の内容。property_id -> (行番号, ハッシュ, 区)。legacy は連番の property_id -> 行番号"""
+
+    def __init__(self, values):
+        self.values = values
+        self.header = list(values[0]) if values else []
+        self.rows = {}
+        self.legacy = {}
+        if "property_id" not in self.header:
+            return
+        id_col = self.header.index("property_id")
+        hash_col = self.header.index(HASH_COLUMN) if HASH_COLUMN in self.header else None
+        ward_col = self.header.index("区") if "区" in self.header else None
+        for number, row in enumerate(values[1:], start=2):
+            property_id = str(row[id_col]) if id_col < len(row) else ""
+            if not property_id or property_id in self.rows:
+                continue
+            digest = row[hash_col] if hash_col is not None and hash_col < len(row) else ""
+            ward = row[ward_col] if ward_col is not None and ward_col < len(row) else ""
+            self.rows[property_id] = (number, digest, ward)
+            if not is_listing_id(property_id):
+                self.legacy[property_id] = number
+
+    def __len__(self):
+        return len(self.rows)
+
+    def is_unchanged(self, row):
+        known = self.rows.get(row.get("property_id"))
+        return known is not None and known[1] == content_hash(row)
+
+    def diff(self, rows, complete_wards):
+        """取得した部屋のデータと比べ、(新着, 変更, 掲載終了の property_id, 変更なしの件数) を返す。
+        掲載終了は最終ページまで取得できた区(区コード)の物件だけで判定する。連番の property_id の行は掲載終了にしない"""
+        new, changed, seen = [], [], set()
+        for row in rows:
+            property_id = row.get("property_id")
+            if not property_id or property_id in seen:
+                continue
+            seen.add(property_id)
+            known = self.rows.get(property_id)
+            if known is None:
+                new.append(row)
+            elif known[1] != content_hash(row):
+                changed.append(row)
+        complete_names = {WARDS.get(ward, ward) for ward in complete_wards}
+        removed = [property_id for property_id, (_, _, ward) in self.rows.items()
+                   if property_id not in seen and ward in complete_names and property_id not in self.legacy]
+        return new, changed, removed, len(seen) - len(new) - len(changed)
+
+
+def _match_key(values):
+    # シートから読んだ文字列と加工済みの数値を同じ形にそろえる
+    key = []
+    for value in values:
+        try:
+            key.append(round(float(value), 2))
+        except (TypeError, ValueError):
+            key.append(str(value).strip())
+    return tuple(key)
+
+
+def migrate_legacy_ids(spreadsheet, index, frame):
+    """連番の property_id の行を、取得した部屋(加工済みの frame)と MATCH_COLUMNS で突き合わせ、
+    1対1に対応する行の property_id を jnc 番号に書き換える。REFERENCING_SHEETS の property_id も同じく書き換える。
+    {旧 property_id: 新 property_id} を返す"""
+    if not index.legacy or not len(frame) or any(column not in index.header for column in MATCH_COLUMNS):
+        return {}
+    columns = [index.header.index(column) for column in MATCH_COLUMNS]
+    legacy = {}
+    for property_id, number in index.legacy.items():
+        row = index.values[number - 1]
+        legacy[property_id] = _match_key(row[i] if i < len(row) else "" for i in columns)
+    scraped = {}
+    for record in frame[["property_id"] + MATCH_COLUMNS].to_dict("records"):
+        if record["property_id"] and record["property_id"] not in index.rows:
+            scraped[record["property_id"]] = _match_key(record[column] for column in MATCH_COLUMNS)
+    # 同じ部屋に見える行が複数あるものは、取り違えないように連番のまま残す
+    legacy_counts, scraped_counts = Counter(legacy.values()), Counter(scraped.values())
+    listing_ids = {key: property_id for property_id, key in scraped.items() if scraped_counts[key] == 1}
+    mapping = {property_id: listing_ids[key] for property_id, key in legacy.items()
+               if legacy_counts[key] == 1 and key in listing_ids}
+    if not mapping:
+        return {}
+
+    id_column = index.header.index("property_id") + 1
+    spreadsheet.worksheet(PROPERTY_SHEET).batch_update(
+        [{"range": rowcol_to_a1(index.legacy[old], id_column), "values": [[new]]} for old, new in mapping.items()])
+    for sheet_name in REFERENCING_SHEETS:
+        try:
+            sheet = spreadsheet.worksheet(sheet_name)
+        except WorksheetNotFound:
+            continue
+        values = sheet.get_all_values()
+        if not values or "property_id" not in values[0]:
+            continue
+        column = values[0].index("property_id")
+        updates = [{"range": rowcol_to_a1(number, column + 1), "values": [[mapping[str(row[column])]]]}
+                   for number, row in enumerate(values[1:], start=2)
+                   if column < len(row) and str(row[column]) in mapping]
+        if updates:
+            sheet.batch_update(updates)
+    logger.info("連番の property_id %d件を jnc 番号に書き換えました(残り %d件)", len(mapping), len(index.legacy) - len(mapping))
+    return mapping
+
+
+def add_coordinates(frame, geocode, property_ids):
+    """property_ids の行の アドレス を geocode(住所) -> (緯度, 経度) または None で変換し、緯度・経度 列に入れる。
+    同じ住所は1回だけ調べる"""
+    coordinates, found = {}, {column: [] for column in COORDINATE_COLUMNS}
+    for property_id, address in zip(frame["property_id"], frame["アドレス"]):
+        coords = None
+        if property_id in property_ids and isinstance(address, str) and address:
+            if address not in coordinates:
+                coordinates[address] = geocode(address)
+            coords = coordinates[address]
+        for column, value in zip(COORDINATE_COLUMNS, coords or (math.nan, math.nan)):
+            found[column].append(value)
+    return frame.assign(**found)
+
+
+def apply_changes(worksheet, index, frame, removed):
+    """加工済みの新着・変更行(frame)を書き込み、掲載終了の行を消す。
+    変更は1回の batch_update、新着は1回の append_rows、削除は連続する行ごとに delete_rows で行う"""
+    # 連番の property_id の行は、お気に入りDB などから参照されているので消さない
+    removed = [property_id for property_id in removed if property_id not in index.legacy]
+    header = list(index.header)
+    for column in frame.columns:
+        if column not in header:
+            header.append(column)
+    updates = []
+    if header != index.header:
+        updates.append({"range": f"A1:{rowcol_to_a1(1, len(header))}", "values": [header]})
+
+    appended, changed = [], 0
+    for record in frame.to_dict("records"):
+        values = {column: sheet_value(value) for column, value in record.items()}
+        known = index.rows.get(record["property_id"])
+        if known is None:
+            appended.append([values.get(column, "") for column in header])
+            continue
+        # 物件DB 側で追加された列と、既に付いている緯度・経度は元の値を残す
+        number = known[0]
+        current = index.values[number - 1]
+        row = []
+        for i, column in enumerate(header):
+            kept = current[i] if i < len(current) else ""
+            keep = column not in values or (column in COORDINATE_COLUMNS and kept != "")
+            row.append(kept if keep else values[column])
+        updates.append({"range": f"A{number}:{rowcol_to_a1(number, len(header))}", "values": [row]})
+        changed += 1
+
+    if updates:
+        worksheet.batch_update(updates)
+    if appended:
+        worksheet.append_rows(appended)
+    # 下の行から消せば、まだ消していない行の行番号は変わらない
+    numbers = sorted((index.rows[property_id][0] for property_id in removed), reverse=True)
+    blocks = []
+    for number in numbers:
+        if blocks and blocks[-1][0] == number + 1:
+            blocks[-1][0] = number
+        else:
+            blocks.append([number, number])
+    for start, end in blocks:
+        worksheet.delete_rows(start, end)
+    return len(appended), changed, len(removed)
+
+
+def bump_version(spreadsheet, sheet_name):
+    """バージョンDB の sheet_name の行を新しいバージョンにし、各アプリの frame_cache に読み直させる"""
+    sheet = spreadsheet.worksheet(VERSION_SHEET)
+    values = sheet.get_all_values()
+    version = datetime.now().strftime("%Y%m%d%H%M%S%f")
+    updated_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    if not values or values[0] != VERSION_HEADER:
+        sheet.insert_row(VERSION_HEADER, 1)
+        values = [VERSION_HEADER] + values
+    for i, row in enumerate(values[1:], start=2):
+        if row and row[0] == sheet_name:
+            sheet.update(f"A{i}:C{i}", [[sheet_name, version, updated_at]])
+            break
+    else:
+        sheet.append_row([sheet_name, version, updated_at])
+    return version
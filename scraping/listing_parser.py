@@ -0,0 +1,152 @@
+import re
+
+from lxml import etree
+
+# 一覧ページの解析を lxml の XPath で行う。scraping_suumo.parse_listing_page_soup(BeautifulSoup 版)と同じ結果を返す。
+# XPath はモジュールの読み込み時に1度だけコンパイルし、物件(cassetteitem)ごとに1回だけ辿る。
+# 建物の情報と画像・詳細URLは物件ごとに1回だけ取り出し、部屋(tbody)ごとには料金などの欄と部屋の詳細URLだけを読む。
+
+DETAIL_BASE_URL = "https://suumo.jp"
+
+_JNC_ID = re.compile(r"/jnc_(\d+)")
+_PARSER = etree.HTMLParser(encoding="utf-8")
+# BeautifulSoup の get_text と同じく、これらの要素の中の文字列は含めない
+_SKIP_TEXT = {"script", "style", "template"}
+
+
+def _has_class(name):
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+
+
+def _first(tag, name):
+    return etree.XPath(f"(.//{tag}[{_has_class(name)}])[1]")
+
+
+_ITEMS = etree.XPath(f"//div[{_has_class('cassetteitem')}]")
+_PAGINATION = etree.XPath(f"//ol[{_has_class('pagination-parts')}]//a")
+
+_TITLE = _first("div", "cassetteitem_content-title")
+_LABEL = _first("div", "cassetteitem_content-label")
+_ADDRESS = _first("li", "cassetteitem_detail-col1")
+_ACCESS = etree.XPath(f".//div[{_has_class('cassetteitem_detail-text')}]")
+_CONSTRUCTION = _first("li", "cassetteitem_detail-col3")
+_PROPERTY_IMAGE = _first("*", "cassetteitem_object-item")
+_FLOOR_PLAN_IMAGE = _first("*", "casssetteitem_other-thumbnail")
+# 物件詳細URL は物件の最初の部屋のリンク、property_id は部屋ごとのリンクから取る
+_DETAIL_LINK = etree.XPath("(.//a[contains(@href, '/chintai/jnc_')])[1]")
+_ROOM_TABLE = _first("table", "cassetteitem_other")
+_TBODYS = etree.XPath(".//tbody")
+_TDS = etree.XPath(".//td")
+_DIVS = etree.XPath(".//div")
+_FIRST_SPAN = etree.XPath("(.//span)[1]")
+_FIRST_IMG = etree.XPath("(.//img)[1]")
+
+# 部屋ごとの欄はクラス名から列名を引き、tbody を1回の XPath で辿って最初に見つかった要素を使う
+_ROOM_FIELDS = {
+    "cassetteitem_price--rent": "家賃",
+    "cassetteitem_price--administration": "管理費",
+    "cassetteitem_price--deposit": "敷金",
+    "cassetteitem_price--gratuity": "礼金",
+    "cassetteitem_madori": "間取り",
+    "cassetteitem_menseki": "面積",
+}
+_ROOM_CELLS = etree.XPath(".//*[contains(@class, 'cassetteitem_price--') or contains(@class, 'cassetteitem_madori')"
+                          " or contains(@class, 'cassetteitem_menseki')]")
+
+
+def property_id_from_url(url):
+    """部屋の詳細URL(/chintai/jnc_000088343514/...)から部屋ごとに一意な物件番号を返す"""
+    match = _JNC_ID.search(url or "")
+    return match.group(1) if match else None
+
+
+def _text(element):
+    """BeautifulSoup の get_text(strip=True) と同じ文字列を返す"""
+    if len(element) == 0:
+        return (element.text or "").strip()
+    parts = []
+    for event, node in etree.iterwalk(element, events=("start", "end")):
+        if event == "start":
+            if isinstance(node.tag, str) and node.tag not in _SKIP_TEXT and node.text:
+                parts.append(node.text.strip())
+        elif node is not element and node.tail:
+            parts.append(node.tail.strip())
+    return "".join(parts)
+
+
+def _first_text(xpath, element):
+    found = xpath(element)
+    return _text(found[0]) if found else None
+
+
+def _image_rel(xpath, item):
+    found = xpath(item)
+    if not found:
+        return None
+    image = _FIRST_IMG(found[0])
+    return image[0].get("rel") if image else None
+
+
+def _building(item):
+    # 建物ごとに同じ値になる欄。部屋ごとの行はこれをコピーして使う
+    label = _LABEL(item)
+    span = _FIRST_SPAN(label[0]) if label else None
+    construction = _CONSTRUCTION(item)
+    construction_info = _DIVS(construction[0]) if construction else None
+    link = _DETAIL_LINK(item)
+    return {
+        "名称": _first_text(_TITLE, item),
+        "カテゴリ": _text(span[0]) if span else None,
+        "アドレス": _first_text(_ADDRESS, item),
+        "アクセス": ", ".join(_text(station) for station in _ACCESS(item)),
+        "築年数": _text(construction_info[0]) if construction_info else None,
+        "構造": _text(construction_info[1]) if construction_info and len(construction_info) > 1 else None,
+    }, {
+        "物件画像URL": _image_rel(_PROPERTY_IMAGE, item),
+        "間取画像URL": _image_rel(_FLOOR_PLAN_IMAGE, item),
+        "物件詳細URL": DETAIL_BASE_URL + link[0].get("href") if link else None,
+    }
+
+
+def _room_fields(tbody):
+    found = {}
+    for element in _ROOM_CELLS(tbody):
+        for name in element.get("class").split():
+            column = _ROOM_FIELDS.get(name)
+            if column and column not in found:
+                found[column] = _text(element)
+    return {column: found.get(column) for column in _ROOM_FIELDS.values()}
+
+
+def _rooms(item):
+    table = _ROOM_TABLE(item)
+    return _TBODYS(table[0]) if table else []
+
+
+def parse_listing_page(html):
+    """
+    html (bytes | str): 一覧ページの HTML
+    Returns:
+    (list[dict], int): 部屋ごとのデータと最終ページ番号
+    """
+    if isinstance(html, str):
+        html = html.encode("utf-8")
+    root = etree.fromstring(html, _PARSER) if html.strip() else None
+    if root is None:
+        return [], 1
+
+    all_data = []
+    for item in _ITEMS(root):
+        base_data, links = _building(item)
+        for tbody in _rooms(item):
+            data = base_data.copy()
+            tds = _TDS(tbody)
+            data["階数"] = _text(tds[2]) if len(tds) > 2 else None
+            data.update(_room_fields(tbody))
+            data.update(links)
+            link = _DETAIL_LINK(tbody)
+            data["property_id"] = property_id_from_url(link[0].get("href")) if link else None
+            all_data.append(data)
+
+    pages = [text for text in (_text(a) for a in _PAGINATION(root)) if text.isdigit()]
+    return all_data, max(map(int, pages)) if pages else 1
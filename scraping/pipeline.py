@@ -0,0 +1,236 @@
+import time
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from engine import FetchError
+from incremental import sheet_value
+
+# スクレイピング → 解析 → 加工 → 書き込み をページとチャンク単位で流すパイプライン。
+# 各段階はジェネレーターでつながり、下流が次のチャンクを求めたときだけ上流が進む(取得の先読みは window ページまで)。
+# そのため全件をメモリに溜めず、使うメモリは先読みのページと1チャンク分で一定になる。
+# チャンクを書き込むたびに、書き込み先(生データ・加工データ)ごとにそのページを Checkpoint に記録するので、
+# 途中で落ちても失うのは書き込み中の1チャンクだけで、次の実行は書き込み済みのページを飛ばして続きから始まる。
+# 片方だけ書き込んだページは取り直し、まだ書いていない方にだけ書き込む。重複を除くための property_id も記録して引き継ぐ。
+# 別の条件の実行や max_age 秒より前に始めた実行の記録は使わず、最初からやり直す。段階ごとの件数・時間は report() で確認できる。
+
+logger = logging.getLogger(__name__)
+
+# 加工後の列。アクセスは最大3つで、チャンクによって列が欠けないように常にすべて書き込む
+ACCESS_COLUMNS = sorted(f"アクセス①{i}{name}" for i in range(1, 4) for name in ["線路名", "駅名", "徒歩(分)"])
+ADDRESS_COLUMNS = ["区", "市町"]
+
+
+class StageStats:
+    def __init__(self, name):
+        self.name = name
+        self.items = 0
+        self.rows = 0
+        self.sec = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, items, rows, sec):
+        with self._lock:
+            self.items += items
+            self.rows += rows
+            self.sec += sec
+
+    def summary(self):
+        with self._lock:
+            return {"items": self.items, "rows": self.rows, "sec": self.sec,
+                    "rows_per_sec": self.rows / self.sec if self.sec else 0.0}
+
+
+class SheetWriter:
+    """DataFrame のチャンクをワークシートに追記する。reset なら最初のチャンクの前にシートを空にして見出しを書く"""
+
+    def __init__(self, worksheet):
+        self.worksheet = worksheet
+        self.columns = None
+
+    def start(self, reset):
+        self.columns = None
+        if reset:
+            self.worksheet.clear()
+        else:
+            # 続きから書き込むときは既存の見出しの列順に合わせる
+            self.columns = self.worksheet.row_values(1) or None
+
+    def write(self, frame):
+        values = []
+        if self.columns is None:
+            self.columns = list(frame.columns)
+            values.append(self.columns)
+        frame = frame.reindex(columns=self.columns)
+        values.extend([sheet_value(value) for value in row] for row in frame.itertuples(index=False))
+        self.worksheet.append_rows(values)
+
+
+class StreamingPipeline:
+    def __init__(self, engine, parse_page, process, raw_writer=None, processed_writer=None,
+                 chunk_rows=1000, window=None, checkpoint=None, max_age=12 * 60 * 60):
+        """
+        engine (engine.ScraperEngine): ページの取得に使う(セッション・レート制限・再試行)
+        parse_page (callable): html から (部屋ごとのデータ, 最終ページ番号) を返す
+        process (callable): 生データの DataFrame を加工する(process_real_estate_data)
+        chunk_rows (int): 加工・書き込みをまとめて行う行数の目安。チャンクはページの区切りで切る
+        window (int): 取得・解析を先に進めてよいページ数。省略すると engine.max_workers
+        max_age (float): この秒数より前に始めた実行のチェックポイントからは再開しない
+        """
+        self.engine = engine
+        self.parse_page = parse_page
+        self.process = process
+        self.raw_writer = raw_writer
+        self.processed_writer = processed_writer
+        self.chunk_rows = chunk_rows
+        self.window = window or engine.max_workers
+        self.checkpoint = checkpoint
+        self.max_age = max_age
+        self.outputs = [(stage, writer) for stage, writer in [("raw", raw_writer), ("processed", processed_writer)]
+                        if writer is not None]
+        self.stages = {name: StageStats(name) for name in ["fetch", "parse", "normalize", "write"]}
+        self.failed = 0
+        self.duplicates = 0
+        self.wall_sec = 0.0
+
+    def _fetch_and_parse(self, url):
+        start = time.perf_counter()
+        html = self.engine.fetch(url)
+        parsed = time.perf_counter()
+        rows, last_page = self.parse_page(html)
+        self.stages["fetch"].add(1, 0, parsed - start)
+        self.stages["parse"].add(1, len(rows), time.perf_counter() - parsed)
+        return rows, last_page
+
+    def _done_pages(self, ward):
+        # すべての書き込み先に書き込み済みのページ
+        if self.checkpoint is None or not self.outputs:
+            return set()
+        return set.intersection(*(self.checkpoint.done_pages(ward, stage) for stage, _ in self.outputs))
+
+    def pages(self, url_template, wards, max_page=None):
+        """(区, ページ, 部屋ごとのデータ) を返すジェネレーター。書き込み済みのページは飛ばす"""
+        done = {ward: self._done_pages(ward) for ward in wards}
+        jobs = deque()
+
+        def follow(ward, last_page):
+            last_page = min(last_page or 1, max_page) if max_page else (last_page or 1)
+            return [(ward, page) for page in range(2, last_page + 1) if page not in done[ward]]
+
+        for ward in wards:
+            last_page = self.checkpoint.last_page(ward) if self.checkpoint else None
+            jobs.extend(follow(ward, last_page) if 1 in done[ward] and last_page else [(ward, 1)])
+
+        pending = deque()
+        with ThreadPoolExecutor(max_workers=self.engine.max_workers) as pool:
+            try:
+                while jobs or pending:
+                    while jobs and len(pending) < self.window:
+                        ward, page = jobs.popleft()
+                        pending.append((ward, page, pool.submit(self._fetch_and_parse,
+                                                                url_template.format(ward=ward, page=page))))
+                    ward, page, future = pending.popleft()
+                    try:
+                        rows, last_page = future.result()
+                    except FetchError as e:
+                        logger.warning("ページを取得できませんでした: %s", e)
+                        self.failed += 1
+                        continue
+                    if page == 1:
+                        if self.checkpoint is not None:
+                            self.checkpoint.set_last_page(ward, last_page)
+                        # その区の残りのページを、まだ取得していない区より先に取得する
+                        jobs.extendleft(reversed(follow(ward, last_page)))
+                    if page not in done[ward]:
+                        yield ward, page, rows
+            finally:
+                for _, _, future in pending:
+                    future.cancel()
+
+    def chunks(self, pages):
+        """ページを chunk_rows 行ほどにまとめ、((区, ページ), 部屋ごとのデータ) のリストを返すジェネレーター"""
+        chunk, rows = [], 0
+        for ward, page, page_rows in pages:
+            chunk.append(((ward, page), page_rows))
+            rows += len(page_rows)
+            if rows >= self.chunk_rows:
+                yield chunk
+                chunk, rows = [], 0
+        if chunk:
+            yield chunk
+
+    def run(self, url_template, wards, max_page=None):
+        """全ページを流して書き込み、段階ごとの集計を返す。すべて書き込めたらチェックポイントを消す"""
+        resumed = False
+        if self.checkpoint is not None:
+            name = f"{url_template}|{','.join(wards)}|{max_page}"
+            resumed = (self.checkpoint.begin(name, self.max_age)
+                       and any(self.checkpoint.done_pages(ward, stage) for ward in wards for stage, _ in self.outputs))
+        for _, writer in self.outputs:
+            writer.start(reset=not resumed)
+        done = {stage: {ward: self.checkpoint.done_pages(ward, stage) if resumed else set() for ward in wards}
+                for stage, _ in self.outputs}
+        # 重複は property_id で除く(覚えるのは id だけなので行数に比べて小さい)。再開したときは前回書き込んだ分から始める
+        seen = self.checkpoint.seen_ids() if resumed else set()
+        start = time.perf_counter()
+        for chunk in self.chunks(self.pages(url_template, wards, max_page)):
+            keys = [key for key, _ in chunk]
+            unique, owners = [], []
+            for key, rows in chunk:
+                for row in rows:
+                    property_id = row.get("property_id")
+                    if property_id is not None and property_id in seen:
+                        self.duplicates += 1
+                        continue
+                    seen.add(property_id)
+                    unique.append(row)
+                    owners.append(key)
+            frames = {}
+            if unique:
+                step = time.perf_counter()
+                frames["raw"] = pd.DataFrame(unique)
+                if self.processed_writer is not None:
+                    processed = self.process(frames["raw"])
+                    frames["processed"] = processed.reindex(
+                        columns=list(frames["raw"].columns) + ADDRESS_COLUMNS + ACCESS_COLUMNS)
+                self.stages["normalize"].add(1, len(unique), time.perf_counter() - step)
+
+            step = time.perf_counter()
+            for stage, writer in self.outputs:
+                if unique:
+                    # 前回の実行でこの書き込み先まで書き込んだページの行は書かない
+                    todo = [page not in done[stage][ward] for ward, page in owners]
+                    frame = frames[stage] if all(todo) else frames[stage][todo]
+                    if len(frame):
+                        writer.write(frame)
+                if self.checkpoint is not None:
+                    # 最後の書き込み先まで終わったら、そのチャンクの property_id を重複の判定用に残す
+                    last = stage == self.outputs[-1][0]
+                    self.checkpoint.mark_done(keys, stage, [row.get("property_id") for row in unique
+                                                            if row.get("property_id") is not None] if last else ())
+            if unique:
+                self.stages["write"].add(1, len(unique), time.perf_counter() - step)
+        self.wall_sec = time.perf_counter() - start
+        if self.checkpoint is not None and not self.failed:
+            self.checkpoint.clear()
+        logger.info("\n%s", self.report())
+        return self.summary()
+
+    def summary(self):
+        return dict({name: stage.summary() for name, stage in self.stages.items()},
+                    failed=self.failed, duplicates=self.duplicates, wall_sec=self.wall_sec)
+
+    def report(self):
+        labels = {"fetch": "取得", "parse": "解析", "normalize": "加工", "write": "書き込み"}
+        units = {"fetch": "ページ", "parse": "ページ", "normalize": "チャンク", "write": "チャンク"}
+        lines = []
+        for name, stage in self.stages.items():
+            summary = stage.summary()
+            rate = summary["items"] / summary["sec"] if summary["sec"] else 0.0
+            lines.append(f"{labels[name]}: {summary['items']:6d}{units[name]} {summary['rows']:8d}行 "
+                         f"{summary['sec']:7.2f}秒  {rate:8.1f}{units[name]}/秒 {summary['rows_per_sec']:9.0f}行/秒")
+        lines.append(f"全体: {self.wall_sec:.2f}秒  失敗 {self.failed}ページ  重複 {self.duplicates}行")
+        return "\n".join(lines)
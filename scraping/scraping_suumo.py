@@ -0,0 +1,414 @@
+import os
+import re
+import argparse
+import pandas as pd
+import numpy as np
+from bs4 import BeautifulSoup
+import gspread
+from google.oauth2.service_account import Credentials
+from gspread_dataframe import set_with_dataframe
+from dotenv import load_dotenv
+
+from engine import ScraperEngine, Checkpoint, WARDS, SUUMO_URL, SUUMO_NEW_ARRIVALS_URL
+from pipeline import StreamingPipeline, SheetWriter
+from incremental import (ListingIndex, PROPERTY_SHEET, HASH_COLUMN, content_hash, apply_changes, bump_version,
+                         migrate_legacy_ids, add_coordinates)
+from listing_parser import parse_listing_page, property_id_from_url, DETAIL_BASE_URL
+
+# scraping_suumo.ipynb と 参考/.../Step3_Scraping_sample01.py のスクレイピング処理をまとめたもの。
+# ページの取得は engine.ScraperEngine、一覧ページの解析は listing_parser に任せ、ここではデータ加工を行う。
+# main() は pipeline.StreamingPipeline で取得・加工・書き込みをチャンクごとに行う。
+# 実行方法: cd scraping && python scraping_suumo.py
+
+# 環境変数の読み込み
+load_dotenv()
+
+# 環境変数から認証情報を取得
+SPREADSHEET_ID = os.getenv("SPREADSHEET_ID")
+PRIVATE_KEY_PATH = os.getenv("PRIVATE_KEY_PATH")
+
+# Google スプレッドシートへの認証を行い、gspreadクライアントオブジェクトを返す関数。
+def authenticate_spreadsheet():
+    scopes = [
+        'https://www.googleapis.com/auth/spreadsheets',
+        'https://www.googleapis.com/auth/drive'
+    ]
+    credentials = Credentials.from_service_account_file(
+        PRIVATE_KEY_PATH,
+        scopes=scopes
+    )
+    return gspread.authorize(credentials)
+
+# スプレッドシートにDataFrameを書き込む関数
+def write_to_spreadsheet(client, sheet_key, sheet_name, dataframe):
+    """
+    client (gspread.Client): gspreadのクライアントオブジェクト
+    sheet_key (str): スプレッドシートのキー
+    sheet_name (str): 書き込み対象のシート名
+    dataframe (pandas.DataFrame): 書き込むデータを含むDataFrame
+    """
+    spreadsheet = client.open_by_key(sheet_key)
+    worksheet = spreadsheet.worksheet(sheet_name)
+    set_with_dataframe(worksheet, dataframe)
+
+# 一覧ページの最終ページ番号を返す関数。ページ送りがなければ 1
+def get_last_page(soup):
+    pages = [int(a.get_text(strip=True)) for a in soup.select("ol.pagination-parts a") if a.get_text(strip=True).isdigit()]
+    return max(pages) if pages else 1
+
+# 一覧ページの HTML から物件データを取り出す関数(BeautifulSoup 版)。
+# 通常は listing_parser.parse_listing_page を使い、こちらは結果の照合に使う。
+def parse_listing_page_soup(html):
+    """
+    html (bytes | str): 一覧ページの HTML
+    Returns:
+    (list[dict], int): 部屋ごとのデータと最終ページ番号
+    """
+    soup = BeautifulSoup(html, 'lxml')
+    items = soup.findAll("div", {"class": "cassetteitem"})
+    all_data = []
+
+    for item in items:
+        base_data = {}
+        base_data["名称"]     = item.find("div", {"class": "cassetteitem_content-title"}).get_text(strip=True) if item.find("div", {"class": "cassetteitem_content-title"}) else None
+        base_data["カテゴリ"] = item.find("div", {"class": "cassetteitem_content-label"}).span.get_text(strip=True) if item.find("div", {"class": "cassetteitem_content-label"}) else None
+        base_data["アドレス"] = item.find("li", {"class": "cassetteitem_detail-col1"}).get_text(strip=True) if item.find("li", {"class": "cassetteitem_detail-col1"}) else None
+
+        # 駅のアクセス情報をまとめて取得
+        base_data["アクセス"] = ", ".join([station.get_text(strip=True) for station in item.findAll("div", {"class": "cassetteitem_detail-text"})])
+
+        construction_info = item.find("li", {"class": "cassetteitem_detail-col3"}).find_all("div") if item.find("li", {"class": "cassetteitem_detail-col3"}) else None
+        base_data["築年数"] = construction_info[0].get_text(strip=True) if construction_info and len(construction_info) > 0 else None
+        base_data["構造"] = construction_info[1].get_text(strip=True) if construction_info and len(construction_info) > 1 else None
+
+        tbodys = item.find("table", {"class": "cassetteitem_other"}).findAll("tbody")
+
+        for tbody in tbodys:
+            data = base_data.copy()
+            # 階数情報の正確な取得
+            floor_info = tbody.find_all("td")[2].get_text(strip=True) if len(tbody.find_all("td")) > 2 else None
+            data["階数"]   = floor_info
+            data["家賃"]   = tbody.select_one(".cassetteitem_price--rent").get_text(strip=True) if tbody.select_one(".cassetteitem_price--rent") else None
+            data["管理費"] = tbody.select_one(".cassetteitem_price--administration").get_text(strip=True) if tbody.select_one(".cassetteitem_price--administration") else None
+            data["敷金"]   = tbody.select_one(".cassetteitem_price--deposit").get_text(strip=True) if tbody.select_one(".cassetteitem_price--deposit") else None
+            data["礼金"]   = tbody.select_one(".cassetteitem_price--gratuity").get_text(strip=True) if tbody.select_one(".cassetteitem_price--gratuity") else None
+            data["間取り"] = tbody.select_one(".cassetteitem_madori").get_text(strip=True) if tbody.select_one(".cassetteitem_madori") else None
+            data["面積"]   = tbody.select_one(".cassetteitem_menseki").get_text(strip=True) if tbody.select_one(".cassetteitem_menseki") else None
+
+            # 物件画像・間取り画像・詳細URLの取得を最後に行う
+            property_image_element = item.find(class_="cassetteitem_object-item")
+            data["物件画像URL"] = property_image_element.img["rel"] if property_image_element and property_image_element.img else None
+
+            floor_plan_image_element = item.find(class_="casssetteitem_other-thumbnail")
+            data["間取画像URL"] = floor_plan_image_element.img["rel"] if floor_plan_image_element and floor_plan_image_element.img else None
+
+            property_link_element = item.select_one("a[href*='/chintai/jnc_']")
+            data["物件詳細URL"] = DETAIL_BASE_URL + property_link_element['href'] if property_link_element else None
+
+            # 部屋ごとの詳細URLから、再取得しても変わらない property_id を取る
+            room_link_element = tbody.select_one("a[href*='/chintai/jnc_']")
+            data["property_id"] = property_id_from_url(room_link_element['href']) if room_link_element else None
+
+            all_data.append(data)
+
+    return all_data, get_last_page(soup)
+
+# 指定されたURLから不動産データをスクレイピングする関数。
+def scrape_real_estate_data(base_url, max_page, engine=None):
+    """
+    base_url (str): スクレイピングの基本となるURL。{} にページ番号が入る
+    max_page (int): スクレイピングする最大ページ数
+    """
+    engine = engine or ScraperEngine(parse_listing_page)
+    return engine.crawl_pages(base_url, range(1, max_page + 1))
+
+# 区ごとに全ページをスクレイピングする関数。checkpoint_path を指定すると途中から再開できる
+# 同じ条件で max_age 秒以内に始めた実行の続きだけを再開し、失敗したページがなければチェックポイントを消す
+def scrape_wards(wards=None, max_page=None, url_template=SUUMO_URL, checkpoint_path=None, max_age=12 * 60 * 60,
+                 **engine_options):
+    """
+    wards (list[str]): 区コード(例: "13101")。省略すると23区すべて
+    max_page (int): 区ごとの最大ページ数。省略すると最終ページまで
+    max_age (float): この秒数より前に始めた実行のチェックポイントからは再開しない
+    """
+    wards = wards or list(WARDS)
+    checkpoint = Checkpoint(checkpoint_path) if checkpoint_path else None
+    if checkpoint is not None:
+        checkpoint.begin(f"{url_template}|{','.join(wards)}|{max_page}", max_age)
+    engine = ScraperEngine(parse_listing_page, checkpoint=checkpoint, **engine_options)
+    rows = engine.crawl_wards(url_template, wards, max_page)
+    if checkpoint is not None and engine.stats()["failed"] == 0:
+        checkpoint.clear()
+    return rows
+
+# 築年数の加工
+def process_construction_year(x):
+    return 0 if x == '新築' else int(re.split('[築年]', x)[1])
+
+# 構造：階建情報の取得
+def get_most_floor(x):
+    if '階建' not in x:
+        return np.nan
+    elif 'B' not in x:
+        floor_list = list(map(int, re.findall(r'(\d+)階建', str(x))))
+        return min(floor_list)
+    else:
+        return np.nan
+
+# 階数の取得
+def get_floor(x):
+    if '階' not in x:
+        return np.nan
+    elif 'B' not in x:
+        floor_list = list(map(int, re.findall(r'(\d+)階', str(x))))
+        return min(floor_list)
+    else:
+        floor_list = list(map(int, re.findall(r'(\d+)階', str(x))))
+        return -1 * min(floor_list)
+
+# 費用の変換
+def change_fee(x, unit):
+    if unit not in x:
+        return np.nan
+    else:
+        return float(x.split(unit)[0])
+
+# 面積の変換
+def process_area(x):
+    return float(x[:-2])
+
+# 住所の分割
+def split_address(x, start, end):
+    return x[x.find(start)+1:x.find(end)+1]
+
+# アクセス情報の分割
+def split_access(row):
+    accesses = row['アクセス'].split(', ')
+    results = {}
+
+    for i, access in enumerate(accesses, start=1):
+        if i > 3:
+            break  # 最大3つのアクセス情報のみを考慮
+
+        parts = access.split('/')
+        if len(parts) == 2:
+            line_station, walk = parts
+            # ' 歩'で分割できるか確認
+            if ' 歩' in walk:
+                station, walk_min = walk.split(' 歩')
+                # 歩数の分の数値だけを抽出
+                walk_min = int(re.search(r'\d+', walk_min).group())
+            else:
+                station = None
+                walk_min = None
+        else:
+            line_station = access
+            station = walk_min = None
+
+        results[f'アクセス①{i}線路名'] = line_station
+        results[f'アクセス①{i}駅名'] = station
+        results[f'アクセス①{i}徒歩(分)'] = walk_min
+
+    return pd.Series(results)
+
+
+# データ加工のメイン関数(1行ずつ処理する版)。
+# 通常は process_real_estate_data を使い、こちらは結果の照合に使う。
+def process_real_estate_data_apply(dataframe):
+    """
+    不動産データを加工する関数。
+    Args:
+    dataframe (pandas.DataFrame): 加工する不動産データが含まれるDataFrame
+    Returns:
+    pandas.DataFrame: 加工後のDataFrame
+    """
+    dataframe['築年数'] = dataframe['築年数'].apply(process_construction_year)
+    dataframe['構造'] = dataframe['構造'].apply(get_most_floor)
+    dataframe['階数'] = dataframe['階数'].apply(get_floor)
+    dataframe['家賃'] = dataframe['家賃'].apply(lambda x: change_fee(x, '万円'))
+    dataframe['敷金'] = dataframe['敷金'].apply(lambda x: change_fee(x, '万円'))
+    dataframe['礼金'] = dataframe['礼金'].apply(lambda x: change_fee(x, '万円'))
+    dataframe['管理費'] = dataframe['管理費'].apply(lambda x: change_fee(x, '円'))
+    dataframe['面積'] = dataframe['面積'].apply(process_area)
+    dataframe['区'] = dataframe['アドレス'].apply(lambda x: split_address(x, "都", "区"))
+    dataframe['市町'] = dataframe['アドレス'].apply(lambda x: split_address(x, "区", ""))
+    dataframe = dataframe.join(dataframe.apply(split_access, axis=1))
+    return dataframe
+
+# 文字列以外の値(None・数値など)を欠損値にする
+def _text_column(column):
+    if pd.api.types.is_string_dtype(column):
+        return column
+    return column.where(column.map(lambda value: isinstance(value, str)), None)
+
+# 欠損値がなければ元の関数と同じく整数の列にする
+def _int_if_complete(series):
+    return series.astype("int64") if series.notna().all() else series.astype("float64")
+
+# 正規表現で取り出した数字の列を数値にする。int() と同じく全角数字も読む
+def _digits(series):
+    return series.map(int, na_action="ignore").astype("float64")
+
+# 各行の正規表現の一致のうち最小の数値。一致がなければ NaN
+def _min_match(column, pattern):
+    found = column.str.findall(pattern)
+    return found.map(lambda matches: min(map(int, matches)) if matches else np.nan, na_action="ignore").astype("float64")
+
+# アクセス情報の分割(列ごとにまとめて処理する版)。split_access を全行に適用した結果と同じ列を返す
+def split_access_columns(access):
+    accesses = access.str.split(", ", n=3, expand=True)
+    count = min(accesses.shape[1], 3) if access.notna().any() else 0
+    columns = {}
+    for i in range(count):
+        part = accesses[i]
+        # "線路名/駅名 歩N分" のように / が1つだけのときに駅名と徒歩を取り出す
+        pieces = part.str.extract(r"^([^/]*)/([^/]*)$")
+        walk = pieces[1].where(pieces[1].str.count(" 歩") == 1)
+        station = walk.str.extract(r"^(.*?) 歩", expand=False)
+        minutes = _digits(walk.str.extract(r" 歩\D*(\d+)", expand=False))
+        # すべての行で駅名・徒歩がないときは、split_access の None と同じく object 型の None にする
+        missing = pd.Series([None] * len(access), index=access.index, dtype=object)
+        columns[f'アクセス①{i + 1}線路名'] = pieces[0].where(pieces[0].notna(), part)
+        columns[f'アクセス①{i + 1}駅名'] = station if station.notna().any() else missing
+        columns[f'アクセス①{i + 1}徒歩(分)'] = _int_if_complete(minutes) if minutes.notna().any() else missing
+    frame = pd.DataFrame(columns, index=access.index)
+    # apply(axis=1) は行ごとの列がそろわないとき列名順に並べるので、それに合わせる
+    if count and accesses.iloc[:, :count].notna().sum(axis=1).nunique() > 1:
+        frame = frame[sorted(frame.columns)]
+    return frame
+
+# データ加工のメイン関数。列ごとにまとめて処理し、形式が崩れた値は NaN にする
+def process_real_estate_data(dataframe):
+    """
+    不動産データを加工する関数。process_real_estate_data_apply と同じ結果を返す。
+    Args:
+    dataframe (pandas.DataFrame): 加工する不動産データが含まれるDataFrame
+    Returns:
+    pandas.DataFrame: 加工後のDataFrame
+    """
+    dataframe = dataframe.copy()
+    text = {column: _text_column(dataframe[column]) for column in
+            ['築年数', '構造', '階数', '家賃', '敷金', '礼金', '管理費', '面積', 'アドレス', 'アクセス']}
+
+    years = _digits(text['築年数'].str.extract(r"^[^築年]*[築年](\d+)(?:[築年]|$)", expand=False))
+    dataframe['築年数'] = _int_if_complete(years.mask(text['築年数'] == '新築', 0))
+
+    has_basement = text['構造'].str.contains('B', regex=False)
+    dataframe['構造'] = _int_if_complete(_min_match(text['構造'], r"(\d+)階建").mask(has_basement.fillna(True)))
+
+    floors = _min_match(text['階数'], r"(\d+)階")
+    dataframe['階数'] = _int_if_complete(floors.mask(text['階数'].str.contains('B', regex=False).fillna(False), -floors))
+
+    for column, unit in [('家賃', '万円'), ('敷金', '万円'), ('礼金', '万円'), ('管理費', '円')]:
+        fee = text[column].str.split(unit, n=1, regex=False).str[0].where(text[column].str.contains(unit, regex=False).fillna(False))
+        dataframe[column] = pd.to_numeric(fee, errors="coerce").astype("float64")
+    dataframe['面積'] = pd.to_numeric(text['面積'].str[:-2], errors="coerce").astype("float64")
+
+    # split_address(x, "都", "区") と同じく、都の後から最初の区まで(都がなければ先頭から)。区の後に都があれば空
+    address = text['アドレス']
+    ward = address.str.extract(r"^(?:[^都区]*都([^区]*区)|([^都区]*区)[^都]*$)")
+    dataframe['区'] = ward[0].fillna(ward[1]).where(address.isna() | ward.notna().any(axis=1), "")
+    # split_address(x, "区", "") は区を含む住所では空文字、含まない住所では先頭の1文字を返す
+    dataframe['市町'] = address.str[:1].mask(address.str.contains('区', regex=False).fillna(False), "")
+
+    return dataframe.join(split_access_columns(text['アクセス']))
+
+# 住所から (緯度, 経度) を返す関数を作る関数。geopy がなければ None
+def make_geocoder():
+    try:
+        from geopy.geocoders import Nominatim
+        from geopy.extra.rate_limiter import RateLimiter
+    except ImportError:
+        return None
+    # Nominatim の利用規約に合わせて1秒に1回まで
+    geocode = RateLimiter(Nominatim(user_agent="MoveMate").geocode, min_delay_seconds=1)
+
+    def lookup(address):
+        location = geocode(address)
+        return (location.latitude, location.longitude) if location else None
+    return lookup
+
+# 物件DB を新着・変更・掲載終了の分だけ更新する関数。変更があったときだけバージョンDB を更新する
+def scrape_incremental(spreadsheet, wards=None, max_page=None, url_template=SUUMO_NEW_ARRIVALS_URL,
+                       early_stop=True, geocode=None, **engine_options):
+    """
+    spreadsheet (gspread.Spreadsheet): 物件DB とバージョンDB を含むスプレッドシート
+    early_stop (bool): 既知で変更のない物件だけのページが出たら、その区の残りのページを取得しない
+    geocode (callable): 住所から (緯度, 経度) を返す関数。新着の行の緯度・経度に使う。省略すると空欄のまま
+    Returns:
+    dict: 新着・変更・掲載終了・変更なしの件数、property_id を書き換えた件数と取得したページ数
+    """
+    worksheet = spreadsheet.worksheet(PROPERTY_SHEET)
+    index = ListingIndex(worksheet.get_all_values())
+    engine = ScraperEngine(parse_listing_page, **engine_options)
+
+    def stop(ward, rows):
+        return early_stop and all(index.is_unchanged(row) for row in rows)
+
+    results = engine.crawl_until(url_template, wards or list(WARDS), stop, max_page)
+    rows = [row for ward_rows, _ in results.values() for row in ward_rows]
+    complete = [ward for ward, (_, done) in results.items() if done]
+
+    # 連番の property_id の行が残っていれば、取得した部屋と突き合わせて jnc 番号に書き換えてから差分を取る
+    migrated = {}
+    candidates = [row for row in rows if row.get("property_id") and row["property_id"] not in index.rows]
+    if index.legacy and candidates:
+        migrated = migrate_legacy_ids(spreadsheet, index, process_real_estate_data(pd.DataFrame(candidates)))
+        if migrated:
+            index = ListingIndex(worksheet.get_all_values())
+    new, changed, removed, unchanged = index.diff(rows, complete)
+
+    if new or changed or removed:
+        frame = pd.DataFrame(new + changed)
+        if len(frame):
+            frame = process_real_estate_data(frame)
+            frame[HASH_COLUMN] = [content_hash(row) for row in new + changed]
+            if geocode is not None:
+                frame = add_coordinates(frame, geocode, {row["property_id"] for row in new})
+        apply_changes(worksheet, index, frame, removed)
+        bump_version(spreadsheet, PROPERTY_SHEET)
+    return {"new": len(new), "changed": len(changed), "removed": len(removed), "unchanged": unchanged,
+            "migrated": len(migrated), "pages": engine.stats()["pages"], "complete_wards": len(complete)}
+
+# メイン処理部分
+def main():
+    parser = argparse.ArgumentParser(description="SUUMO の賃貸物件をスクレイピングしてスプレッドシートに書き込む")
+    parser.add_argument("--incremental", action="store_true", help="物件DB を差分だけ更新する")
+    parser.add_argument("--no-early-stop", action="store_true", help="差分更新でも全ページを取得して掲載終了を判定する")
+    args = parser.parse_args()
+
+    if args.incremental:
+        print("1.スプレッドシートアクセス認証")
+        spreadsheet = authenticate_spreadsheet().open_by_key(SPREADSHEET_ID)
+        print("2.物件DB の差分更新開始")
+        geocode = make_geocoder()
+        if geocode is None:
+            print("geopy がインストールされていないため、新着の物件の緯度・経度は空欄になります")
+        summary = scrape_incremental(spreadsheet, max_page=int(os.getenv("SCRAPE_MAX_PAGE", "0")) or None,
+                                     early_stop=not args.no_early_stop, geocode=geocode)
+        print("2.物件DB の差分更新完了", summary)
+        return
+
+    # スプレッドシートの認証
+    print("1.スプレッドシートアクセス認証")
+    spreadsheet = authenticate_spreadsheet().open_by_key(SPREADSHEET_ID)
+
+    # スクレイピング → 加工 → 書き込み をチャンクごとに行う。途中で止まっても次回は続きから始まる
+    tab_w0 = "tech0_90"
+    tab_w1 = "tech0_91"
+    max_page = int(os.getenv("SCRAPE_MAX_PAGE", "0")) or None
+    print("2.スクレイピング・加工・書き込み開始", " : ページ数", max_page or "全ページ", " : タブ名", tab_w0, tab_w1)
+    os.makedirs(".cache", exist_ok=True)
+    pipeline = StreamingPipeline(
+        ScraperEngine(parse_listing_page), parse_listing_page, process_real_estate_data,
+        raw_writer=SheetWriter(spreadsheet.worksheet(tab_w0)),
+        processed_writer=SheetWriter(spreadsheet.worksheet(tab_w1)),
+        chunk_rows=int(os.getenv("SCRAPE_CHUNK_ROWS", "1000")),
+        checkpoint=Checkpoint(os.path.join(".cache", "scrape_checkpoint.sqlite3")),
+    )
+    pipeline.run(SUUMO_URL, list(WARDS), max_page)
+    print("2.スクレイピング・加工・書き込み完了")
+    print(pipeline.report())
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+import random
+
+import numpy as np
+import pandas as pd
+import pytest
+from pandas.testing import assert_frame_equal
+
+from conftest import synthetic_rows
+from scraping_suumo import process_real_estate_data, process_real_estate_data_apply
+
+# process_real_estate_data(列ごとの処理)が process_real_estate_data_apply(1行ずつの処理)と同じ結果を返すことを確かめる。
+# 実行方法: cd scraping && python -m pytest -q
+
+
+def assert_matches_apply(frame):
+    expected = process_real_estate_data_apply(frame.copy())
+    actual = process_real_estate_data(frame)
+    assert list(actual.columns) == list(expected.columns)
+    # すべて欠損の列の型は apply(axis=1) が行ごとに推定するため object・str・float64 のどれにもなる。値だけ比べる
+    empty = [column for column in expected.columns if expected[column].isna().all()]
+    assert all(actual[column].isna().all() for column in empty)
+    assert_frame_equal(actual.drop(columns=empty), expected.drop(columns=empty))
+
+
+@pytest.mark.parametrize("rows", [
+    pytest.param(synthetic_rows(2_000, seed=1), id="アクセス数がばらばら"),
+    pytest.param(synthetic_rows(2_000, seed=2, max_access=1), id="アクセス数が1つ"),
+    pytest.param([dict(row, 築年数="新築") for row in synthetic_rows(50, seed=3)], id="すべて新築"),
+    pytest.param(synthetic_rows(1, seed=4), id="1行"),
+    pytest.param([dict(row, アドレス=address) for row, address in
+                  zip(synthetic_rows(6, seed=5), ["千代田区内神田", "東京都", "区役所前東京都", "大阪府大阪市", "", "東京都北区"])],
+                 id="都・区の位置"),
+    pytest.param([dict(row, アクセス="ＪＲ山手線") for row in synthetic_rows(3, seed=8)], id="駅名なし"),
+])
+def test_matches_apply(rows):
+    assert_matches_apply(pd.DataFrame(rows))
+
+
+def test_matches_apply_with_duplicate_index():
+    assert_matches_apply(pd.DataFrame(synthetic_rows(20, seed=6)).set_index(pd.Index([3, 1, 2, 3] * 5)))
+
+
+@pytest.mark.parametrize("seed", range(200))
+def test_matches_apply_small_frames(seed):
+    rng = random.Random(seed)
+    assert_matches_apply(pd.DataFrame(synthetic_rows(rng.randint(1, 6), seed=seed, max_access=rng.randint(1, 4))))
+
+
+def test_missing_station_column_is_object_none():
+    result = process_real_estate_data(pd.DataFrame([dict(row, アクセス="ＪＲ山手線") for row in synthetic_rows(3, seed=8)]))
+    for column in ["アクセス①1駅名", "アクセス①1徒歩(分)"]:
+        assert result[column].dtype == object and result[column].tolist() == [None] * 3
+
+
+def test_malformed_values_become_nan():
+    # 1行ずつの処理では例外になる値
+    rows = synthetic_rows(5, seed=7)
+    rows[0]["築年数"] = None
+    rows[1]["アクセス"] = None
+    rows[2]["階数"] = "階数不明"
+    rows[3]["構造"] = "階建"
+    rows[4]["面積"] = "-"
+    result = process_real_estate_data(pd.DataFrame(rows))
+    assert np.isnan(result.loc[0, "築年数"]) and np.isnan(result.loc[3, "構造"]) and np.isnan(result.loc[4, "面積"])
+    assert np.isnan(result.loc[2, "階数"])
+    assert all(pd.isna(result.loc[1, column]) for column in result.columns if column.startswith("アクセス①"))
+    assert pd.isna(result.loc[1, "アクセス"])